@@ -0,0 +1,134 @@
+"""
+Benchmarks the sampling throughput of the ADS1015 driver.
+
+Every read method of the driver is run against the simulated chip, bus and
+ALERT/RDY pin at each of the given data rates, with SMBus word transactions
+(backend "smbus") and, if smbus2 is installed, with combined I2C
+transactions (backend "i2c"). The results are written as a JSON report,
+e.g.:
+
+    python3 benchmarks/adc.py --output report.json
+"""
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from time import perf_counter_ns
+
+from raspibot.ADC import ADS1015, I2CBackend, SMBusBackend, i2c_msg
+from raspibot.Simulation import (
+    SimulatedADS1015, SimulatedGPIO, SimulatedSMBus, sine)
+from raspibot.Statistics import LatencyHistogram
+
+# the benchmarked operations with the number of samples each one reads
+OPERATIONS = [
+    ('read_channel', 1, lambda adc: adc.read_channel(0)),
+    ('read_channels', 4, lambda adc: adc.read_channels([0, 1, 2, 3])),
+]
+
+BACKENDS = [('smbus', SMBusBackend)]
+if i2c_msg is not None:
+    BACKENDS.append(('i2c', I2CBackend))
+
+
+def measure(adc, bus, operation, samples, iterations):
+    """Time an operation and summarise the latencies."""
+    histogram = LatencyHistogram()
+    bus.transactions = 0
+    start = perf_counter_ns()
+    for _ in range(iterations):
+        before = perf_counter_ns()
+        operation(adc)
+        histogram.record(perf_counter_ns() - before)
+    elapsed = (perf_counter_ns() - start) / 1e9
+
+    return {
+        'iterations': iterations,
+        'samples_per_second': iterations * samples / elapsed,
+        'transactions_per_sample': bus.transactions / (iterations * samples),
+        'latency_us': {
+            'mean': histogram.mean() / 1000,
+            'p50': histogram.percentile(50) / 1000,
+            'p99': histogram.percentile(99) / 1000,
+            'max': histogram.max / 1000,
+        },
+    }
+
+
+def measure_stream(adc, bus, data_rate, iterations):
+    """Time streaming a channel in continuous conversion mode."""
+    bus.transactions = 0
+    start = perf_counter_ns()
+    for _ in adc.stream(0, data_rate, count=iterations):
+        pass
+    elapsed = (perf_counter_ns() - start) / 1e9
+
+    return {
+        'iterations': iterations,
+        'samples_per_second': iterations / elapsed,
+        'transactions_per_sample': bus.transactions / iterations,
+    }
+
+
+def run(arguments, backend_name, backend, data_rate):
+    chip = SimulatedADS1015(
+        {channel: sine(0.5, 10 * (channel + 1), offset=1.0)
+         for channel in range(4)})
+    bus = SimulatedSMBus({0x49: chip})
+    gpio = SimulatedGPIO()
+    gpio.connect(ADS1015.alrt, chip)
+    adc = ADS1015(bus, data_rate=data_rate, backend=backend(bus), gpio=gpio)
+    try:
+        for name, samples, operation in OPERATIONS:
+            result = measure(adc, bus, operation, samples,
+                             arguments.iterations)
+            result.update(backend=backend_name, data_rate=data_rate,
+                          operation=name)
+            yield result
+        result = measure_stream(adc, bus, data_rate, arguments.iterations)
+        result.update(backend=backend_name, data_rate=data_rate,
+                      operation='stream')
+        yield result
+    finally:
+        adc.close()
+        chip.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--iterations', type=int, default=500,
+        help='iterations per operation')
+    parser.add_argument(
+        '--data-rates', type=int, nargs='*', default=[1600, 3300],
+        help='data rates the ADC is configured with')
+    parser.add_argument(
+        '--output', type=argparse.FileType('w'), default=sys.stdout,
+        help='file to write the JSON report to')
+    arguments = parser.parse_args()
+
+    if i2c_msg is None:
+        print('smbus2 is not installed, skipping the i2c backend',
+              file=sys.stderr)
+    results = []
+    for backend_name, backend in BACKENDS:
+        for data_rate in arguments.data_rates:
+            results.extend(run(arguments, backend_name, backend, data_rate))
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'parameters': {
+            'iterations': arguments.iterations,
+        },
+        'results': results,
+    }
+    json.dump(report, arguments.output, indent=2)
+    arguments.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmarks the throughput and latency of the Attiny serial protocol.
+
+Every command is executed repeatedly against the in-process firmware
+emulation (transport "loopback") and, if pyserial is installed, against the
+emulator on a pseudo-terminal at each of the given baud rates (transport
+"pty"). The results are written as a JSON report, e.g.:
+
+    python3 benchmarks/serial_protocol.py --output report.json
+"""
+import argparse
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from time import perf_counter_ns
+
+from raspibot.Emulator import AttinyEmulator, LoopbackSerial
+from raspibot.Serial import AttinyProtocol
+from raspibot.Statistics import LatencyHistogram
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+# the benchmarked operations with the number of commands each one executes
+OPERATIONS = [
+    ('alive', 1, lambda protocol: protocol.alive()),
+    ('echo', 1, lambda protocol: protocol.echo(b'\x42')),
+    ('get_encoders', 1, lambda protocol: protocol.get_encoders()),
+    ('get_left_encoder', 1, lambda protocol: protocol.get_left_encoder()),
+    ('reset_encoders', 1, lambda protocol: protocol.reset_encoders()),
+    ('set_motors', 1, lambda protocol: protocol.set_motors(50, -50)),
+    ('set_left_motor', 1, lambda protocol: protocol.set_left_motor(50)),
+    ('stop_motors', 1, lambda protocol: protocol.stop_motors()),
+    ('set_pi_parameters', 1,
+        lambda protocol: protocol.set_pi_parameters(100, -20, 4)),
+    ('set_buzzer', 1, lambda protocol: protocol.set_buzzer(440, 10, 3)),
+    ('stop_buzzer', 1, lambda protocol: protocol.stop_buzzer()),
+    ('control_tick', 3, lambda protocol: control_tick(protocol, False)),
+    ('control_tick_batched', 3, lambda protocol: control_tick(protocol, True)),
+]
+
+
+def control_tick(protocol, batched):
+    """Run the commands of a typical control loop iteration."""
+    if batched:
+        with protocol.batch() as batch:
+            batch.get_encoders()
+            batch.set_motors(50, -50)
+            batch.set_buzzer(440, 10, 3)
+    else:
+        protocol.get_encoders()
+        protocol.set_motors(50, -50)
+        protocol.set_buzzer(440, 10, 3)
+
+
+def measure(protocol, operation, commands, iterations, warmup):
+    """Time an operation and summarise the latencies."""
+    for _ in range(warmup):
+        operation(protocol)
+
+    histogram = LatencyHistogram()
+    start = perf_counter_ns()
+    for _ in range(iterations):
+        before = perf_counter_ns()
+        operation(protocol)
+        histogram.record(perf_counter_ns() - before)
+    elapsed = (perf_counter_ns() - start) / 1e9
+
+    return {
+        'iterations': iterations,
+        'commands_per_second': iterations * commands / elapsed,
+        'latency_us': {
+            'mean': histogram.mean() / 1000,
+            'p50': histogram.percentile(50) / 1000,
+            'p99': histogram.percentile(99) / 1000,
+            'max': histogram.max / 1000,
+        },
+    }
+
+
+def run_loopback(arguments):
+    protocol = AttinyProtocol(LoopbackSerial())
+    for name, commands, operation in OPERATIONS:
+        result = measure(protocol, operation, commands,
+                         arguments.iterations, arguments.warmup)
+        result.update(transport='loopback', baudrate=None, operation=name)
+        yield result
+
+
+def run_pty(arguments, baudrate):
+    emulator = AttinyEmulator(
+        baudrate=baudrate, processing_latency=arguments.latency / 1e6)
+    with emulator:
+        port = serial.Serial(emulator.port, baudrate, timeout=1.0)
+        try:
+            protocol = AttinyProtocol(port)
+            for name, commands, operation in OPERATIONS:
+                result = measure(protocol, operation, commands,
+                                 arguments.pty_iterations, arguments.warmup)
+                result.update(transport='pty', baudrate=baudrate,
+                              operation=name)
+                yield result
+        finally:
+            port.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--iterations', type=int, default=20000,
+        help='iterations per operation on the loopback transport')
+    parser.add_argument(
+        '--pty-iterations', type=int, default=200,
+        help='iterations per operation on the pty transport')
+    parser.add_argument(
+        '--warmup', type=int, default=10,
+        help='untimed iterations before each measurement')
+    parser.add_argument(
+        '--baudrates', type=int, nargs='*', default=[9600, 115200],
+        help='baud rates simulated on the pty transport')
+    parser.add_argument(
+        '--latency', type=float, default=50.0,
+        help='simulated firmware processing latency in microseconds')
+    parser.add_argument(
+        '--output', type=argparse.FileType('w'), default=sys.stdout,
+        help='file to write the JSON report to')
+    arguments = parser.parse_args()
+
+    results = list(run_loopback(arguments))
+    if serial is None:
+        print('pyserial is not installed, skipping the pty benchmarks',
+              file=sys.stderr)
+    else:
+        for baudrate in arguments.baudrates:
+            results.extend(run_pty(arguments, baudrate))
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'parameters': {
+            'iterations': arguments.iterations,
+            'pty_iterations': arguments.pty_iterations,
+            'warmup': arguments.warmup,
+            'processing_latency_us': arguments.latency,
+        },
+        'results': results,
+    }
+    json.dump(report, arguments.output, indent=2)
+    arguments.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
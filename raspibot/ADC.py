@@ -1,6 +1,21 @@
 """Provides a class for controlling the TI ADS105."""
-from time import sleep
-import RPi.GPIO as GPIO
+import queue
+import struct
+import threading
+from collections import namedtuple
+from contextlib import ExitStack
+from time import monotonic, sleep
+
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):
+    # not running on a Raspberry Pi
+    GPIO = None
+
+try:
+    from smbus2 import i2c_msg
+except ImportError:
+    i2c_msg = None
 
 # ACHTUNG: Das SMBus-Protokoll geht bei der Übertragung von Werten mit
 # mehr als einem Byte Länge (16-bit-Word) davon aus, dass das LSB zuerst
@@ -19,20 +34,140 @@ def _set_bits(config, mask, bits):
     return config
 
 
+_WORD = struct.Struct('>H')
+
+ThresholdEvent = namedtuple('ThresholdEvent', 'timestamp channel active value')
+
+# one lock per bus, shared by the backends of all chips on it
+_bus_locks = {}
+_bus_locks_lock = threading.Lock()
+
+
+def bus_lock(bus):
+    """Get the lock that serialises the transactions on a bus."""
+    with _bus_locks_lock:
+        lock = _bus_locks.get(bus)
+        if lock is None:
+            lock = _bus_locks[bus] = threading.RLock()
+        return lock
+
+
+class SMBusBackend(object):
+    """
+    Accesses the registers of a chip with SMBus word transactions.
+
+    Works with any bus offering `read_word_data` and `write_word_data`, like
+    `smbus.SMBus`. Every register access is a separate kernel round trip.
+    Transactions hold the `bus_lock` of the bus.
+    """
+
+    def __init__(self, bus):
+        """Create a backend for the given bus."""
+        super(SMBusBackend, self).__init__()
+        self.bus = bus
+        self.lock = bus_lock(bus)
+
+    def read_register(self, address, register):
+        """Read a big-endian 16-bit register."""
+        with self.lock:
+            value = self.bus.read_word_data(address, register)
+        return _swap_bytes_16bit(value)
+
+    def write_register(self, address, register, value):
+        """Write a big-endian 16-bit register."""
+        value = _swap_bytes_16bit(value)
+        with self.lock:
+            self.bus.write_word_data(address, register, value)
+
+    def read_and_write_register(self, address, read_register, write_register,
+                                value):
+        """Read one 16-bit register, then write another one."""
+        with self.lock:
+            result = self.read_register(address, read_register)
+            self.write_register(address, write_register, value)
+        return result
+
+
+class I2CBackend(object):
+    """
+    Accesses the registers of a chip with combined I2C transactions.
+
+    Needs a bus offering `i2c_rdwr`, like `smbus2.SMBus`, and the `i2c_msg`
+    class of smbus2. Setting the register pointer and reading the register
+    happen in a single kernel round trip, and `read_and_write_register`
+    reads one register and writes another one in a single round trip as
+    well. The words are transferred big-endian, so no byte swapping is
+    needed. Transactions hold the `bus_lock` of the bus.
+    """
+
+    def __init__(self, bus):
+        """Create a backend for the given bus."""
+        super(I2CBackend, self).__init__()
+        if i2c_msg is None:
+            raise RuntimeError('the I2C backend needs smbus2')
+        self.bus = bus
+        self.lock = bus_lock(bus)
+
+    def read_register(self, address, register):
+        """Read a big-endian 16-bit register."""
+        read = i2c_msg.read(address, 2)
+        with self.lock:
+            self.bus.i2c_rdwr(i2c_msg.write(address, (register,)), read)
+        return _WORD.unpack(bytes(read))[0]
+
+    def write_register(self, address, register, value):
+        """Write a big-endian 16-bit register."""
+        write = i2c_msg.write(address, (register,) + tuple(_WORD.pack(value)))
+        with self.lock:
+            self.bus.i2c_rdwr(write)
+
+    def read_and_write_register(self, address, read_register, write_register,
+                                value):
+        """Read one 16-bit register, then write another one."""
+        read = i2c_msg.read(address, 2)
+        write = i2c_msg.write(
+            address, (write_register,) + tuple(_WORD.pack(value)))
+        with self.lock:
+            self.bus.i2c_rdwr(
+                i2c_msg.write(address, (read_register,)), read, write)
+        return _WORD.unpack(bytes(read))[0]
+
+
+def bus_backend(bus):
+    """
+    Choose the fastest backend supported by a bus.
+
+    Uses combined I2C transactions if the bus supports them and smbus2 is
+    installed, SMBus word transactions otherwise.
+    """
+    if i2c_msg is not None and hasattr(bus, 'i2c_rdwr'):
+        return I2CBackend(bus)
+    return SMBusBackend(bus)
+
+
 class ADS1015:
     """
     Implements the I2C protocol for the TI ADS1015 chip.
 
     Provides methods for configuring and reading A/D conversion values via an
     I2C bus from the Texas Instruments ADS1015 chip.
+
+    Several chips can share a bus, at the addresses 0x48 to 0x4B, each with
+    its ALERT/RDY pin connected to a separate GPIO pin. All methods can be
+    called from several threads; the transactions of all chips on a bus are
+    serialised by the `bus_lock`, and the operations of a chip by its own
+    `lock`. Use an `ADCGroup` to convert on several chips at the same time.
     """
 
+    # the default GPIO pin the ALERT/RDY pin is connected to
     alrt=22
 
     _CHANNELS = [0, 1, 2, 3]
 
     __CONFIG_REGISTER = 0b01
     __CONVERSION_REGISTER = 0b00
+    __LO_THRESH_REGISTER = 0b10
+    __HI_THRESH_REGISTER = 0b11
 
     # bits [15] start the conversion
     __CONFIG_CONVERSION_START = 1 << 15
@@ -46,29 +181,171 @@ class ADS1015:
         0b110 << 12,
         0b111 << 12]
 
-    # bits [11:9] configure the programmable gain amplifier
+    # bits [11:9] configure the programmable gain amplifier, by the full
+    # scale voltage range
     __CONFIG_PGA_BITS = 0b111 << 9
-    __CONFIG_PGA_4_VOLT = 0b001 << 9
+    __CONFIG_PGAS = {
+        6.144: 0b000 << 9,
+        4.096: 0b001 << 9,
+        2.048: 0b010 << 9,
+        1.024: 0b011 << 9,
+        0.512: 0b100 << 9,
+        0.256: 0b101 << 9}
+
+    GAINS = sorted(__CONFIG_PGAS)
 
     __CONFIG_MODE_BITS = 1 << 8
     __CONFIG_MODE_CONTINUOUS = 0 << 8
     __CONFIG_MODE_SINGLE     = 1 << 8
 
-    def __init__(self, bus, bus_address=0x49):
-        """Create a new object for communicating on a given bus and address."""
+    # bits [7:5] configure the data rate, in samples per second
+    __CONFIG_DATA_RATE_BITS = 0b111 << 5
+    __CONFIG_DATA_RATES = {
+        128: 0b000 << 5,
+        250: 0b001 << 5,
+        490: 0b010 << 5,
+        920: 0b011 << 5,
+        1600: 0b100 << 5,
+        2400: 0b101 << 5,
+        3300: 0b110 << 5}
+
+    DATA_RATES = sorted(__CONFIG_DATA_RATES)
+
+    # bit [4] selects a traditional comparator with hysteresis or a window
+    # comparator
+    __CONFIG_COMP_MODE_BITS = 1 << 4
+    __CONFIG_COMP_MODE_TRADITIONAL = 0 << 4
+    __CONFIG_COMP_MODE_WINDOW = 1 << 4
+    # bit [3] configures the polarity of the ALERT/RDY pin
+    __CONFIG_COMP_POL_BITS = 1 << 3
+    __CONFIG_COMP_POL_ACTIVE_HIGH = 1 << 3
+    # bit [2] keeps the ALERT/RDY pin asserted until the conversion register
+    # is read
+    __CONFIG_COMP_LAT_BITS = 1 << 2
+    __CONFIG_COMP_LAT_OFF = 0 << 2
+    __CONFIG_COMP_LAT_ON = 1 << 2
+    # bits [1:0] configure after how many conversions the ALERT/RDY pin is
+    # asserted, 0b11 disables it
+    __CONFIG_COMP_QUE_BITS = 0b11
+    __CONFIG_COMP_QUE_ONE = 0b00
+    __CONFIG_COMP_QUES = {
+        1: 0b00,
+        2: 0b01,
+        4: 0b10}
+
+    # with the MSB of the high threshold set and the MSB of the low
+    # threshold cleared, the ALERT/RDY pin signals finished conversions
+    # (see datasheet, section "Conversion Ready Pin")
+    __CONVERSION_READY_LO_THRESH = 0x0000
+    __CONVERSION_READY_HI_THRESH = 0x8000
+
+    # the internal oscillator, and thus the data rate, may deviate by up to
+    # 10 % (see datasheet, "Electrical Characteristics")
+    __DATA_RATE_TOLERANCE = 0.1
+    # time to power up for a single-shot conversion
+    __WAKEUP_TIME = 25e-6
+
+    # conversion values are signed 12-bit integers
+    __CONVERSION_FULL_SCALE = 2 ** 11
+
+    def __init__(self, bus, bus_address=0x49, gain=4.096, data_rate=1600,
+                 backend=None, gpio=None, alert_pin=None):
+        """
+        Create a new object for communicating on a given bus and address.
+
+        :param gain: the full scale voltage range, one of `GAINS`
+        :param data_rate: the samples per second, one of `DATA_RATES`
+        :param backend: the `SMBusBackend` or `I2CBackend` for accessing the
+        registers, or None to choose one with `bus_backend`
+        :param gpio: the GPIO module the ALERT/RDY pin is connected to, or
+        None for `RPi.GPIO`
+        :param alert_pin: the BCM number of the GPIO pin the ALERT/RDY pin is
+        connected to, or None for `alrt`
+        """
+        if gpio is None:
+            gpio = GPIO
+        if gpio is None:
+            raise RuntimeError('RPi.GPIO is not available')
+        if gain not in self.__CONFIG_PGAS:
+            raise ValueError('unsupported gain: {0}'.format(gain))
+        if data_rate not in self.__CONFIG_DATA_RATES:
+            raise ValueError('unsupported data rate: {0}'.format(data_rate))
+        if alert_pin is not None:
+            self.alrt = alert_pin
         self.__bus = bus
         self.__bus_address = bus_address
+        self.__gpio = gpio
+        self.__lock = threading.RLock()
+        # time at which the running single-shot conversion was started
+        self.__started = None
+        self.__backend = backend if backend is not None else bus_backend(bus)
+        # shadow copy of the configuration register, without the conversion
+        # start bit; None if it has to be read from the chip
+        self.__config = None
+        # whether a stream has put the chip into continuous mode
+        self.__streaming = False
 
         config = self.read_config_register()
 
+        # an idle chip reports the start bit as set, don't start a conversion
+        config=_set_bits(config, self.__CONFIG_CONVERSION_START, 0)
         config=_set_bits(config, self.__CONFIG_MUX_BITS, self.__CONFIG_MUX_ABSOLUTE[0])
-        config=_set_bits(config, self.__CONFIG_PGA_BITS, self.__CONFIG_PGA_4_VOLT)
+        config=_set_bits(config, self.__CONFIG_PGA_BITS, self.__CONFIG_PGAS[gain])
+        config=_set_bits(config, self.__CONFIG_DATA_RATE_BITS, self.__CONFIG_DATA_RATES[data_rate])
         config=_set_bits(config, self.__CONFIG_MODE_BITS, self.__CONFIG_MODE_SINGLE)
-
+        # let the ALERT/RDY pin go high at the end of every conversion
+        config=_set_bits(config, self.__CONFIG_COMP_POL_BITS, self.__CONFIG_COMP_POL_ACTIVE_HIGH)
+        config=_set_bits(config, self.__CONFIG_COMP_QUE_BITS, self.__CONFIG_COMP_QUE_ONE)
+
+        self.__write_register(
+            self.__LO_THRESH_REGISTER, self.__CONVERSION_READY_LO_THRESH)
+        self.__write_register(
+            self.__HI_THRESH_REGISTER, self.__CONVERSION_READY_HI_THRESH)
         self.write_config_register(config)
 
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.alrt, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self.__gpio.setmode(self.__gpio.BCM)
+        self.__gpio.setup(
+            self.alrt, self.__gpio.IN, pull_up_down=self.__gpio.PUD_UP)
+
+        # settings of the comparator while it is enabled, None otherwise
+        self.__comparator = None
+        # threshold events are put here unless a callback is given
+        self.alerts = queue.Queue()
+
+        # set by an interrupt on the rising edge of the ALERT/RDY pin
+        self.__ready = threading.Event()
+        try:
+            self.__gpio.add_event_detect(
+                self.alrt, self.__gpio.RISING, callback=self.__conversion_ready)
+            self.__interrupts = True
+        except RuntimeError:
+            # edge detection is not available, e.g. because another part of
+            # the program already uses it on this pin
+            self.__interrupts = False
+
+    def __conversion_ready(self, channel):
+        self.__ready.set()
+
+    def close(self):
+        """Stop listening for interrupts on the ALERT/RDY pin."""
+        if self.__comparator is not None:
+            self.disable_comparator()
+        if self.__interrupts:
+            self.__gpio.remove_event_detect(self.alrt)
+            self.__interrupts = False
+
+    def interrupts_enabled(self):
+        """Return whether finished conversions are signalled by interrupts."""
+        return self.__interrupts
+
+    def lock(self):
+        """
+        Get the lock held during every operation on the chip.
+
+        Hold it to run several operations without other threads interfering,
+        e.g. to start a conversion and collect its result.
+        """
+        return self.__lock
 
     def bus(self):
         """Get the bus that is currently used for communication."""
@@ -78,11 +355,26 @@ class ADS1015:
         """Get the bus address of the chip used for communication."""
         return self.__bus_address
 
+    def backend(self):
+        """Get the backend used for accessing the registers."""
+        return self.__backend
+
+    def __read_register(self, register):
+        return self.__backend.read_register(self.__bus_address, register)
+
+    def __write_register(self, register, value):
+        self.__backend.write_register(self.__bus_address, register, value)
+
     def read_config_register(self):
-        """Retrieve the two-byte configuration register from the ADC."""
-        config = self.__bus.read_word_data(
-            self.__bus_address, self.__CONFIG_REGISTER)
-        return _swap_bytes_16bit(config)
+        """
+        Retrieve the two-byte configuration register from the ADC.
+
+        This always reads the register over the bus and refreshes the shadow
+        copy kept by the driver.
+        """
+        config = self.__read_register(self.__CONFIG_REGISTER)
+        self.__config = _set_bits(config, self.__CONFIG_CONVERSION_START, 0)
+        return config
 
     def write_config_register(self, configuration):
         """
@@ -90,16 +382,113 @@ class ADS1015:
 
         :type configuration: 16-bit word
         """
-        self.__bus.write_word_data(
-            self.__bus_address,
-            self.__CONFIG_REGISTER,
-            _swap_bytes_16bit(configuration))
+        self.__write_register(self.__CONFIG_REGISTER, configuration)
+        self.__config = _set_bits(
+            configuration, self.__CONFIG_CONVERSION_START, 0)
+
+    def config_register(self):
+        """
+        Get the configuration register from the driver's shadow copy.
+
+        The configuration is only read over the bus if the shadow copy has
+        been invalidated. The conversion start bit is always cleared.
+        """
+        if self.__config is None:
+            self.read_config_register()
+        return self.__config
+
+    def invalidate_config(self):
+        """
+        Discard the shadow copy of the configuration register.
+
+        Call this if the configuration may have been changed behind the
+        driver's back, e.g. by another program or a reset of the chip. The
+        next access reads it from the chip again.
+        """
+        self.__config = None
+
+    def data_rate(self):
+        """Get the configured data rate in samples per second."""
+        bits = self.config_register() & self.__CONFIG_DATA_RATE_BITS
+        for data_rate, data_rate_bits in self.__CONFIG_DATA_RATES.items():
+            if bits == data_rate_bits:
+                return data_rate
+        # 0b111 is another encoding of the highest data rate
+        return self.DATA_RATES[-1]
+
+    def set_data_rate(self, data_rate):
+        """
+        Configure the data rate used for all following conversions.
+
+        Higher data rates shorten the conversion time at the cost of more
+        noise.
+
+        :param data_rate: the samples per second, one of `DATA_RATES`
+        """
+        if data_rate not in self.__CONFIG_DATA_RATES:
+            raise ValueError('unsupported data rate: {0}'.format(data_rate))
+        with self.__lock:
+            config = self.config_register()
+            config=_set_bits(config,
+                      self.__CONFIG_DATA_RATE_BITS,
+                      self.__CONFIG_DATA_RATES[data_rate])
+            self.write_config_register(config)
+
+    def gain(self):
+        """Get the configured full scale voltage range in volts."""
+        bits = self.config_register() & self.__CONFIG_PGA_BITS
+        for gain, gain_bits in self.__CONFIG_PGAS.items():
+            if bits == gain_bits:
+                return gain
+        # 0b110 and 0b111 are other encodings of the smallest range
+        return self.GAINS[0]
+
+    def set_gain(self, gain):
+        """
+        Configure the programmable gain amplifier for all following
+        conversions.
+
+        Smaller ranges resolve smaller voltage differences, but inputs above
+        the range are clipped to the largest value.
+
+        :param gain: the full scale voltage range, one of `GAINS`
+        """
+        if gain not in self.__CONFIG_PGAS:
+            raise ValueError('unsupported gain: {0}'.format(gain))
+        with self.__lock:
+            config = self.config_register()
+            config=_set_bits(config, self.__CONFIG_PGA_BITS, self.__CONFIG_PGAS[gain])
+            self.write_config_register(config)
+
+    def to_voltage(self, value):
+        """
+        Convert a conversion value to volts, using the configured gain.
+
+        :param value: a value as returned by `read_channel`
+        """
+        # the 12-bit two's complement is returned without its sign
+        if value >= self.__CONVERSION_FULL_SCALE:
+            value -= 2 * self.__CONVERSION_FULL_SCALE
+        return value * self.gain() / self.__CONVERSION_FULL_SCALE
+
+    def conversion_time(self, data_rate=None):
+        """
+        Get the longest time a single-shot conversion can take, in seconds.
+
+        Accounts for the tolerance of the internal oscillator and the time
+        the chip needs to power up.
+
+        :param data_rate: the samples per second, or None for the configured
+        data rate
+        """
+        if data_rate is None:
+            data_rate = self.data_rate()
+        return (1 + self.__DATA_RATE_TOLERANCE) / data_rate \
+            + self.__WAKEUP_TIME
 
     def read_conversion_value(self):
         """Read the contents of the conversion register on the ADC."""
-        sensor_value = self.__bus.read_word_data(
-            self.__bus_address, self.__CONVERSION_REGISTER)
-        sensor_value = _swap_bytes_16bit(sensor_value)
+        sensor_value = self.__read_register(self.__CONVERSION_REGISTER)
         # die niederwertigsten 4 Bit sind immer auf 0 gesetzt, daher können
         # diese ignoriert werden (siehe Datenblatt, Registerbeschreibung
         # Tabelle 8 auf Seite 15)
@@ -115,14 +504,72 @@ class ADS1015:
         if channel not in self._CHANNELS:
             return
         else:
-            config = self.read_config_register()
+            with self.__lock:
+                config = self.config_register()
 
-            config=_set_bits(config,
+                config=_set_bits(config,
+                          self.__CONFIG_MUX_BITS,
+                          self.__CONFIG_MUX_ABSOLUTE[channel])
+                config=_set_bits(config, self.__CONFIG_CONVERSION_START, self.__CONFIG_CONVERSION_START)
+
+                self.__check_single_shot()
+                self.__ready.clear()
+                self.write_config_register(config)
+                self.__started = monotonic()
+
+    def start_conversion(self, channel):
+        """
+        Start a single-shot conversion of the given channel, without waiting.
+
+        Collect the result with `finish_conversion`, while holding the
+        `lock` in between if other threads use the chip as well.
+
+        :param channel: the index of the channel to be read - can be one of
+        [0, 1, 2, 3]
+        """
+        self.set_mux_absolute(channel)
+
+    def finish_conversion(self):
+        """
+        Wait for the running conversion and read its result.
+
+        :returns the converted channel value as an integer
+        """
+        with self.__lock:
+            # lässt dem ADC Zeit, eine neue Messung mit der neuen
+            # Konfiguration stattfinden zu lassen
+            self.wait_for_conversion()
+            return self.read_conversion_value()
+
+    def read_and_start_conversion(self, channel):
+        """
+        Wait for the running conversion, read its result and start the next.
+
+        Reading the result and starting the conversion of the next channel
+        happen in the same transaction, which takes a single kernel round
+        trip with the `I2CBackend`.
+
+        :param channel: the index of the channel to be converted next - can
+        be one of [0, 1, 2, 3]
+        :returns the converted value of the previous channel as an integer
+        """
+        if channel not in self._CHANNELS:
+            return
+        with self.__lock:
+            self.__check_single_shot()
+            self.wait_for_conversion()
+            self.__ready.clear()
+            config=_set_bits(self.config_register(),
                       self.__CONFIG_MUX_BITS,
                       self.__CONFIG_MUX_ABSOLUTE[channel])
-            config=_set_bits(config, self.__CONFIG_CONVERSION_START, self.__CONFIG_CONVERSION_START)
-
-            self.write_config_register(config)
+            value = self.__backend.read_and_write_register(
+                self.__bus_address,
+                self.__CONVERSION_REGISTER,
+                self.__CONFIG_REGISTER,
+                config | self.__CONFIG_CONVERSION_START)
+            self.__config = config
+            self.__started = monotonic()
+            return value >> 4
 
     def read_channel(self, channel):
         """
@@ -136,9 +583,347 @@ class ADS1015:
         if channel not in self._CHANNELS:
             return
         else:
-            self.set_mux_absolute(channel)
-            # lässt dem ADC Zeit, eine neue Messung mit der neuen
-            # Konfiguration stattfinden zu lassen
-            while not GPIO.input(self.alrt):
-                a=1
-            return self.read_conversion_value()
+            with self.__lock:
+                self.start_conversion(channel)
+                return self.finish_conversion()
+
+    def read_voltage(self, channel):
+        """
+        Read the voltage on the given ADC channel, in volts.
+
+        :param channel: the index of the channel to be read - can be one of
+        [0, 1, 2, 3]
+        """
+        value = self.read_channel(channel)
+        if value is None:
+            return
+        return self.to_voltage(value)
+
+    def read_channels(self, channels):
+        """
+        Read one value from each of the given ADC channels, in order.
+
+        Each conversion result is read and the conversion of the next channel
+        is started in the same transaction (see `read_and_start_conversion`).
+
+        :param channels: the indices of the channels to be read
+        :returns the converted channel values as a list of integers
+        """
+        if not channels:
+            return []
+        if any(channel not in self._CHANNELS for channel in channels):
+            return
+
+        with self.__lock:
+            self.start_conversion(channels[0])
+            values = [self.read_and_start_conversion(channel)
+                      for channel in channels[1:]]
+            values.append(self.finish_conversion())
+            return values
+
+    def wait_for_conversion(self):
+        """
+        Block until the conversion that was started last has finished.
+
+        Waits for the interrupt of the ALERT/RDY pin, for at most twice the
+        expected conversion time after the start. Without interrupts, sleeps
+        until the expected conversion time has passed instead.
+        """
+        started = self.__started
+        if started is None:
+            return
+        if self.__interrupts:
+            # after a missed interrupt, the conversion is done by now anyway
+            timeout = started + 2 * self.conversion_time() - monotonic()
+            if timeout > 0:
+                self.__ready.wait(timeout)
+        else:
+            remaining = started + self.conversion_time() - monotonic()
+            if remaining > 0:
+                sleep(remaining)
+        self.__started = None
+
+    def stream(self, channel, data_rate=None, count=None):
+        """
+        Read a channel continuously at the given data rate.
+
+        Puts the ADC into continuous conversion mode, so that it converts the
+        channel on its own and every sample only needs a single read of the
+        conversion register. Yields `(timestamp, value)` tuples, where
+        `timestamp` is the `time.monotonic()` time of the read, until `count`
+        samples have been read or forever if `count` is None. Single-shot mode
+        is restored when the generator is closed or exhausted; until then,
+        single-shot reads and `enable_comparator` raise a `RuntimeError`.
+
+        :param channel: the index of the channel to be read - can be one of
+        [0, 1, 2, 3]
+        :param data_rate: the samples per second, one of `DATA_RATES`, or
+        None for the configured data rate
+        """
+        if channel not in self._CHANNELS:
+            return
+        if data_rate is None:
+            data_rate = self.data_rate()
+        if data_rate not in self.__CONFIG_DATA_RATES:
+            raise ValueError('unsupported data rate: {0}'.format(data_rate))
+        with self.__lock:
+            self.__check_single_shot()
+            config = self.config_register()
+            single_shot = config
+
+            config=_set_bits(config,
+                      self.__CONFIG_MUX_BITS,
+                      self.__CONFIG_MUX_ABSOLUTE[channel])
+            config=_set_bits(config,
+                      self.__CONFIG_DATA_RATE_BITS,
+                      self.__CONFIG_DATA_RATES[data_rate])
+            config=_set_bits(config, self.__CONFIG_MODE_BITS, self.__CONFIG_MODE_CONTINUOUS)
+            self.write_config_register(config)
+            self.__streaming = True
+
+        period = 1.0 / data_rate
+        self.__ready.clear()
+        try:
+            # the first conversion is ready one period after the start
+            deadline = monotonic() + period
+            read = 0
+            while count is None or read < count:
+                if self.__interrupts:
+                    # the ALERT/RDY pin pulses after every conversion
+                    self.__ready.wait(
+                        (1 + self.__DATA_RATE_TOLERANCE) * 2 * period)
+                    self.__ready.clear()
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining > 0:
+                        sleep(remaining)
+                    else:
+                        # fell behind, don't try to catch up with a burst of
+                        # reads of the same conversion
+                        deadline -= remaining
+                    deadline += period
+                yield monotonic(), self.read_conversion_value()
+                read += 1
+        finally:
+            single_shot=_set_bits(single_shot,
+                          self.__CONFIG_MODE_BITS,
+                          self.__CONFIG_MODE_SINGLE)
+            with self.__lock:
+                self.write_config_register(single_shot)
+                self.__streaming = False
+
+    def enable_comparator(self, channel, low, high, window=False,
+                          latching=False, queue=1, data_rate=None,
+                          callback=None):
+        """
+        Monitor a channel in hardware and report threshold crossings.
+
+        The ADC converts the channel continuously and asserts its ALERT/RDY
+        pin when a value crosses the thresholds, without any bus traffic.
+        Every edge of the pin is reported as a `ThresholdEvent`, to
+        `callback` if given and to the `alerts` queue otherwise. `active` is
+        True when the pin has been asserted and False when it has been
+        released again.
+
+        As a traditional comparator, the pin is asserted when the value
+        rises above `high` and released when it falls below `low`. As a
+        window comparator, the pin is asserted while the value is outside of
+        `low` to `high`.
+
+        If `latching` is set, the pin stays asserted until `clear_alert` is
+        called, and the events of assertions carry no value. Otherwise, the
+        value that caused the edge is read from the ADC.
+
+        Other channels cannot be read while the comparator is enabled.
+
+        :param channel: the index of the channel to be monitored - can be one
+        of [0, 1, 2, 3]
+        :param low: the low threshold, as a conversion value
+        :param high: the high threshold, as a conversion value
+        :param queue: the number of successive conversions that must cross a
+        threshold before the pin is asserted - can be one of [1, 2, 4]
+        :param data_rate: the samples per second, one of `DATA_RATES`, or
+        None for the configured data rate
+        :param callback: a function taking a `ThresholdEvent`, called on the
+        GPIO interrupt thread
+        """
+        if channel not in self._CHANNELS:
+            raise ValueError('invalid channel: {0}'.format(channel))
+        for threshold in (low, high):
+            if not -self.__CONVERSION_FULL_SCALE <= threshold \
+                    < self.__CONVERSION_FULL_SCALE:
+                raise ValueError('invalid threshold: {0}'.format(threshold))
+        if low > high:
+            raise ValueError('the low threshold must not exceed the high one')
+        if queue not in self.__CONFIG_COMP_QUES:
+            raise ValueError('unsupported queue length: {0}'.format(queue))
+        if data_rate is None:
+            data_rate = self.data_rate()
+        if data_rate not in self.__CONFIG_DATA_RATES:
+            raise ValueError('unsupported data rate: {0}'.format(data_rate))
+        if not self.__interrupts:
+            raise RuntimeError(
+                'edge detection is not available on the ALERT/RDY pin')
+        with self.__lock:
+            if self.__streaming:
+                raise RuntimeError('the chip is streaming')
+            if self.__comparator is not None:
+                self.disable_comparator()
+
+            config = self.config_register()
+            self.__comparator = {
+                'channel': channel,
+                'latching': latching,
+                'callback': callback,
+                'config': config,
+            }
+
+            self.__write_register(self.__LO_THRESH_REGISTER, (low << 4) & 0xFFFF)
+            self.__write_register(self.__HI_THRESH_REGISTER, (high << 4) & 0xFFFF)
+
+            config=_set_bits(config,
+                      self.__CONFIG_MUX_BITS,
+                      self.__CONFIG_MUX_ABSOLUTE[channel])
+            config=_set_bits(config,
+                      self.__CONFIG_DATA_RATE_BITS,
+                      self.__CONFIG_DATA_RATES[data_rate])
+            config=_set_bits(config, self.__CONFIG_MODE_BITS, self.__CONFIG_MODE_CONTINUOUS)
+            config=_set_bits(config,
+                      self.__CONFIG_COMP_MODE_BITS,
+                      self.__CONFIG_COMP_MODE_WINDOW if window
+                      else self.__CONFIG_COMP_MODE_TRADITIONAL)
+            config=_set_bits(config,
+                      self.__CONFIG_COMP_LAT_BITS,
+                      self.__CONFIG_COMP_LAT_ON if latching
+                      else self.__CONFIG_COMP_LAT_OFF)
+            config=_set_bits(config,
+                      self.__CONFIG_COMP_QUE_BITS,
+                      self.__CONFIG_COMP_QUES[queue])
+
+            # both edges are of interest now, not only the end of conversions
+            self.__gpio.remove_event_detect(self.alrt)
+            self.__gpio.add_event_detect(
+                self.alrt, self.__gpio.BOTH, callback=self.__threshold_crossed)
+            self.write_config_register(config)
+
+    def disable_comparator(self):
+        """Stop monitoring and restore single-shot conversions."""
+        with self.__lock:
+            comparator = self.__comparator
+            if comparator is None:
+                return
+            self.write_config_register(comparator['config'])
+            self.__write_register(
+                self.__LO_THRESH_REGISTER, self.__CONVERSION_READY_LO_THRESH)
+            self.__write_register(
+                self.__HI_THRESH_REGISTER, self.__CONVERSION_READY_HI_THRESH)
+            self.__gpio.remove_event_detect(self.alrt)
+            self.__gpio.add_event_detect(
+                self.alrt, self.__gpio.RISING, callback=self.__conversion_ready)
+            self.__comparator = None
+
+    def comparator_enabled(self):
+        """Return whether the comparator monitors a channel."""
+        return self.__comparator is not None
+
+    def clear_alert(self):
+        """
+        Release a latched ALERT/RDY pin.
+
+        :returns the current conversion value of the monitored channel
+        """
+        return self.read_conversion_value()
+
+    def __check_single_shot(self):
+        if self.__comparator is not None:
+            raise RuntimeError('the comparator is enabled')
+        if self.__streaming:
+            raise RuntimeError('the chip is streaming')
+
+    def __threshold_crossed(self, pin):
+        comparator = self.__comparator
+        if comparator is None:
+            return
+        timestamp = monotonic()
+        active = bool(self.__gpio.input(self.alrt))
+        if active and comparator['latching']:
+            # reading the conversion register would release the latch
+            value = None
+        else:
+            value = self.read_conversion_value()
+        event = ThresholdEvent(timestamp, comparator['channel'], active, value)
+        if comparator['callback'] is not None:
+            comparator['callback'](event)
+        else:
+            self.alerts.put(event)
+
+
+class ADCGroup(object):
+    """
+    Reads the same channels from several ADS1015 chips at once.
+
+    The chips convert in parallel: a conversion is started on every chip
+    before the first result is collected, and collecting a result starts the
+    chip's next conversion in the same transaction. Reading a channel from n
+    chips thus takes about as long as reading it from one, instead of n times
+    as long.
+    """
+
+    def __init__(self, adcs):
+        """
+        Create a group of chips.
+
+        :param adcs: the `ADS1015` objects, each at a different bus address
+        or on a different bus
+        """
+        super(ADCGroup, self).__init__()
+        self.adcs = list(adcs)
+        chips = set((id(adc.bus()), adc.bus_address()) for adc in self.adcs)
+        if len(chips) != len(self.adcs):
+            raise ValueError('every chip can only be part of a group once')
+        # the chips' locks are always taken in the same order, so groups
+        # sharing chips cannot deadlock
+        self._locks = [adc.lock() for adc in sorted(
+            self.adcs, key=lambda adc: (id(adc.bus()), adc.bus_address()))]
+
+    def __len__(self):
+        return len(self.adcs)
+
+    def read_channel(self, channel):
+        """
+        Read one value of the given channel from every chip.
+
+        :param channel: the index of the channel to be read - can be one of
+        [0, 1, 2, 3]
+        :returns the converted values as a list, in the order of the chips
+        """
+        values = self.read_channels([channel])
+        if values is None:
+            return
+        return [chip_values[0] for chip_values in values]
+
+    def read_channels(self, channels):
+        """
+        Read one value from each of the given channels of every chip.
+
+        :param channels: the indices of the channels to be read
+        :returns a list with the list of converted channel values of each
+        chip, in the order of the chips
+        """
+        if any(channel not in ADS1015._CHANNELS for channel in channels):
+            return
+        values = [[] for _ in self.adcs]
+        if not channels:
+            return values
+
+        with ExitStack() as stack:
+            for lock in self._locks:
+                stack.enter_context(lock)
+            for adc in self.adcs:
+                adc.start_conversion(channels[0])
+            for channel in channels[1:]:
+                for adc, chip_values in zip(self.adcs, values):
+                    chip_values.append(adc.read_and_start_conversion(channel))
+            for adc, chip_values in zip(self.adcs, values):
+                chip_values.append(adc.finish_conversion())
+        return values
@@ -0,0 +1,153 @@
+"""Shares one serial protocol between several threads."""
+
+import itertools
+import math
+import queue
+import threading
+from concurrent.futures import Future
+from functools import partial
+
+# Priorities of the protocol commands, lower values are served first
+PRIORITY_STOP = 0
+PRIORITY_MOTORS = 1
+PRIORITY_NORMAL = 2
+PRIORITY_LOW = 3
+
+PRIORITIES = {
+    'stop_motors': PRIORITY_STOP,
+
+    'set_motors': PRIORITY_MOTORS,
+    'set_left_motor': PRIORITY_MOTORS,
+    'set_right_motor': PRIORITY_MOTORS,
+
+    'get_encoders': PRIORITY_NORMAL,
+    'get_left_encoder': PRIORITY_NORMAL,
+    'get_right_encoder': PRIORITY_NORMAL,
+    'reset_encoders': PRIORITY_NORMAL,
+    'reset_left_encoder': PRIORITY_NORMAL,
+    'reset_right_encoder': PRIORITY_NORMAL,
+    'set_pi_parameters': PRIORITY_NORMAL,
+    'echo': PRIORITY_NORMAL,
+    'resynchronize': PRIORITY_NORMAL,
+
+    'alive': PRIORITY_LOW,
+    'set_buzzer': PRIORITY_LOW,
+    'stop_buzzer': PRIORITY_LOW,
+}
+
+# sorts after every command, so stopping finishes all queued work first
+_PRIORITY_SHUTDOWN = math.inf
+
+
+class SerialArbiter(object):
+    """
+    Owns an `AttinyProtocol` and executes commands from many threads.
+
+    Commands are put into a priority queue and executed one after the other
+    on a dedicated thread, so the write and read of a transaction can never be
+    interleaved with another one. Commands with a lower priority value
+    overtake queued commands with a higher one, e.g. `stop_motors` and
+    `set_motors` are served before queued `set_buzzer` or `alive` requests.
+    Commands of the same priority are served in order.
+
+    A transaction that is already on the wire is never interrupted, so the
+    worst-case latency of a `stop_motors` command is the duration of one
+    transaction plus those of other `stop_motors` commands queued before it.
+
+    Every command in `PRIORITIES` is available as a blocking method, e.g.
+    ``arbiter.set_motors(10, 10)``. `submit` queues a command without
+    waiting for it.
+    """
+
+    def __init__(self, protocol):
+        """Create an arbiter for a protocol and start its worker thread."""
+        super(SerialArbiter, self).__init__()
+        self._protocol = protocol
+        self._queue = queue.PriorityQueue()
+        # breaks ties between equal priorities in submission order
+        self._sequence = itertools.count()
+        self._thread = threading.Thread(
+            target=self._run, name='SerialArbiter', daemon=True)
+        # makes stopping and queueing atomic, so nothing is queued after the
+        # shutdown marker
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.stop()
+        return False
+
+    def __getattr__(self, name):
+        if name in PRIORITIES:
+            return partial(self.call, name)
+        raise AttributeError(name)
+
+    def submit(self, command, *arguments, priority=None):
+        """
+        Queue a command and return a `concurrent.futures.Future` for it.
+
+        `command` is the name of a command in `PRIORITIES`. Unless a
+        priority is given, the one from `PRIORITIES` is used. A given
+        priority must be a finite number not lower than `PRIORITY_STOP`.
+        """
+        if command not in PRIORITIES:
+            raise ValueError('unknown command: {0}'.format(command))
+        if priority is None:
+            priority = PRIORITIES[command]
+        elif not PRIORITY_STOP <= priority < _PRIORITY_SHUTDOWN:
+            raise ValueError('invalid priority: {0}'.format(priority))
+        future = Future()
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError('arbiter has been stopped')
+            self._queue.put(
+                (priority, next(self._sequence), command, arguments, future))
+        return future
+
+    def call(self, command, *arguments, priority=None, timeout=None):
+        """Execute a command and wait for its result."""
+        return self.submit(
+            command, *arguments, priority=priority).result(timeout)
+
+    def stop(self):
+        """
+        Finish all queued commands and stop the worker thread.
+
+        Commands cannot be submitted any more afterwards. Should a command
+        still be queued when the worker thread exits, its future is
+        cancelled, so no caller waits forever.
+        """
+        with self._lock:
+            if not self._stopped:
+                self._stopped = True
+                self._queue.put(
+                    (_PRIORITY_SHUTDOWN, next(self._sequence), None, (), None))
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            _, _, command, arguments, future = self._queue.get()
+            if command is None:
+                self._cancel_queued()
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = getattr(self._protocol, command)(*arguments)
+            except Exception as exception:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def _cancel_queued(self):
+        while True:
+            try:
+                future = self._queue.get_nowait()[4]
+            except queue.Empty:
+                return
+            future.cancel()
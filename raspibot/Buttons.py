@@ -1,4 +1,8 @@
-import RPi.GPIO as GPIO
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):
+    # not running on a Raspberry Pi
+    GPIO = None
 from time import sleep
 
 class Button(object):
@@ -0,0 +1,290 @@
+"""Emulates RaspiBot's Attiny firmware, in-process or on a pseudo-terminal."""
+
+import os
+import select
+import threading
+import tty
+from collections import namedtuple
+from time import monotonic, sleep
+
+from . import Serial
+from .Serial import ACK, NAK, COMMANDS
+
+BuzzerState = namedtuple('BuzzerState', 'frequency duration volume started')
+PIParameters = namedtuple('PIParameters', 'p i encoder_scale')
+
+# bits per byte on the wire with one start and one stop bit
+_BITS_PER_BYTE = 10
+
+
+def _wrap_int16(value):
+    return (value + 2 ** 15) % 2 ** 16 - 2 ** 15
+
+
+class AttinyFirmware(object):
+    """
+    Simulates the behaviour of the firmware, independent of any transport.
+
+    `handle` takes one complete request message and returns the response
+    bytes. The encoder counters advance continuously according to the motor
+    speeds: at speed `s`, a wheel advances `s * ticks_per_second` ticks per
+    second. Unknown opcodes are answered with a NAK.
+    """
+
+    def __init__(self, ticks_per_second=10.0, clock=monotonic):
+        """
+        Create a firmware in its power-on state.
+
+        :param ticks_per_second: the encoder ticks per second and unit of
+        motor speed
+        :param clock: the time source in seconds
+        """
+        super(AttinyFirmware, self).__init__()
+        self.ticks_per_second = ticks_per_second
+        self._clock = clock
+        self._updated = clock()
+        self._positions = [0.0, 0.0]
+        self.speeds = [0, 0]
+        self.pi_parameters = None
+        self.buzzer = None
+        self.requests = 0
+
+        self._handlers = {
+            Serial.ALIVE[0]: self._alive,
+            Serial.ENCODERS_RIGHT[0]: self._encoders_right,
+            Serial.ENCODERS_LEFT[0]: self._encoders_left,
+            Serial.ENCODERS_BOTH[0]: self._encoders_both,
+            Serial.ENCODERS_RESET_RIGHT[0]: self._reset_right,
+            Serial.ENCODERS_RESET_LEFT[0]: self._reset_left,
+            Serial.ENCODERS_RESET_BOTH[0]: self._reset_both,
+            Serial.ECHO[0]: self._echo,
+            Serial.STOP_MOTORS[0]: self._stop_motors,
+            Serial.SET_LEFT_MOTOR[0]: self._set_left_motor,
+            Serial.SET_RIGHT_MOTOR[0]: self._set_right_motor,
+            Serial.SET_BOTH_MOTORS[0]: self._set_both_motors,
+            Serial.SET_PI_PARAMETERS[0]: self._set_pi_parameters,
+            Serial.SET_BUZZER[0]: self._set_buzzer,
+            Serial.STOP_BUZZER[0]: self._stop_buzzer,
+        }
+
+    @staticmethod
+    def message_length(opcode):
+        """Get the length of the request message starting with an opcode."""
+        command = COMMANDS.get(opcode)
+        if command is None:
+            return 1
+        return 1 + command.request.size
+
+    def _advance(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        for wheel in (0, 1):
+            self._positions[wheel] += \
+                self.speeds[wheel] * self.ticks_per_second * elapsed
+
+    def encoders(self):
+        """Get the current encoder counters as signed 16-bit values."""
+        self._advance()
+        return tuple(_wrap_int16(int(position))
+                     for position in self._positions)
+
+    def buzzer_active(self):
+        """Return whether the buzzer is currently playing a tone."""
+        if self.buzzer is None:
+            return False
+        elapsed = self._clock() - self.buzzer.started
+        return elapsed * 1000 < self.buzzer.duration
+
+    def handle(self, message):
+        """Process a complete request message and return the response."""
+        self.requests += 1
+        handler = self._handlers.get(message[0])
+        if handler is None:
+            return NAK
+        command = COMMANDS[message[0]]
+        return handler(*command.request.unpack_from(message, 1))
+
+    def _alive(self):
+        return ACK
+
+    def _encoders_right(self):
+        return self.encoders()[1].to_bytes(2, 'big', signed=True)
+
+    def _encoders_left(self):
+        return self.encoders()[0].to_bytes(2, 'big', signed=True)
+
+    def _encoders_both(self):
+        left, right = self.encoders()
+        return left.to_bytes(2, 'big', signed=True) \
+            + right.to_bytes(2, 'big', signed=True)
+
+    def _reset(self, wheels):
+        self._advance()
+        for wheel in wheels:
+            self._positions[wheel] = 0.0
+        return ACK
+
+    def _reset_right(self):
+        return self._reset((1,))
+
+    def _reset_left(self):
+        return self._reset((0,))
+
+    def _reset_both(self):
+        return self._reset((0, 1))
+
+    def _echo(self, byte):
+        return bytes((byte,))
+
+    def _set_speeds(self, left, right):
+        self._advance()
+        self.speeds = [left, right]
+        return ACK
+
+    def _stop_motors(self):
+        return self._set_speeds(0, 0)
+
+    def _set_left_motor(self, speed):
+        return self._set_speeds(speed, self.speeds[1])
+
+    def _set_right_motor(self, speed):
+        return self._set_speeds(self.speeds[0], speed)
+
+    def _set_both_motors(self, left, right):
+        return self._set_speeds(left, right)
+
+    def _set_pi_parameters(self, p, i, encoder_scale):
+        self.pi_parameters = PIParameters(p, i, encoder_scale)
+        return ACK
+
+    def _set_buzzer(self, frequency, duration, volume):
+        self.buzzer = BuzzerState(frequency, duration, volume, self._clock())
+        return ACK
+
+    def _stop_buzzer(self):
+        self.buzzer = None
+        return ACK
+
+
+class LoopbackSerial(object):
+    """
+    Connects a protocol directly to an `AttinyFirmware`, in-process.
+
+    Offers the `write` and `read` methods of a serial interface without any
+    transmission delay. A read returns fewer bytes than requested if the
+    firmware has not sent them, like a serial interface after a timeout.
+    """
+
+    def __init__(self, firmware=None):
+        """Create a loopback to a firmware, or to a new one if None."""
+        super(LoopbackSerial, self).__init__()
+        self.firmware = firmware if firmware is not None else AttinyFirmware()
+        self._input = bytearray()
+        self._pending = bytearray()
+
+    def write(self, data):
+        self._pending += data
+        while self._pending:
+            length = self.firmware.message_length(self._pending[0])
+            if len(self._pending) < length:
+                break
+            message = bytes(self._pending[:length])
+            del self._pending[:length]
+            self._input += self.firmware.handle(message)
+        return len(data)
+
+    def read(self, count):
+        response = bytes(self._input[:count])
+        del self._input[:count]
+        return response
+
+    def reset_input_buffer(self):
+        self._input.clear()
+
+
+class AttinyEmulator(object):
+    """
+    Serves an `AttinyFirmware` on a pseudo-terminal.
+
+    Open `port` like the real serial device, e.g. with
+    ``serial.Serial(emulator.port)``. Every request is answered after the
+    time it takes to transmit the request and the response at `baudrate`
+    (with 10 bits per byte) plus `processing_latency` seconds. A baud rate
+    of None disables the transmission delay.
+    """
+
+    def __init__(self, firmware=None, baudrate=9600, processing_latency=0.0):
+        """Create an emulator; call `start` to begin serving requests."""
+        super(AttinyEmulator, self).__init__()
+        self.firmware = firmware if firmware is not None else AttinyFirmware()
+        self.baudrate = baudrate
+        self.processing_latency = processing_latency
+        self._controller = None
+        self._device = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self.port = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.stop()
+        return False
+
+    def transmission_time(self, byte_count):
+        """Get the time it takes to transmit the given number of bytes."""
+        if self.baudrate is None:
+            return 0.0
+        return byte_count * _BITS_PER_BYTE / self.baudrate
+
+    def start(self):
+        """Open the pseudo-terminal and start serving requests."""
+        if self._thread is not None:
+            return
+        self._controller, self._device = os.openpty()
+        tty.setraw(self._controller)
+        tty.setraw(self._device)
+        self.port = os.ttyname(self._device)
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='AttinyEmulator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving requests and close the pseudo-terminal."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        os.close(self._controller)
+        os.close(self._device)
+        self._controller = self._device = None
+
+    def _run(self):
+        pending = b''
+        while not self._stopping.is_set():
+            readable, _, _ = select.select([self._controller], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                pending += os.read(self._controller, 256)
+            except OSError:
+                return
+
+            while pending:
+                length = self.firmware.message_length(pending[0])
+                if len(pending) < length:
+                    break
+                message, pending = pending[:length], pending[length:]
+                response = self.firmware.handle(message)
+
+                delay = self.transmission_time(len(message)) \
+                    + self.processing_latency \
+                    + self.transmission_time(len(response))
+                if delay > 0:
+                    sleep(delay)
+                os.write(self._controller, response)
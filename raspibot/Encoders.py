@@ -0,0 +1,80 @@
+"""Provides background sampling of the RaspiBot's wheel encoders."""
+
+from collections import namedtuple
+from time import monotonic_ns
+
+from .RingBuffer import RingBuffer
+from .Sampler import PeriodicSampler
+from .Serial import InvalidResponseException
+
+EncoderSample = namedtuple('EncoderSample', 'timestamp left right')
+
+
+class EncoderSampler(PeriodicSampler):
+    """
+    Polls the encoder values at a fixed rate on a dedicated thread.
+
+    Every sample is stored as a row `(timestamp, left, right)` in a
+    preallocated ring buffer, where `timestamp` is the `time.monotonic_ns()`
+    value halfway between sending the request and receiving the response.
+    Consumers read the buffer with `latest` and `window` and never touch the
+    serial interface themselves. Requests that time out or return an invalid
+    response are counted in `errors` and leave no sample.
+
+    The sampler must be the only user of the protocol while it is running.
+    """
+
+    def __init__(self, protocol, rate=100, capacity=1024):
+        """
+        Create a sampler for an `AttinyProtocol`.
+
+        :param rate: the sampling rate in Hz
+        :param capacity: the number of samples kept in the ring buffer
+        """
+        super(EncoderSampler, self).__init__()
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self._protocol = protocol
+        self.rate = rate
+        self._buffer = RingBuffer(capacity, 3)
+
+        # number of timeouts and invalid responses that were skipped
+        self.errors = 0
+
+    def _run(self):
+        period = int(1e9 / self.rate)
+        deadline = monotonic_ns()
+        while not self._stopping.is_set():
+            before = monotonic_ns()
+            try:
+                left, right = self._protocol.get_encoders(strict=True)
+            except InvalidResponseException:
+                self.errors += 1
+            else:
+                after = monotonic_ns()
+                self._buffer.append((before + (after - before) // 2,
+                                     left, right))
+
+            deadline = self._next_deadline(deadline, period, monotonic_ns())
+            self._wait_until(deadline)
+
+    def count(self):
+        """Get the total number of samples taken so far."""
+        return self._buffer.count()
+
+    def latest(self):
+        """Get the most recent `EncoderSample` without blocking, or None."""
+        row = self._buffer.latest()
+        if row is None:
+            return None
+        return EncoderSample(int(row[0]), int(row[1]), int(row[2]))
+
+    def window(self, n=None):
+        """
+        Get the last `n` samples as a read-only NumPy view, oldest first.
+
+        The view has the shape `(n, 3)` with the columns timestamp, left and
+        right. `numpy.diff(window[:, 0])` gives the actual sampling intervals.
+        See `RingBuffer.window` for how long the view stays valid.
+        """
+        return self._buffer.window(n)
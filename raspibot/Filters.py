@@ -0,0 +1,270 @@
+"""Provides streaming filters for conditioning batches of ADC samples."""
+
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# conversion values are signed 12-bit integers, see ADS1015.to_voltage
+_CONVERSION_VALUES = 2 ** 12
+_CONVERSION_FULL_SCALE = 2 ** 11
+
+# the largest factor by which the EMA scales samples within one block; keeps
+# the relative rounding error of the closed form below about 1e-8, far below
+# the resolution of the ADC
+_EMA_MAX_GROWTH = 1e8
+# the largest block of samples the EMA evaluates at once; bounds the memory
+# for the powers of the decay with small values of alpha
+_EMA_MAX_BLOCK = 4096
+
+
+class Filter(object):
+    """
+    Base class of the streaming filters.
+
+    A filter processes a batch of samples at a time, either an array of the
+    shape `(n,)` for a single channel or `(n, channels)` for several channels
+    sampled together. The state carried from one batch to the next has a
+    fixed size per channel, so the output does not depend on how a stream of
+    samples is split into batches.
+    """
+
+    def process(self, samples):
+        """Filter a batch of samples and return the filtered batch."""
+        raise NotImplementedError()
+
+    def reset(self):
+        """Forget the state carried over from the previous batches."""
+        pass
+
+
+class ExponentialMovingAverage(Filter):
+    """
+    Smooths the samples with `y[k] = alpha * x[k] + (1 - alpha) * y[k - 1]`.
+
+    The recursion is evaluated in closed form with cumulative sums over
+    blocks of samples, so no Python code runs per sample. The average starts
+    at the first sample.
+    """
+
+    def __init__(self, alpha):
+        """:param alpha: the weight of the newest sample, in (0, 1]"""
+        super(ExponentialMovingAverage, self).__init__()
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be in (0, 1]')
+        self.alpha = alpha
+        decay = 1 - alpha
+        if decay == 0:
+            self._block = None
+        else:
+            self._block = min(_EMA_MAX_BLOCK, max(
+                1, int(math.log(_EMA_MAX_GROWTH) / -math.log(decay))))
+            self._powers = decay ** np.arange(1, self._block + 1)
+        self._state = None
+
+    def reset(self):
+        self._state = None
+
+    def process(self, samples):
+        samples = np.asarray(samples, dtype=np.float64)
+        if len(samples) == 0:
+            return samples.copy()
+        if self._block is None:
+            self._state = samples[-1].copy()
+            return samples.copy()
+        if self._state is None:
+            self._state = samples[0].copy()
+
+        output = np.empty_like(samples)
+        powers = self._powers
+        if samples.ndim == 2:
+            powers = powers[:, np.newaxis]
+        for start in range(0, len(samples), self._block):
+            block = samples[start:start + self._block]
+            scale = powers[:len(block)]
+            # y[k] = decay^(k+1) * y[-1] + alpha * sum_j decay^(k-j) * x[j]
+            result = np.cumsum(block / scale, axis=0)
+            result *= self.alpha
+            result += self._state
+            result *= scale
+            output[start:start + len(block)] = result
+            self._state = result[-1]
+        return output
+
+
+class MovingAverage(Filter):
+    """
+    Replaces every sample with the mean of the last `length` samples.
+
+    Before `length` samples have been seen, the missing ones are assumed to
+    be equal to the first sample.
+    """
+
+    def __init__(self, length):
+        """:param length: the number of samples averaged"""
+        super(MovingAverage, self).__init__()
+        if length < 1:
+            raise ValueError('length must be at least 1')
+        self.length = length
+        self._history = None
+
+    def reset(self):
+        self._history = None
+
+    def process(self, samples):
+        samples = np.asarray(samples, dtype=np.float64)
+        if len(samples) == 0:
+            return samples.copy()
+        history = _history(self._history, samples, self.length - 1)
+
+        extended = np.concatenate((history, samples))
+        sums = np.cumsum(extended, axis=0)
+        output = sums[self.length - 1:].copy()
+        output[1:] -= sums[:-self.length]
+        output /= self.length
+
+        self._history = extended[len(extended) - self.length + 1:]
+        return output
+
+
+class MedianFilter(Filter):
+    """
+    Replaces every sample with the median of the last `length` samples.
+
+    Removes short spikes that would distort an average. Before `length`
+    samples have been seen, the missing ones are assumed to be equal to the
+    first sample.
+    """
+
+    def __init__(self, length):
+        """:param length: the number of samples the median is taken of"""
+        super(MedianFilter, self).__init__()
+        if length < 1:
+            raise ValueError('length must be at least 1')
+        self.length = length
+        self._history = None
+
+    def reset(self):
+        self._history = None
+
+    def process(self, samples):
+        samples = np.asarray(samples)
+        if len(samples) == 0:
+            return samples.astype(np.float64)
+        history = _history(self._history, samples, self.length - 1)
+
+        extended = np.concatenate((history, samples))
+        windows = sliding_window_view(extended, self.length, axis=0)
+        output = np.median(windows, axis=-1)
+
+        self._history = extended[len(extended) - self.length + 1:]
+        return output
+
+
+class Decimator(Filter):
+    """
+    Reduces the sample rate by an integer factor.
+
+    By default, every `factor` consecutive samples are averaged into one
+    (oversampling), which also reduces the noise. Otherwise, only every
+    `factor`-th sample is kept. Samples that do not fill a whole group yet
+    are kept for the next batch.
+    """
+
+    def __init__(self, factor, average=True):
+        """
+        :param factor: the number of input samples per output sample
+        :param average: whether to average the samples of a group or to
+        keep the last one
+        """
+        super(Decimator, self).__init__()
+        if factor < 1:
+            raise ValueError('factor must be at least 1')
+        self.factor = factor
+        self.average = average
+        self._pending = None
+
+    def reset(self):
+        self._pending = None
+
+    def process(self, samples):
+        samples = np.asarray(samples, dtype=np.float64)
+        if self._pending is not None and len(self._pending):
+            samples = np.concatenate((self._pending, samples))
+
+        groups = len(samples) // self.factor
+        used = groups * self.factor
+        self._pending = samples[used:].copy()
+
+        grouped = samples[:used].reshape(
+            (groups, self.factor) + samples.shape[1:])
+        if self.average:
+            return grouped.mean(axis=1)
+        return grouped[:, -1].copy()
+
+
+class Calibration(Filter):
+    """
+    Converts raw conversion values to volts with a precomputed lookup table.
+
+    The input must be the integer values returned by `ADS1015.read_channel`,
+    so a calibration goes first in a `Pipeline`. Without calibration points,
+    the ideal transfer function of the ADC at the given gain is used.
+    Otherwise, the voltages are interpolated linearly between the points,
+    e.g. measured with a voltmeter, and extrapolated from the outermost two.
+    """
+
+    def __init__(self, gain=4.096, points=None):
+        """
+        :param gain: the full scale voltage range configured on the ADC
+        :param points: a sequence of `(value, volts)` pairs, or None
+        """
+        super(Calibration, self).__init__()
+        values = np.arange(_CONVERSION_VALUES)
+        # the 12-bit two's complement is returned without its sign
+        signed = np.where(values >= _CONVERSION_FULL_SCALE,
+                          values - _CONVERSION_VALUES, values)
+        if points is None:
+            self.table = signed * (gain / _CONVERSION_FULL_SCALE)
+        else:
+            points = sorted(points)
+            if len(points) < 2:
+                raise ValueError('at least two calibration points are needed')
+            counts = np.array([point[0] for point in points], dtype=np.float64)
+            volts = np.array([point[1] for point in points], dtype=np.float64)
+            self.table = np.interp(signed, counts, volts)
+            below = signed < counts[0]
+            above = signed > counts[-1]
+            self.table[below] = volts[0] + (signed[below] - counts[0]) * (
+                (volts[1] - volts[0]) / (counts[1] - counts[0]))
+            self.table[above] = volts[-1] + (signed[above] - counts[-1]) * (
+                (volts[-1] - volts[-2]) / (counts[-1] - counts[-2]))
+
+    def process(self, samples):
+        samples = np.asarray(samples, dtype=np.intp)
+        return self.table[samples & (_CONVERSION_VALUES - 1)]
+
+
+class Pipeline(Filter):
+    """Applies several filters one after the other."""
+
+    def __init__(self, *filters):
+        """Create a pipeline of the given filters, in order."""
+        super(Pipeline, self).__init__()
+        self.filters = list(filters)
+
+    def reset(self):
+        for stage in self.filters:
+            stage.reset()
+
+    def process(self, samples):
+        for stage in self.filters:
+            samples = stage.process(samples)
+        return samples
+
+
+def _history(history, samples, length):
+    """Get the previous samples, or copies of the first one at the start."""
+    if history is not None:
+        return history
+    return np.repeat(samples[:1], length, axis=0)
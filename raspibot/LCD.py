@@ -4,19 +4,140 @@
 # basically, an implementation of the HD44780 controller protocol,
 # made-to-measure for our 4-bit interface to a 16x2 character LCD
 
-import RPi.GPIO as GPIO
-from time import sleep
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):
+    # not running on a Raspberry Pi
+    GPIO = None
+from collections import OrderedDict
+from time import perf_counter, sleep
+
+# execution times of the HD44780's instructions at its nominal clock of
+# 270 kHz (see datasheet, table 6); clear display and return home take much
+# longer than all other instructions and data writes
+_INSTRUCTION_TIME = 37e-6
+_CLEAR_TIME = 1.52e-3
+# the minimum waits after the nibbles of the initialisation by instruction
+# (see datasheet, figure 24)
+_INITIALIZATION_TIMES = (4.1e-3, 100e-6, _INSTRUCTION_TIME, _INSTRUCTION_TIME)
+# the execution times scale with the clock, which may run as slow as about
+# 190 kHz
+_TIMING_MARGIN = 1.5
+
+# waits shorter than this are spun, longer ones are slept for the most part,
+# as sleep() tends to overshoot by about this much
+_SPIN_THRESHOLD = 200e-6
+
+
+def _wait_until(deadline):
+    """Wait until a `time.perf_counter()` time, as precisely as possible."""
+    remaining = deadline - perf_counter()
+    if remaining > _SPIN_THRESHOLD:
+        sleep(remaining - _SPIN_THRESHOLD)
+    while perf_counter() < deadline:
+        pass
 
 
 def _bits(byte):
     return [(0 if (byte & (1 << i)) == 0 else 1) for i in reversed(range(8))]
 
 
+def _nibble_levels(register_select, byte):
+    """
+    The pin levels for sending a byte as two nibbles.
+
+    The levels are in the order of `Display._nibble_pins`: register select,
+    read/write, D7 to D4 and enable, which is set last.
+    """
+    bits = tuple(_bits(byte))
+    return ((register_select, 0) + bits[0:4] + (1,),
+            (register_select, 0) + bits[4:8] + (1,))
+
+
+# the pin levels of every byte, indexed by the register select bit, i.e. 0
+# for instructions and 1 for data, and the byte
+_NIBBLES = [[_nibble_levels(register_select, byte) for byte in range(256)]
+            for register_select in (0, 1)]
+
+
+def _byte(bits):
+    byte = 0
+    for bit in bits:
+        byte = (byte << 1) | (1 if bit else 0)
+    return byte
+
+
+def _changed_runs(frame, shown):
+    """
+    Find the runs of cells that differ between two lines.
+
+    Runs separated by a single unchanged cell are joined, since rewriting
+    that cell costs as much as moving the cursor past it.
+    """
+    runs = []
+    for x in range(len(frame)):
+        if frame[x] == shown[x]:
+            continue
+        if runs and x - runs[-1][1] <= 1:
+            runs[-1][1] = x + 1
+        else:
+            runs.append([x, x + 1])
+    return runs
+
+
+def _glyph_rows(picture):
+    """Convert a glyph to a tuple of 8 rows of 5 bits each."""
+    if len(picture) != 8:
+        raise ValueError('a glyph has 8 rows')
+    return tuple(row if isinstance(row, int) else _byte(row)
+                 for row in picture)
+
+
 class Display:
-    """Implements the communication protocol for the RaspiBot v2's LCD."""
+    """
+    Implements the communication protocol for the RaspiBot v2's LCD.
+
+    Besides writing to the controller directly, the display offers a
+    framebuffer: `set_text` changes its contents, and `flush` only sends the
+    cells that differ from what the display currently shows. `set_glyph` puts
+    custom characters into it, which are loaded into the 8 character
+    generator RAM slots as needed when flushing.
+
+    The write mode determines how the driver waits for the controller to
+    execute a byte before sending the next one:
+
+    - `'busy'` reads the busy flag after every byte
+    - `'timed'` never reads the busy flag, but waits for the worst-case
+      execution time of the previous byte before sending the next one, which
+      mostly has passed already
+    - `'adaptive'` reads the busy flag only after the slow clear display
+      instruction and is timed otherwise
+    """
+
+    # the size of the visible display, in characters
+    columns = 16
+    lines = 2
+
+    WRITE_MODES = ('busy', 'timed', 'adaptive')
+
+    def __init__(self, gpio=None, write_mode='busy'):
+        """
+        Create a display object with default GPIO pin numbers.
+
+        :param gpio: the GPIO module the display is connected to, or None for
+        `RPi.GPIO`
+        :param write_mode: one of `WRITE_MODES`
+        """
+        self._gpio = gpio if gpio is not None else GPIO
+        if self._gpio is None:
+            raise RuntimeError('RPi.GPIO is not available')
+        if write_mode not in self.WRITE_MODES:
+            raise ValueError('unsupported write mode: {0}'.format(write_mode))
+        self.write_mode = write_mode
+        # the perf_counter() time at which the controller has executed the
+        # last byte, in the timed write modes
+        self._ready_at = 0.0
 
-    def __init__(self):
-        """Create a display object with default GPIO pin numbers."""
         # pin numbers, defaults to BCM GPIO numbering
         self.enable = 27
         self.rw = 18
@@ -29,65 +150,122 @@ class Display:
 
         # define data pins in descending order, so the bits of a nibble can be
         # written in descending order as well, i.e. 0b0011 as
-        # GPIO.output(self.data, [0, 0, 1, 1])
+        # self._gpio.output(self.data, [0, 0, 1, 1])
         self.data = [self.d7, self.d6, self.d5, self.d4]
+        # the pins written at once for every nibble, see _nibble_levels
+        self._nibble_pins = None
+
+        # the framebuffer and what the display currently shows, one
+        # bytearray per line
+        self._frame = [bytearray(b' ' * self.columns) for _ in range(self.lines)]
+        self._shown = [bytearray(b' ' * self.columns) for _ in range(self.lines)]
+        # the (x, y) position the next character is written to, None if
+        # unknown
+        self._cursor = None
+
+        # the glyph of every framebuffer cell that shows one, None for the
+        # others
+        self._frame_glyphs = [[None] * self.columns for _ in range(self.lines)]
+        # glyphs defined by name with define_glyph
+        self._glyph_names = {}
+        # the rows of the glyphs in the character generator RAM, with their
+        # slot, least recently used first
+        self._glyph_slots = OrderedDict()
+        # the slots written with load_custom_character, which the glyph cache
+        # leaves alone
+        self._reserved_slots = set()
 
         self.init()
 
     def init(self):
         """Initialize the GPIO pins and ensure 4-bit communication mode."""
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(
+        self._gpio.setmode(self._gpio.BCM)
+        self._gpio.setup(
             [self.enable, self.rw, self.register_select],
-            GPIO.OUT,
-            initial=GPIO.LOW)
-        GPIO.setup(self.data, GPIO.OUT, initial=GPIO.LOW)
+            self._gpio.OUT,
+            initial=self._gpio.LOW)
+        self._gpio.setup(self.data, self._gpio.OUT, initial=self._gpio.LOW)
+        self._nibble_pins = [self.register_select, self.rw] + self.data + \
+            [self.enable]
 
-        # initialize to 4-bit mode regardless of initial state
-        self._write_nibble([0, 0, 1, 1])
-        self._write_nibble([0, 0, 1, 1])
-        self._write_nibble([0, 0, 1, 1])
-        self._write_nibble([0, 0, 1, 0])
+        # initialize to 4-bit mode regardless of initial state; the busy flag
+        # cannot be read yet, so these are always timed
+        for nibble, wait in zip((0x3, 0x3, 0x3, 0x2), _INITIALIZATION_TIMES):
+            _wait_until(self._ready_at)
+            self._write_nibble(_NIBBLES[0][nibble][1])
+            self._ready_at = perf_counter() + wait * _TIMING_MARGIN
 
         # initialize entry mode
-        self._write_byte([0, 0, 0, 0, 0, 1, 1, 0])
+        self._write_byte(0b00000110)
 
         # initialize display control
-        self._write_byte([0, 0, 0, 0, 1, 1, 1, 1])
+        self._write_byte(0b00001111)
 
         # initialize function mode
-        self._write_byte([0, 0, 1, 0, 1, 0, 0, 0])
+        self._write_byte(0b00101000)
 
         self.clear()
         sleep(0.001)
 
     def wait_for_controller(self):
-        GPIO.output(self.rw, 1)
-        GPIO.output(self.register_select, 0)
-        GPIO.setup(self.d7, GPIO.IN)
-        while not GPIO.input(self.d7):
+        self._gpio.output(self.rw, 1)
+        self._gpio.output(self.register_select, 0)
+        self._gpio.setup(self.d7, self._gpio.IN)
+        while not self._gpio.input(self.d7):
             a=1
             #make it nicer
-        GPIO.setup(self.d7, GPIO.OUT)
+        self._gpio.setup(self.d7, self._gpio.OUT)
+
+    def _write_nibble(self, levels):
+        """
+        Send four bits to the display controller.
 
-    def _write_nibble(self, nibble):
-        """Send four bits to the display controller."""
-        GPIO.output(self.rw, 0)
-        GPIO.output(self.data, nibble)
-        GPIO.output(self.enable, 1)
-        GPIO.output(self.enable, 0)
+        :param levels: the levels of the nibble pins, from `_NIBBLES`
+        """
+        self._gpio.output(self._nibble_pins, levels)
+        self._gpio.output(self.enable, 0)
 
-    def _write_byte(self, bits):
-        """Send a whole byte to the display controller."""
-        self._write_nibble(bits[0:4])
-        self._write_nibble(bits[4:8])
-        self.wait_for_controller()
+    def _write_byte(self, byte, data=False, slow=False):
+        """
+        Send a whole byte to the display controller.
 
-    def _select_data_register(self):
-        GPIO.output(self.register_select, 1)
+        :param byte: an instruction or character code
+        :param data: whether to write to the data register instead of the
+        instruction register
+        :param slow: whether the byte is a clear display or return home
+        instruction
+        """
+        self._write_bytes((byte,), data, slow)
 
-    def _select_instruction_register(self):
-        GPIO.output(self.register_select, 0)
+    def _write_bytes(self, codes, data=False, slow=False):
+        """
+        Send a sequence of bytes to the display controller.
+
+        This is where all writes end up, so it avoids per-byte overhead: the
+        pin levels come from the precomputed table, and each nibble takes
+        two GPIO calls.
+        """
+        output = self._gpio.output
+        pins = self._nibble_pins
+        enable = self.enable
+        nibbles = _NIBBLES[1 if data else 0]
+        poll = self.write_mode == 'busy' or \
+            (slow and self.write_mode == 'adaptive')
+        execution_time = \
+            (_CLEAR_TIME if slow else _INSTRUCTION_TIME) * _TIMING_MARGIN
+
+        for code in codes:
+            high, low = nibbles[code]
+            _wait_until(self._ready_at)
+            output(pins, high)
+            output(enable, 0)
+            output(pins, low)
+            output(enable, 0)
+            if poll:
+                self.wait_for_controller()
+                self._ready_at = 0.0
+            else:
+                self._ready_at = perf_counter() + execution_time
 
     def clear(self):
         """
@@ -95,45 +273,185 @@ class Display:
         Clear the LCD of any content and reset the cursor to the top left
         character of the display.
         """
-        GPIO.output(self.register_select, 0)
-        self._write_byte([0, 0, 0, 0, 0, 0, 0, 1])
+        self._write_byte(0b00000001, slow=True)
+        for line in self._frame + self._shown:
+            line[:] = b' ' * self.columns
+        for line in self._frame_glyphs:
+            line[:] = [None] * self.columns
+        self._cursor = (0, 0)
 
     def print_codepoint(self, bits):
         """Print a single character at the cursor position."""
-        self._select_data_register()
-        self._write_byte(bits)
+        self._write_characters(bytes((_byte(bits),)))
+
+    def _write_characters(self, codes):
+        """Print character codes at the cursor position and keep track."""
+        self._write_bytes(codes, data=True)
+        if self._cursor is None:
+            return
+        x, y = self._cursor
+        if x < self.columns:
+            shown = codes[:self.columns - x]
+            self._shown[y][x:x + len(shown)] = shown
+        self._cursor = (x + len(codes), y)
 
     def cursor_goto_xy(self, x ,y ):
-        self._select_instruction_register()
         # WARNING: only works as expected for line == 1 or line == 0
         y = 0 if y == 0 else 1
-        self._write_byte([1, y, x&32, x&16, x&8, x&4, x&2, x&1])
+        self._write_byte(0x80 | (y << 6) | (x & 0x3F))
+        self._cursor = (x, y)
 
     def load_custom_character(self, picture, number):
         if number>=0 and number<=7:
-            self._write_byte([0, 1, number&4, number&2, number&1, 0, 0, 0])
-            if len(picture)==8:
-                for c in picture:
-                    self._select_data_register()
-                    self._write_byte(c)
+            # the slot now belongs to the caller, the glyph cache must not
+            # use it any more
+            self._reserved_slots.add(number)
+            self._upload_glyph(number, picture)
+
+    def _upload_glyph(self, number, picture):
+        """Write a picture into a character generator RAM slot."""
+        for rows, slot in list(self._glyph_slots.items()):
+            if slot == number:
+                del self._glyph_slots[rows]
+        # the following writes go to the character generator RAM
+        self._cursor = None
+        self._write_byte(0x40 | (number << 3))
+        if len(picture)==8:
+            self._write_bytes(_glyph_rows(picture), data=True)
+
+    def define_glyph(self, name, picture):
+        """
+        Name a custom character for use with `set_glyph`.
+
+        :param picture: 8 rows of 5 pixels each, either as lists of bits like
+        for `load_custom_character` or as integers
+        """
+        self._glyph_names[name] = _glyph_rows(picture)
+
+    def set_glyph(self, x, y, glyph):
+        """
+        Put a custom character into the framebuffer.
+
+        The glyph is loaded into a character generator RAM slot when
+        flushing, unless it is there already. Slots written with
+        `load_custom_character` are never used, so at most 8 minus their
+        number of different glyphs can be on the screen at a time.
+
+        :param glyph: a name given to `define_glyph`, or a picture like for it
+        """
+        if y not in range(self.lines) or x not in range(self.columns):
+            raise ValueError('invalid position: {0}, {1}'.format(x, y))
+        if isinstance(glyph, str):
+            rows = self._glyph_names[glyph]
+        else:
+            rows = _glyph_rows(glyph)
+        self._frame_glyphs[y][x] = rows
+
+    def _load_glyphs(self):
+        """
+        Make sure the character generator RAM holds the framebuffer's glyphs.
+
+        A glyph is loaded into a free slot, or else into the least recently
+        used slot whose glyph is not in the framebuffer and preferably not on
+        the display either. Cells still showing the replaced glyph are
+        rewritten by `flush`, as the framebuffer no longer refers to it.
+
+        :returns the number of bytes sent to the controller
+        """
+        needed = OrderedDict()
+        for line in self._frame_glyphs:
+            for rows in line:
+                if rows is not None:
+                    needed[rows] = True
+        if len(needed) > 8 - len(self._reserved_slots):
+            raise ValueError(
+                'too many different glyphs: {0}'.format(len(needed)))
+
+        written = 0
+        for rows in needed:
+            if rows in self._glyph_slots:
+                self._glyph_slots.move_to_end(rows)
+                continue
+            slot = self._free_glyph_slot(needed)
+            self._upload_glyph(slot, rows)
+            self._glyph_slots[rows] = slot
+            written += 9
+
+        for frame, glyphs in zip(self._frame, self._frame_glyphs):
+            for x, rows in enumerate(glyphs):
+                if rows is not None:
+                    frame[x] = self._glyph_slots[rows]
+        return written
+
+    def _free_glyph_slot(self, needed):
+        used = set(self._glyph_slots.values()) | self._reserved_slots
+        for slot in range(8):
+            if slot not in used:
+                return slot
+        candidates = [(rows, slot) for rows, slot in self._glyph_slots.items()
+                      if rows not in needed]
+        for rows, slot in candidates:
+            if not any(slot in line for line in self._shown):
+                return slot
+        return candidates[0][1]
 
     def cursor_off(self):
-        GPIO.output(self.register_select, 0)
-        self._write_byte([0, 0, 0, 0, 1, 1, 0, 0])
+        self._write_byte(0b00001100)
 
     def cursor_on(self):
-        GPIO.output(self.register_select, 0)
-        self._write_byte([0, 0, 0, 0, 1, 1, 1, 1])
+        self._write_byte(0b00001111)
 
     def print(self, string):
         """Print a string at the cursor position."""
         # ASCII encoding is probably the closest to the HDS44780's actual
         # encoding
-        for c in string.encode('ascii'):
-            self.print_codepoint(_bits(c))
+        self._write_characters(string.encode('ascii'))
+
+    def set_text(self, x, y, text):
+        """
+        Put a string into the framebuffer, without writing to the display.
+
+        Characters beyond the right edge of the display are cut off. Call
+        `flush` to show the framebuffer.
+
+        :param x: the column of the first character
+        :param y: the line, 0 or 1
+        :param text: a string, or bytes with the character codes
+        """
+        if y not in range(self.lines):
+            raise ValueError('invalid line: {0}'.format(y))
+        if isinstance(text, str):
+            text = text.encode('ascii')
+        if x < 0:
+            text = text[-x:]
+            x = 0
+        text = text[:max(0, self.columns - x)]
+        self._frame[y][x:x + len(text)] = text
+        self._frame_glyphs[y][x:x + len(text)] = [None] * len(text)
+
+    def flush(self):
+        """
+        Show the framebuffer on the display.
+
+        Only the cells that differ from what the display currently shows are
+        written, so unchanged screens cost nothing and the display does not
+        flicker like with `clear`.
+
+        :returns the number of bytes sent to the controller
+        """
+        written = self._load_glyphs()
+        for y in range(self.lines):
+            frame = self._frame[y]
+            for start, end in _changed_runs(frame, self._shown[y]):
+                if self._cursor != (start, y):
+                    self.cursor_goto_xy(start, y)
+                    written += 1
+                self._write_characters(bytes(frame[start:end]))
+                written += end - start
+        return written
 
     # TODO: figure out a better way to cleanup GPIO instead of letting the
     # user call this manually...
     def cleanup(self):
         """Free any used GPIO pins."""
-        GPIO.cleanup(self.data + [self.enable, self.rw, self.register_select])
+        self._gpio.cleanup(self.data + [self.enable, self.rw, self.register_select])
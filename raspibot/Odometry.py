@@ -0,0 +1,137 @@
+"""Estimates the RaspiBot's pose from its wheel encoder counters."""
+
+from collections import namedtuple
+from math import cos, sin
+
+import numpy as np
+
+Pose = namedtuple('Pose', 'x y theta')
+
+# the firmware's encoder counters are signed 16-bit integers
+_COUNTER_RANGE = 2 ** 16
+_COUNTER_HALF = 2 ** 15
+
+
+def unwrap(previous, current):
+    """
+    Get the change between two readings of a 16-bit encoder counter.
+
+    The counters wrap around, so the shortest difference modulo 2 ** 16 is
+    taken, assuming that less than 32768 ticks pass between two readings.
+    Works for Python integers as well as NumPy integer arrays.
+    """
+    return ((current - previous + _COUNTER_HALF) % _COUNTER_RANGE) \
+        - _COUNTER_HALF
+
+
+class Odometry(object):
+    """
+    Integrates the pose of a differential-drive robot from encoder counters.
+
+    The raw 16-bit counters returned by `AttinyProtocol.get_encoders` are
+    unwrapped into unbounded tick counts (`left_ticks`, `right_ticks`), and
+    the pose (x, y, theta) is advanced with every sample. `x` and `y` are in
+    the unit of `wheel_base` and `distance_per_tick`, `theta` is in radians
+    and counts full turns instead of wrapping around.
+
+    `update` processes one sample at a time, `integrate` processes a whole
+    array of recorded samples in a single vectorised pass. Both continue
+    from the current state and produce the same poses, up to floating point
+    rounding.
+    """
+
+    def __init__(self, wheel_base, distance_per_tick, pose=Pose(0.0, 0.0, 0.0)):
+        """
+        Create an odometry for the given robot geometry.
+
+        :param wheel_base: the distance between the two wheels
+        :param distance_per_tick: the distance a wheel travels per encoder
+        tick
+        :param pose: the initial pose
+        """
+        super(Odometry, self).__init__()
+        self.wheel_base = wheel_base
+        self.distance_per_tick = distance_per_tick
+        self.reset(pose)
+
+    def reset(self, pose=Pose(0.0, 0.0, 0.0)):
+        """Set the pose and forget the previous counter readings."""
+        self.pose = Pose(*pose)
+        self.left_ticks = 0
+        self.right_ticks = 0
+        self._previous = None
+
+    def update(self, left, right):
+        """
+        Advance the pose by one pair of raw encoder counter readings.
+
+        The first reading after creating or resetting the odometry only
+        serves as the reference for the following ones. Returns the new pose.
+        """
+        if self._previous is None:
+            self._previous = (left, right)
+            return self.pose
+
+        delta_left = unwrap(self._previous[0], left)
+        delta_right = unwrap(self._previous[1], right)
+        self._previous = (left, right)
+        self.left_ticks += delta_left
+        self.right_ticks += delta_right
+
+        distance = (delta_left + delta_right) * self.distance_per_tick / 2
+        rotation = (delta_right - delta_left) * self.distance_per_tick \
+            / self.wheel_base
+
+        x, y, theta = self.pose
+        # advance along the mean heading of this step
+        heading = theta + rotation / 2
+        self.pose = Pose(x + distance * cos(heading),
+                         y + distance * sin(heading),
+                         theta + rotation)
+        return self.pose
+
+    def integrate(self, samples):
+        """
+        Advance the pose by a whole array of raw encoder counter readings.
+
+        `samples` has the shape `(n, 2)` with the left and right counters, or
+        `(n, 3)` with a leading timestamp column as returned by
+        `EncoderSampler.window`. Returns an `(n, 3)` array with the pose after
+        each sample; the odometry's state is left at the last one.
+        """
+        samples = np.asarray(samples)
+        if samples.ndim != 2 or samples.shape[1] not in (2, 3):
+            raise ValueError('samples must have the shape (n, 2) or (n, 3)')
+        counters = samples[:, -2:].astype(np.int64)
+
+        poses = np.empty((len(counters), 3))
+        if len(counters) == 0:
+            return poses
+
+        if self._previous is None:
+            previous = counters[0]
+        else:
+            previous = np.array(self._previous, dtype=np.int64)
+        deltas = unwrap(np.vstack((previous, counters[:-1])), counters)
+
+        distances = deltas.sum(axis=1) * (self.distance_per_tick / 2)
+        rotations = (deltas[:, 1] - deltas[:, 0]) * (
+            self.distance_per_tick / self.wheel_base)
+
+        x, y, theta = self.pose
+        thetas = np.cumsum(rotations)
+        thetas += theta
+        headings = thetas - rotations / 2
+
+        poses[:, 0] = np.cumsum(distances * np.cos(headings))
+        poses[:, 0] += x
+        poses[:, 1] = np.cumsum(distances * np.sin(headings))
+        poses[:, 1] += y
+        poses[:, 2] = thetas
+
+        ticks = deltas.sum(axis=0)
+        self.left_ticks += int(ticks[0])
+        self.right_ticks += int(ticks[1])
+        self._previous = (int(counters[-1, 0]), int(counters[-1, 1]))
+        self.pose = Pose(*(float(value) for value in poses[-1]))
+        return poses
@@ -0,0 +1,169 @@
+"""Draws on the LCD in the background, so callers never wait for it."""
+
+import threading
+from time import monotonic
+
+
+class DisplayRenderer(object):
+    """
+    Owns a `Display` and draws the latest screen contents on a thread.
+
+    Producers change the screen with `show`, `set_text` and `clear` from any
+    thread. These only update an in-memory frame and wake the renderer, so
+    they return in microseconds, while the renderer does the slow transfer to
+    the display. Frames submitted faster than the renderer draws them, or
+    faster than `max_rate`, are coalesced: only the most recent one is drawn.
+
+    Drawing uses the display's framebuffer, so only the changed cells are
+    written. Nothing else may use the display while the renderer is running.
+    """
+
+    def __init__(self, display, max_rate=20):
+        """
+        Create a renderer for a display.
+
+        :param display: the `Display` to draw on
+        :param max_rate: the maximum number of frames drawn per second
+        """
+        super(DisplayRenderer, self).__init__()
+        if max_rate <= 0:
+            raise ValueError('max_rate must be positive')
+        self._display = display
+        self.max_rate = max_rate
+        self._frame = [bytearray(b' ' * display.columns)
+                       for _ in range(display.lines)]
+        self._condition = threading.Condition()
+        # the number of changes to the frame so far, and the value of it at
+        # the frame drawn last
+        self._version = 0
+        self._drawn = 0
+        self._stopping = False
+        self._thread = None
+
+        # number of frames drawn
+        self.frames = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.stop()
+        return False
+
+    def start(self):
+        """Start drawing on a background thread."""
+        if self.running():
+            return
+        with self._condition:
+            self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name='DisplayRenderer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop drawing and wait for the background thread to finish.
+
+        A frame that has not been drawn yet is drawn before, regardless of
+        `max_rate`.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def running(self):
+        """Return whether the background thread is drawing."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def show(self, *lines):
+        """
+        Replace the whole screen.
+
+        Lines are padded with spaces or cut off at the width of the display,
+        missing lines are blank.
+
+        :param lines: strings, or bytes with the character codes
+        """
+        if len(lines) > len(self._frame):
+            raise ValueError('too many lines: {0}'.format(len(lines)))
+        lines = [_encode(line) for line in lines]
+        with self._condition:
+            for y, frame_line in enumerate(self._frame):
+                text = lines[y] if y < len(lines) else b''
+                frame_line[:] = text[:len(frame_line)].ljust(len(frame_line))
+            self._changed()
+
+    def set_text(self, x, y, text):
+        """
+        Change part of a line, like `Display.set_text`.
+
+        :param x: the column of the first character
+        :param y: the line, 0 or 1
+        :param text: a string, or bytes with the character codes
+        """
+        if y not in range(len(self._frame)):
+            raise ValueError('invalid line: {0}'.format(y))
+        text = _encode(text)
+        if x < 0:
+            text = text[-x:]
+            x = 0
+        with self._condition:
+            line = self._frame[y]
+            text = text[:max(0, len(line) - x)]
+            line[x:x + len(text)] = text
+            self._changed()
+
+    def clear(self):
+        """Blank the whole screen."""
+        self.show()
+
+    def wait(self, timeout=None):
+        """
+        Wait until the current screen contents have been drawn.
+
+        :returns False if the timeout expired first, True otherwise
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._drawn == self._version, timeout)
+
+    def _changed(self):
+        self._version += 1
+        self._condition.notify_all()
+
+    def _run(self):
+        interval = 1 / self.max_rate
+        next_frame = monotonic()
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopping or self._drawn != self._version)
+                if self._drawn == self._version:
+                    return
+                # hold back frames above the maximum rate, which lets further
+                # changes accumulate
+                self._condition.wait_for(
+                    lambda: self._stopping, next_frame - monotonic())
+                frame = [bytes(line) for line in self._frame]
+                version = self._version
+
+            started = monotonic()
+            for y, line in enumerate(frame):
+                self._display.set_text(0, y, line)
+            self._display.flush()
+            next_frame = started + interval
+
+            with self._condition:
+                self.frames += 1
+                self._drawn = version
+                self._condition.notify_all()
+
+
+def _encode(text):
+    if isinstance(text, str):
+        return text.encode('ascii')
+    return bytes(text)
@@ -0,0 +1,76 @@
+"""Provides a preallocated, array-backed ring buffer for sampled data."""
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """
+    Stores the most recent rows of a stream of samples in a NumPy array.
+
+    All memory is allocated up front, so appending never allocates. The
+    buffer is written by a single producer and can be read by any number of
+    consumers without locking.
+
+    Internally, every row is stored twice, in two mirrored halves of the
+    underlying array. That way the most recent rows always form a contiguous
+    slice and `window` can return a view instead of a copy. One additional
+    slot makes sure that the row currently being written is never part of a
+    window.
+    """
+
+    def __init__(self, capacity, columns=None, dtype=np.int64):
+        """
+        Create a buffer for `capacity` rows.
+
+        If `columns` is None, every row is a scalar, otherwise it is a vector
+        with the given number of elements.
+        """
+        super(RingBuffer, self).__init__()
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.capacity = capacity
+        self._size = capacity + 1
+        shape = (2 * self._size,)
+        if columns is not None:
+            shape += (columns,)
+        self._data = np.zeros(shape, dtype=dtype)
+        # total number of rows appended so far; only ever incremented after
+        # a row has been written completely
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def count(self):
+        """Get the total number of rows appended since creation."""
+        return self._count
+
+    def append(self, row):
+        """Store a row, overwriting the oldest one if the buffer is full."""
+        index = self._count % self._size
+        self._data[index] = row
+        self._data[index + self._size] = row
+        self._count += 1
+
+    def latest(self):
+        """Get a copy of the most recently appended row, or None if empty."""
+        count = self._count
+        if count == 0:
+            return None
+        return self._data[(count - 1) % self._size].copy()
+
+    def window(self, n=None):
+        """
+        Get a read-only view of the last `n` rows, oldest first.
+
+        If `n` is None or larger than the number of rows stored, all stored
+        rows are returned. The view is only valid until `capacity - n` more
+        rows have been appended, so copy it if it needs to be kept longer.
+        """
+        count = self._count
+        available = min(count, self.capacity)
+        n = available if n is None else max(0, min(n, available))
+        end = (count - 1) % self._size + self._size + 1
+        view = self._data[end - n:end]
+        view.flags.writeable = False
+        return view
@@ -0,0 +1,78 @@
+"""Provides the scaffolding for periodic sampling on a background thread."""
+
+import threading
+from time import monotonic_ns
+
+
+class PeriodicSampler(object):
+    """
+    Base class for samplers that run on a dedicated thread.
+
+    Subclasses implement `_run`, which loops until `_stopping` is set. They
+    schedule their samples with `_next_deadline` and `_wait_until`, so
+    missed sampling periods are skipped and counted in `overruns` instead of
+    being caught up in a burst.
+    """
+
+    def __init__(self):
+        """Create a stopped sampler."""
+        super(PeriodicSampler, self).__init__()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # number of sampling periods missed because sampling took too long
+        self.overruns = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.stop()
+        return False
+
+    def start(self):
+        """Start sampling on a background thread."""
+        if self.running():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the background thread to finish."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def running(self):
+        """Return whether the background thread is sampling."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        raise NotImplementedError()
+
+    def _next_deadline(self, deadline, period, now):
+        """
+        Get the deadline of the next sample, all times in nanoseconds.
+
+        If that has passed already, the periods missed are skipped and
+        counted in `overruns`.
+        """
+        deadline += period
+        if deadline < now:
+            missed = (now - deadline) // period + 1
+            self.overruns += missed
+            deadline += missed * period
+        return deadline
+
+    def _wait_until(self, deadline):
+        """
+        Sleep until a `time.monotonic_ns()` time.
+
+        :returns True if the sampler is being stopped, False otherwise
+        """
+        remaining = deadline - monotonic_ns()
+        return self._stopping.wait(max(0, remaining) / 1e9)
@@ -0,0 +1,108 @@
+"""Samples several ADC channels at individual rates in the background."""
+
+from collections import namedtuple
+from time import monotonic_ns
+
+import numpy as np
+
+from .RingBuffer import RingBuffer
+from .Sampler import PeriodicSampler
+
+ScanSnapshot = namedtuple('ScanSnapshot', 'channels timestamps values')
+
+
+class ADCScanner(PeriodicSampler):
+    """
+    Reads a set of ADC channels round-robin on a dedicated thread.
+
+    Every channel has its own target rate. The scanner always reads the
+    channel whose next sample is due first, so all channels are sampled at
+    their rate as long as the bus can keep up with the sum of the rates. If it
+    cannot, the late channels are read as soon as possible and the periods
+    they missed are counted in `overruns` instead of being caught up in a
+    burst.
+
+    Every sample is stored as a row `(timestamp, value)` in a preallocated
+    ring buffer per channel, where `timestamp` is the `time.monotonic_ns()`
+    value halfway between starting the conversion and reading its result.
+    Consumers use `latest`, `window` and `snapshot` and never touch the bus
+    themselves.
+
+    The scanner must be the only user of the ADC while it is running.
+    """
+
+    def __init__(self, adc, rates, capacity=1024):
+        """
+        Create a scanner for an `ADS1015`.
+
+        :param rates: a dict with the sampling rate in Hz by channel index
+        :param capacity: the number of samples kept per channel
+        """
+        super(ADCScanner, self).__init__()
+        if not rates:
+            raise ValueError('at least one channel must be scanned')
+        for channel, rate in rates.items():
+            if channel not in adc._CHANNELS:
+                raise ValueError('invalid channel: {0}'.format(channel))
+            if rate <= 0:
+                raise ValueError('rate must be positive')
+        self._adc = adc
+        self.channels = sorted(rates)
+        self.rates = dict(rates)
+        self._buffers = {channel: RingBuffer(capacity, 2)
+                         for channel in self.channels}
+
+    def _run(self):
+        periods = {channel: int(1e9 / rate)
+                   for channel, rate in self.rates.items()}
+        start = monotonic_ns()
+        deadlines = {channel: start for channel in self.channels}
+        while not self._stopping.is_set():
+            # earliest deadline first; ties go to the lower channel index
+            channel = min(self.channels, key=deadlines.__getitem__)
+            if self._wait_until(deadlines[channel]):
+                return
+
+            before = monotonic_ns()
+            value = self._adc.read_channel(channel)
+            after = monotonic_ns()
+            self._buffers[channel].append(
+                (before + (after - before) // 2, value))
+
+            deadlines[channel] = self._next_deadline(
+                deadlines[channel], periods[channel], after)
+
+    def count(self, channel):
+        """Get the total number of samples taken of a channel so far."""
+        return self._buffers[channel].count()
+
+    def latest(self, channel):
+        """Get the most recent `(timestamp, value)` of a channel, or None."""
+        row = self._buffers[channel].latest()
+        if row is None:
+            return None
+        return int(row[0]), int(row[1])
+
+    def window(self, channel, n=None):
+        """
+        Get the last `n` samples of a channel as a read-only NumPy view.
+
+        The view has the shape `(n, 2)` with the columns timestamp and value,
+        oldest first. See `RingBuffer.window` for how long the view stays
+        valid.
+        """
+        return self._buffers[channel].window(n)
+
+    def snapshot(self):
+        """
+        Get the most recent sample of every channel at once.
+
+        Returns a `ScanSnapshot` with the scanned channels and two arrays
+        with the timestamps and values in the same order, or None until every
+        channel has been sampled at least once.
+        """
+        rows = [self._buffers[channel].latest() for channel in self.channels]
+        if any(row is None for row in rows):
+            return None
+        rows = np.array(rows)
+        return ScanSnapshot(tuple(self.channels), rows[:, 0], rows[:, 1])
@@ -1,6 +1,12 @@
 """Implements the serial interface protocol of RaspiBot's Attiny firmware."""
 
-from collections import namedtuple
+import asyncio
+import os
+import struct
+import termios
+import tty
+from collections import deque, namedtuple
+from time import monotonic, perf_counter_ns
 
 EncoderValues = namedtuple('EncoderValues', 'left right')
 
@@ -38,7 +44,12 @@ MOTOR_MAX = 127
 
 
 def _clamp(value, minimum, maximum):
-    return min(maximum, max(minimum, value))
+    # comparisons are considerably cheaper than calling min() and max()
+    if value < minimum:
+        return minimum
+    if value > maximum:
+        return maximum
+    return value
 
 
 class InvalidResponseException(Exception):
@@ -57,110 +68,256 @@ class InvalidLengthException(Exception):
     pass
 
 
-class AttinyProtocol(object):
-    """Provides methods for protocol transactions."""
+def _decode_acknowledgement(response, arguments):
+    if response == ACK:
+        return True
+    # empty response can happen on a timeout, which we interpret as
+    # "not alive"
+    elif response == NAK or response == b'':
+        return False
+    else:
+        raise InvalidResponseException()
+
+
+_ENCODER = struct.Struct('>h')
+_ENCODERS = struct.Struct('>hh')
+
+
+def _decode_encoder(response, arguments):
+    if len(response) == _ENCODER.size:
+        return _ENCODER.unpack_from(response)[0]
+    # truncated response, e.g. on a timeout
+    return int.from_bytes(response, 'big', signed=True)
+
+
+def _decode_encoders(response, arguments):
+    if len(response) == _ENCODERS.size:
+        return EncoderValues._make(_ENCODERS.unpack_from(response))
+    # truncated response, e.g. on a timeout
+    left = int.from_bytes(response[:2], 'big', signed=True)
+    right = int.from_bytes(response[2:], 'big', signed=True)
+    return EncoderValues(left, right)
+
+
+def _decode_encoders_strict(response, arguments):
+    if len(response) != _ENCODERS.size:
+        raise InvalidResponseException()
+    return EncoderValues._make(_ENCODERS.unpack_from(response))
 
-    def __init__(self, serial):
-        """Create a protocol instance on a serial interface."""
-        super(AttinyProtocol, self).__init__()
-        self._serial = serial
 
-    def get_encoders(self):
-        """Request both left and right encoder values."""
-        self._serial.write(ENCODERS_BOTH)
-        response = self._serial.read(4)
-        left = int.from_bytes(response[:2], 'big', signed=True)
-        right = int.from_bytes(response[2:], 'big', signed=True)
-        return EncoderValues(left, right)
+def _decode_echo(response, arguments):
+    if len(response) != 1 or response[0] != arguments[0]:
+        raise InvalidResponseException()
+    return response
+
+
+class Command(namedtuple(
+        'Command',
+        'name opcode request response_length decode message messages')):
+    """
+    Describes one protocol command.
+
+    `name` is the name of the corresponding `AttinyProtocol` method, `opcode`
+    is the first byte of the message, `request` a `struct.Struct` for
+    the payload following it, `response_length` the number of bytes the
+    firmware answers with and `decode` a function that turns those bytes (and
+    the request arguments) into the result of the command.
+
+    Messages that can be precomputed are not packed for every transaction:
+    for commands without a payload, `message` holds the complete message,
+    and for commands with a one-byte payload, `messages` holds the messages
+    for all 256 values of that byte. Both are None otherwise.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, name, opcode, request, response_length, decode):
+        message = messages = None
+        if request.size == 0:
+            message = bytes((opcode,))
+        elif request.size == 1:
+            messages = tuple(bytes((opcode, value)) for value in range(256))
+        return super(Command, cls).__new__(
+            cls, name, opcode, request, response_length, decode,
+            message, messages)
+
+
+_NO_PAYLOAD = struct.Struct('')
+_MOTOR = struct.Struct('>b')
+
+ALIVE_COMMAND = Command(
+    'alive', ALIVE[0], _NO_PAYLOAD, 1, _decode_acknowledgement)
+
+ENCODERS_RIGHT_COMMAND = Command(
+    'get_right_encoder', ENCODERS_RIGHT[0],
+    _NO_PAYLOAD, _ENCODER.size, _decode_encoder)
+ENCODERS_LEFT_COMMAND = Command(
+    'get_left_encoder', ENCODERS_LEFT[0],
+    _NO_PAYLOAD, _ENCODER.size, _decode_encoder)
+ENCODERS_BOTH_COMMAND = Command(
+    'get_encoders', ENCODERS_BOTH[0],
+    _NO_PAYLOAD, _ENCODERS.size, _decode_encoders)
+# the same command, but a truncated response is an error
+ENCODERS_BOTH_STRICT_COMMAND = ENCODERS_BOTH_COMMAND._replace(
+    decode=_decode_encoders_strict)
+
+ENCODERS_RESET_RIGHT_COMMAND = Command(
+    'reset_right_encoder', ENCODERS_RESET_RIGHT[0],
+    _NO_PAYLOAD, 1, _decode_acknowledgement)
+ENCODERS_RESET_LEFT_COMMAND = Command(
+    'reset_left_encoder', ENCODERS_RESET_LEFT[0],
+    _NO_PAYLOAD, 1, _decode_acknowledgement)
+ENCODERS_RESET_BOTH_COMMAND = Command(
+    'reset_encoders', ENCODERS_RESET_BOTH[0],
+    _NO_PAYLOAD, 1, _decode_acknowledgement)
+
+ECHO_COMMAND = Command(
+    'echo', ECHO[0], struct.Struct('>B'), 1, _decode_echo)
+
+STOP_MOTORS_COMMAND = Command(
+    'stop_motors', STOP_MOTORS[0], _NO_PAYLOAD, 1, _decode_acknowledgement)
+SET_LEFT_MOTOR_COMMAND = Command(
+    'set_left_motor', SET_LEFT_MOTOR[0], _MOTOR, 1, _decode_acknowledgement)
+SET_RIGHT_MOTOR_COMMAND = Command(
+    'set_right_motor', SET_RIGHT_MOTOR[0], _MOTOR, 1, _decode_acknowledgement)
+SET_BOTH_MOTORS_COMMAND = Command(
+    'set_motors', SET_BOTH_MOTORS[0],
+    struct.Struct('>bb'), 1, _decode_acknowledgement)
+
+# p and i as signed 16-bit integers, the encoder scale as an unsigned byte
+SET_PI_PARAMETERS_COMMAND = Command(
+    'set_pi_parameters', SET_PI_PARAMETERS[0],
+    struct.Struct('>hhB'), 1, _decode_acknowledgement)
+
+# frequency and duration as unsigned 16-bit integers, volume as a byte
+SET_BUZZER_COMMAND = Command(
+    'set_buzzer', SET_BUZZER[0],
+    struct.Struct('>HHB'), 1, _decode_acknowledgement)
+STOP_BUZZER_COMMAND = Command(
+    'stop_buzzer', STOP_BUZZER[0], _NO_PAYLOAD, 1, _decode_acknowledgement)
+
+# all commands by their opcode
+COMMANDS = {command.opcode: command for command in (
+    ALIVE_COMMAND,
+    ENCODERS_RIGHT_COMMAND,
+    ENCODERS_LEFT_COMMAND,
+    ENCODERS_BOTH_COMMAND,
+    ENCODERS_RESET_RIGHT_COMMAND,
+    ENCODERS_RESET_LEFT_COMMAND,
+    ENCODERS_RESET_BOTH_COMMAND,
+    ECHO_COMMAND,
+    STOP_MOTORS_COMMAND,
+    SET_LEFT_MOTOR_COMMAND,
+    SET_RIGHT_MOTOR_COMMAND,
+    SET_BOTH_MOTORS_COMMAND,
+    SET_PI_PARAMETERS_COMMAND,
+    SET_BUZZER_COMMAND,
+    STOP_BUZZER_COMMAND,
+)}
+
+_MESSAGE_LENGTH_MAX = 1 + max(
+    command.request.size for command in COMMANDS.values())
+
+# how many stray bytes to discard at most while waiting for the echo of a
+# resynchronisation nonce
+_RESYNCHRONIZATION_BYTES_MAX = 64
+
+# marks serial interfaces without a timeout attribute
+_NO_TIMEOUT_SUPPORT = object()
+
+
+def _next_nonce(nonce):
+    # never use values that could be mistaken for an ACK or NAK
+    nonce = (nonce + 1) % 256
+    while nonce in (ACK[0], NAK[0]):
+        nonce = (nonce + 1) % 256
+    return nonce
+
+
+class CommandMethods(object):
+    """
+    The command methods shared by all protocol implementations.
+
+    Each method is a thin wrapper that clamps its arguments and passes them
+    on to `_execute`, together with the `Command` describing the message
+    layout. Subclasses implement `_execute`, which may return the decoded
+    response, a `BatchResult` or an awaitable. `_encode` packs messages into
+    a buffer that is reused for every message.
+    """
+
+    def __init__(self):
+        """Allocate the message buffer."""
+        super(CommandMethods, self).__init__()
+        self._buffer = bytearray(_MESSAGE_LENGTH_MAX)
+        # one view per message length, so writing a message does not need
+        # to slice the buffer
+        buffer = memoryview(self._buffer)
+        self._messages = [
+            buffer[:length] for length in range(_MESSAGE_LENGTH_MAX + 1)]
+
+    def _encode(self, command, arguments):
+        """
+        Get the message of a command.
+
+        Returns a precomputed message if there is one, otherwise the message
+        is packed into the shared buffer and a view of it is returned.
+        """
+        if command.message is not None:
+            return command.message
+        if command.messages is not None:
+            # the byte value, also of signed arguments
+            return command.messages[arguments[0] & 0xFF]
+        self._buffer[0] = command.opcode
+        command.request.pack_into(self._buffer, 1, *arguments)
+        return self._messages[1 + command.request.size]
+
+    def _execute(self, command, *arguments):
+        raise NotImplementedError()
+
+    def get_encoders(self, strict=False):
+        """
+        Request both left and right encoder values.
+
+        :param strict: raise an `InvalidResponseException` for a truncated
+        response, e.g. on a timeout, instead of decoding what arrived
+        """
+        if strict:
+            return self._execute(ENCODERS_BOTH_STRICT_COMMAND)
+        return self._execute(ENCODERS_BOTH_COMMAND)
 
     def get_left_encoder(self):
         """Request the left encoder value."""
-        self._serial.write(ENCODERS_LEFT)
-        response = self._serial.read(2)
-        value = int.from_bytes(response, 'big', signed=True)
-        return value
+        return self._execute(ENCODERS_LEFT_COMMAND)
 
     def get_right_encoder(self):
         """Request the right encoder value."""
-        self._serial.write(ENCODERS_RIGHT)
-        response = self._serial.read(2)
-        value = int.from_bytes(response, 'big', signed=True)
-        return value
+        return self._execute(ENCODERS_RIGHT_COMMAND)
 
     def reset_encoders(self):
         """Reset both left and right encoder counters to zero."""
-        self._serial.write(ENCODERS_RESET_BOTH)
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        # empty response can happen on a timeout, which we interpret as
-        # "not alive"
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        return self._execute(ENCODERS_RESET_BOTH_COMMAND)
 
     def reset_left_encoder(self):
         """Reset the left encoder counter to zero."""
-        self._serial.write(ENCODERS_RESET_LEFT)
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        # empty response can happen on a timeout, which we interpret as
-        # "not alive"
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        return self._execute(ENCODERS_RESET_LEFT_COMMAND)
 
     def reset_right_encoder(self):
         """Reset the right encoder counter to zero."""
-        self._serial.write(ENCODERS_RESET_RIGHT)
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        # empty response can happen on a timeout, which we interpret as
-        # "not alive"
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        return self._execute(ENCODERS_RESET_RIGHT_COMMAND)
 
     def alive(self):
         """Request an 'alive' signal from the microcontroller."""
-        self._serial.write(ALIVE)
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        # empty response can happen on a timeout, which we interpret as
-        # "not alive"
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        return self._execute(ALIVE_COMMAND)
 
     def echo(self, byte):
         """Receive back the same byte that was sent to the ATtiny."""
         if len(byte) != 1:
             raise InvalidLengthException()
-        self._serial.write(ECHO + byte)
-        response = self._serial.read(1)
-        if response != byte:
-            raise InvalidResponseException()
-        return response
+        return self._execute(ECHO_COMMAND, byte[0])
 
     def stop_motors(self):
         """Immediately stops both motors."""
-        self._serial.write(STOP_MOTORS)
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        # empty response can happen on a timeout, which we interpret as
-        # "not alive"
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        return self._execute(STOP_MOTORS_COMMAND)
 
     def set_motors(self, left, right):
         """
@@ -171,20 +328,10 @@ class AttinyProtocol(object):
         backwards, positive values turn it forwards. Zero stops the motor.
         Higher absolute values mean higher speed.
         """
-        left = _clamp(left, MOTOR_MIN, MOTOR_MAX)
-        right = _clamp(right, MOTOR_MIN, MOTOR_MAX)
-        left_bytes = left.to_bytes(1, 'big', signed=True)
-        right_bytes = right.to_bytes(1, 'big', signed=True)
-
-        self._serial.write(SET_BOTH_MOTORS + left_bytes + right_bytes)
-
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        return self._execute(
+            SET_BOTH_MOTORS_COMMAND,
+            _clamp(left, MOTOR_MIN, MOTOR_MAX),
+            _clamp(right, MOTOR_MIN, MOTOR_MAX))
 
     def set_left_motor(self, speed):
         """
@@ -195,18 +342,8 @@ class AttinyProtocol(object):
         backwards, positive values turn it forwards. Zero stops the motor.
         Higher absolute values mean higher speed.
         """
-        speed = _clamp(speed, MOTOR_MIN, MOTOR_MAX)
-        speed_bytes = speed.to_bytes(1, 'big', signed=True)
-
-        self._serial.write(SET_LEFT_MOTOR + speed_bytes)
-
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        return self._execute(
+            SET_LEFT_MOTOR_COMMAND, _clamp(speed, MOTOR_MIN, MOTOR_MAX))
 
     def set_right_motor(self, speed):
         """
@@ -217,18 +354,8 @@ class AttinyProtocol(object):
         backwards, positive values turn it forwards. Zero stops the motor.
         Higher absolute values mean higher speed.
         """
-        speed = _clamp(speed, MOTOR_MIN, MOTOR_MAX)
-        speed_bytes = speed.to_bytes(1, 'big', signed=True)
-
-        self._serial.write(SET_RIGHT_MOTOR + speed_bytes)
-
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        return self._execute(
+            SET_RIGHT_MOTOR_COMMAND, _clamp(speed, MOTOR_MIN, MOTOR_MAX))
 
     def set_pi_parameters(self, p, i, encoder_scale):
         """
@@ -238,25 +365,11 @@ class AttinyProtocol(object):
         (-32768, 32767). encoder_scale can be in the range of an unsigned 8-bit
         integer.
         """
-        p = _clamp(p, -32768, 32767)
-        i = _clamp(i, -32768, 32767)
-        encoder_scale = _clamp(encoder_scale, 0, 255)
-
-        p_encoded = p.to_bytes(2, 'big', signed=True)
-        i_encoded = i.to_bytes(2, 'big', signed=True)
-        scale_encoded = encoder_scale.to_bytes(1, 'big')
-
-        message = SET_PI_PARAMETERS + p_encoded + i_encoded + scale_encoded
-
-        self._serial.write(message)
-
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        return self._execute(
+            SET_PI_PARAMETERS_COMMAND,
+            _clamp(p, -32768, 32767),
+            _clamp(i, -32768, 32767),
+            _clamp(encoder_scale, 0, 255))
 
     FREQUENCY_MIN = 0
     FREQUENCY_MAX = 2 ** 16 - 1
@@ -277,34 +390,460 @@ class AttinyProtocol(object):
         values will be clipped.
         volume is in the range (0, 15), excessive values will be clipped.
         """
-        frequency = _clamp(frequency, self.FREQUENCY_MIN, self.FREQUENCY_MAX)
-        duration = _clamp(duration, self.DURATION_MIN, self.DURATION_MAX)
-        volume = _clamp(volume, self.VOLUME_MIN, self.VOLUME_MAX)
+        return self._execute(
+            SET_BUZZER_COMMAND,
+            _clamp(frequency, self.FREQUENCY_MIN, self.FREQUENCY_MAX),
+            _clamp(duration, self.DURATION_MIN, self.DURATION_MAX),
+            _clamp(volume, self.VOLUME_MIN, self.VOLUME_MAX))
 
-        frequency_encoded = frequency.to_bytes(2, 'big')
-        duration_encoded = duration.to_bytes(2, 'big')
-        volume_encoded = volume.to_bytes(1, 'big')
+    def stop_buzzer(self):
+        """Stop any buzzer sound."""
+        return self._execute(STOP_BUZZER_COMMAND)
 
-        message = SET_BUZZER + frequency_encoded + duration_encoded + volume_encoded
 
+class AttinyProtocol(CommandMethods):
+    """
+    Provides methods for protocol transactions.
+
+    The command methods come from `CommandMethods`; every transaction writes
+    the message and blocks until the response has been read. Responses are
+    decoded with precompiled structs.
+
+    By default, a timeout or an invalid response is reported to the caller
+    right away. If `retry_budget` is set to a number of seconds, such a
+    failed command is instead repeated after resynchronising the byte stream
+    (see `resynchronize`) until it succeeds or the budget is exhausted. The
+    number of retries is counted in `retries` (in total) and `last_retries`
+    (for the last command).
+
+    If `statistics` is set to a `raspibot.Statistics.ProtocolStatistics`
+    instance, the round-trip time and the outcome of every transaction are
+    recorded in it.
+    """
+
+    def __init__(self, serial, retry_budget=None, statistics=None):
+        """Create a protocol instance on a serial interface."""
+        super(AttinyProtocol, self).__init__()
+        self._serial = serial
+        self.retry_budget = retry_budget
+        self.statistics = statistics
+        self.retries = 0
+        self.last_retries = 0
+        self._nonce = 0
+
+    def batch(self):
+        """
+        Collect several commands and transmit them in a single transaction.
+
+        Returns a `Batch` that offers the same command methods as this
+        protocol. Use it as a context manager; when the block is left, all
+        queued commands are written at once and their responses are read
+        back with a single read::
+
+            with protocol.batch() as batch:
+                encoders = batch.get_encoders()
+                motors = batch.set_motors(10, 10)
+            print(encoders.result(), motors.result())
+        """
+        return Batch(self)
+
+    def _execute(self, command, *arguments):
+        """Send a command and decode its response."""
+        if self.retry_budget is not None:
+            return self._execute_with_retries(command, arguments)
+        if self.statistics is not None:
+            return self._execute_measured(command, arguments)
+        message = command.message
+        if message is None:
+            message = self._encode(command, arguments)
         self._serial.write(message)
+        response = self._serial.read(command.response_length)
+        return command.decode(response, arguments)
+
+    def _transact(self, command, arguments, record=True):
+        """Send a command and read its response, recording statistics."""
+        statistics = self.statistics if record else None
+        start = perf_counter_ns()
+        self._serial.write(self._encode(command, arguments))
+        response = self._serial.read(command.response_length)
+        if statistics is not None:
+            statistics.record(command, perf_counter_ns() - start, response)
+        return response
 
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+    def _execute_measured(self, command, arguments):
+        """Send a command and record the transaction in the statistics."""
+        response = self._transact(command, arguments)
+        try:
+            return command.decode(response, arguments)
+        except InvalidResponseException:
+            # truncated responses are counted as timeouts already
+            if len(response) == command.response_length:
+                self.statistics.record_invalid(command)
+            raise
+
+    def _execute_with_retries(self, command, arguments):
+        """Send a command, repeating it while it fails within the budget."""
+        deadline = monotonic() + self.retry_budget
+        retries = 0
+        # bound the duration of every read, including the first one, by the
+        # remaining budget, if the serial interface supports timeouts
+        timeout = getattr(self._serial, 'timeout', _NO_TIMEOUT_SUPPORT)
+        try:
+            while True:
+                if timeout is not _NO_TIMEOUT_SUPPORT:
+                    remaining = max(0, deadline - monotonic())
+                    self._serial.timeout = remaining if timeout is None \
+                        else min(timeout, remaining)
+                if retries:
+                    self.resynchronize()
+                # the statistics count commands, not attempts
+                response = self._transact(
+                    command, arguments, record=not retries)
+
+                if len(response) == command.response_length:
+                    try:
+                        return command.decode(response, arguments)
+                    except InvalidResponseException:
+                        if self.statistics is not None:
+                            self.statistics.record_invalid(command)
+                        if monotonic() >= deadline:
+                            raise
+                elif monotonic() >= deadline:
+                    # report the timeout just like without retries
+                    return command.decode(response, arguments)
+
+                retries += 1
+                self.retries += 1
+        finally:
+            self.last_retries = retries
+            if timeout is not _NO_TIMEOUT_SUPPORT:
+                self._serial.timeout = timeout
+
+    def resynchronize(self):
+        """
+        Bring the byte stream back in line with the commands sent.
 
-    def stop_buzzer(self):
-        """Stop any buzzer sound."""
-        self._serial.write(STOP_BUZZER)
-        
-        response = self._serial.read(1)
-        if response == ACK:
-            return True
-        elif response == NAK or response == b'':
-            return False
-        else:
-            raise InvalidResponseException()
+        After a timeout or a stray byte, responses may be shifted, so that
+        every following response would be misinterpreted. This discards any
+        pending input, sends an echo request with a fresh nonce byte and then
+        skips incoming bytes until the nonce arrives. Returns whether the
+        nonce was received.
+        """
+        reset_input_buffer = getattr(self._serial, 'reset_input_buffer', None)
+        if reset_input_buffer is not None:
+            reset_input_buffer()
+
+        nonce = self._nonce = _next_nonce(self._nonce)
+        self._serial.write(self._encode(ECHO_COMMAND, (nonce,)))
+        for _ in range(_RESYNCHRONIZATION_BYTES_MAX):
+            byte = self._serial.read(1)
+            if byte == b'':
+                return False
+            if byte[0] == nonce:
+                return True
+        return False
+
+
+class BatchResult(object):
+    """The eventual outcome of a command queued in a `Batch`."""
+
+    def __init__(self, command, arguments):
+        """Create a pending result for a command and its arguments."""
+        super(BatchResult, self).__init__()
+        self._command = command
+        self._arguments = arguments
+        self.response_length = command.response_length
+        self._done = False
+        self._value = None
+        self._exception = None
+
+    def done(self):
+        """Return whether the response for this command has been decoded."""
+        return self._done
+
+    def result(self):
+        """
+        Return the decoded response of the command.
+
+        Raises the exception that decoding the response produced, e.g. an
+        `InvalidResponseException`, or a `RuntimeError` if the batch has not
+        been transmitted yet.
+        """
+        if not self._done:
+            raise RuntimeError('batch has not been transmitted yet')
+        if self._exception is not None:
+            raise self._exception
+        return self._value
+
+    def exception(self):
+        """Return the exception raised while decoding, or None."""
+        if not self._done:
+            raise RuntimeError('batch has not been transmitted yet')
+        return self._exception
+
+    def _resolve(self, response):
+        try:
+            self._value = self._command.decode(response, self._arguments)
+        except Exception as exception:
+            self._exception = exception
+        self._done = True
+
+
+class Batch(CommandMethods):
+    """
+    Queues protocol commands and transmits them in one go.
+
+    Every command method returns a `BatchResult` instead of the decoded
+    response. `transmit` writes all queued messages with a single write, reads
+    all expected response bytes with a single read and then decodes the
+    responses in order. Leaving the `with` block transmits automatically,
+    unless the block raised an exception.
+
+    Batches are recorded in the `statistics` of the protocol, with every
+    command getting an equal share of the round-trip time of the batch. The
+    `retry_budget` of the protocol does not apply, failed commands of a
+    batch are not repeated.
+    """
+
+    def __init__(self, protocol):
+        """Create an empty batch for the serial interface of a protocol."""
+        super(Batch, self).__init__()
+        self._serial = protocol._serial
+        self.statistics = protocol.statistics
+        self._message = bytearray()
+        self._results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.transmit()
+        return False
+
+    def __len__(self):
+        return len(self._results)
+
+    def _execute(self, command, *arguments):
+        result = BatchResult(command, arguments)
+        self._message += self._encode(command, arguments)
+        self._results.append(result)
+        return result
+
+    def transmit(self):
+        """
+        Send all queued commands and decode their responses.
+
+        Returns the list of `BatchResult` objects in the order in which the
+        commands were queued. If fewer bytes than expected arrive (e.g. on a
+        timeout), the missing responses are decoded as empty or truncated
+        responses, just like for individual commands.
+        """
+        message, results = self._message, self._results
+        self._message, self._results = bytearray(), []
+        if not results:
+            return results
+
+        statistics = self.statistics
+        start = perf_counter_ns()
+        self._serial.write(message)
+        response = self._serial.read(
+            sum(result.response_length for result in results))
+        share = (perf_counter_ns() - start) // len(results)
+
+        offset = 0
+        for result in results:
+            end = offset + result.response_length
+            result._resolve(response[offset:end])
+            if statistics is not None:
+                self._record(result, share, response[offset:end])
+            offset = end
+        return results
+
+    def _record(self, result, duration, response):
+        command = result._command
+        self.statistics.record(command, duration, response)
+        # truncated responses are counted as timeouts already
+        if isinstance(result._exception, InvalidResponseException) and \
+                len(response) == command.response_length:
+            self.statistics.record_invalid(command)
+
+
+class AsyncAttinyProtocol(CommandMethods):
+    """
+    Provides the protocol transactions as coroutines on asyncio streams.
+
+    All command methods of `CommandMethods` are available and return
+    awaitables, e.g. ``await protocol.get_encoders()``. Commands are written
+    as soon as they are issued, without waiting for the responses of earlier
+    commands. Since the firmware answers strictly in order, responses are
+    matched to their commands by position in a queue of pending commands, so
+    several coroutines can issue commands concurrently.
+
+    Like a blocking serial interface, the response of the command at the
+    head of the queue is given `timeout` seconds to arrive, counted from when
+    its predecessor has been answered. A response that does not arrive in
+    time is decoded like an empty response. Since it may still arrive later,
+    the commands written before the timeout fail the same way, and the byte
+    stream is resynchronised with an echo request, like
+    `AttinyProtocol.resynchronize` does.
+    """
+
+    def __init__(self, reader, writer, timeout=1.0):
+        """Create a protocol instance on an asyncio stream reader and writer."""
+        super(AsyncAttinyProtocol, self).__init__()
+        self._reader = reader
+        self._writer = writer
+        self.timeout = timeout
+        self._pending = deque()
+        self._wakeup = None
+        self._receiver = None
+        self._nonce = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception_type, exception, traceback):
+        await self.close()
+        return False
+
+    async def _execute(self, command, *arguments):
+        loop = asyncio.get_running_loop()
+        if self._receiver is None or self._receiver.done():
+            self._wakeup = asyncio.Event()
+            self._receiver = loop.create_task(self._receive())
+
+        response = loop.create_future()
+        # no await between queueing and writing, so the order of the queue
+        # always matches the order of the messages on the wire
+        self._pending.append((response, command, arguments))
+        # the writer may keep the message around, so it must not be a view
+        # of the shared buffer
+        self._writer.write(bytes(self._encode(command, arguments)))
+        self._wakeup.set()
+
+        await self._writer.drain()
+        return await response
+
+    async def _receive(self):
+        """Read responses and hand them to the pending commands in order."""
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            response, command, arguments = self._pending[0]
+            data = await self._read(command.response_length)
+            if data is None:
+                # the response may still arrive and would be taken for the
+                # ones of the following commands, so these fail as well
+                while self._pending:
+                    self._resolve(*self._pending.popleft(), b'')
+                await self._resynchronize()
+                continue
+            self._resolve(*self._pending.popleft(), data)
+
+    def _resolve(self, response, command, arguments, data):
+        # the command may have been cancelled while waiting
+        if response.done():
+            return
+        try:
+            response.set_result(command.decode(data, arguments))
+        except Exception as exception:
+            response.set_exception(exception)
+
+    async def _read(self, length):
+        """
+        Read a number of bytes within the timeout.
+
+        :returns the bytes, fewer if the stream has ended, or None if the
+        timeout expired
+        """
+        read = asyncio.ensure_future(self._reader.readexactly(length))
+        try:
+            await asyncio.wait((read,), timeout=self.timeout)
+            if not read.done():
+                # after the event loop has been blocked, the timeout may
+                # expire before the data that has arrived meanwhile is
+                # handed over
+                await asyncio.sleep(0)
+            if not read.done():
+                # bytes already received stay in the reader's buffer; the
+                # reader must stop waiting before it can be read again
+                read.cancel()
+                await asyncio.wait((read,))
+                return None
+        finally:
+            read.cancel()
+        try:
+            return read.result()
+        except asyncio.IncompleteReadError as error:
+            # the stream has ended
+            return error.partial
+
+    async def _resynchronize(self):
+        """Skip incoming bytes up to the echo of a fresh nonce byte."""
+        nonce = self._nonce = _next_nonce(self._nonce)
+        self._writer.write(bytes(self._encode(ECHO_COMMAND, (nonce,))))
+        for _ in range(_RESYNCHRONIZATION_BYTES_MAX):
+            byte = await self._read(1)
+            if not byte or byte[0] == nonce:
+                return
+
+    async def close(self):
+        """Cancel all pending commands and close the stream writer."""
+        if self._receiver is not None:
+            self._receiver.cancel()
+            try:
+                await self._receiver
+            except asyncio.CancelledError:
+                pass
+            self._receiver = None
+
+        while self._pending:
+            response = self._pending.popleft()[0]
+            response.cancel()
+
+        self._writer.close()
+        await self._writer.wait_closed()
+
+
+async def open_serial_connection(port, baudrate=9600):
+    """
+    Open a serial device (tty or pty) as a pair of asyncio streams.
+
+    The device is switched to raw mode with the given baud rate. Returns a
+    `(reader, writer)` tuple suitable for `AsyncAttinyProtocol`.
+    """
+    speed = getattr(termios, 'B{0:d}'.format(baudrate), None)
+    if speed is None:
+        raise ValueError('unsupported baud rate: {0}'.format(baudrate))
+
+    fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attributes = termios.tcgetattr(fd)
+        attributes[4] = attributes[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attributes)
+        # the read and write transports each close their own descriptor
+        write_fd = os.dup(fd)
+    except Exception:
+        os.close(fd)
+        raise
+
+    loop = asyncio.get_running_loop()
+
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader),
+        os.fdopen(fd, 'rb', buffering=0))
+
+    # the writer gets a protocol with a separate, unused reader, as a stream
+    # reader can only be attached to a single transport
+    transport, protocol = await loop.connect_write_pipe(
+        lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()),
+        os.fdopen(write_fd, 'wb', buffering=0))
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+
+    return reader, writer
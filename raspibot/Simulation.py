@@ -0,0 +1,615 @@
+"""Simulates the RaspiBot's I2C and GPIO hardware, for use off the robot."""
+
+import errno
+import math
+import threading
+from time import monotonic, perf_counter
+
+import numpy as np
+
+# flag of smbus2's i2c_msg for messages reading from the device
+_I2C_M_RD = 0x0001
+
+
+def _swap_bytes_16bit(value):
+    return ((value & 0xFF) << 8) | ((value & 0xFF00) >> 8)
+
+
+def _signed_16bit(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def constant(volts):
+    """Get a waveform with a constant voltage."""
+    return lambda time: volts
+
+
+def sine(amplitude, frequency, offset=0.0, phase=0.0):
+    """
+    Get a sine waveform.
+
+    :param amplitude: the amplitude in volts
+    :param frequency: the frequency in Hz
+    :param offset: the voltage the sine oscillates around
+    :param phase: the phase at time 0, in radians
+    """
+    return lambda time: offset + amplitude * math.sin(
+        2 * math.pi * frequency * time + phase)
+
+
+def recorded(times, volts, loop=True):
+    """
+    Get a waveform replaying recorded samples.
+
+    The voltage is interpolated linearly between the samples. If `loop` is
+    set, the recording starts over after its last sample, otherwise the last
+    voltage is held.
+
+    :param times: the times of the samples in seconds, ascending
+    :param volts: the voltages of the samples
+    """
+    times = np.asarray(times, dtype=np.float64)
+    volts = np.asarray(volts, dtype=np.float64)
+    if len(times) == 0 or len(times) != len(volts):
+        raise ValueError('times and volts must have the same, non-zero length')
+    start = times[0]
+    duration = times[-1] - start
+
+    def waveform(time):
+        time -= start
+        if loop and duration > 0:
+            time %= duration
+        return float(np.interp(time + start, times, volts))
+
+    return waveform
+
+
+class SimulatedADS1015(object):
+    """
+    Emulates the registers and timing of a TI ADS1015.
+
+    The inputs AIN0 to AIN3 follow `waveforms`, functions of the time in
+    seconds since the creation of the chip returning volts; unconnected
+    inputs are at 0 V. A single-shot conversion takes one period of the
+    configured data rate, continuous conversions complete once per period.
+    The conversion register, the OS bit and the ALERT/RDY pin change when a
+    conversion completes, including the conversion-ready signal and the
+    traditional and window comparators with queue and latch.
+
+    The registers are accessed with `read_register` and `write_register` in
+    the chip's big-endian byte order; `SimulatedSMBus` makes them available
+    over a bus. Conversions complete on a background thread, which also
+    drives the ALERT/RDY pin, so call `close` when the chip is no longer
+    used.
+    """
+
+    CONVERSION_REGISTER = 0b00
+    CONFIG_REGISTER = 0b01
+    LO_THRESH_REGISTER = 0b10
+    HI_THRESH_REGISTER = 0b11
+
+    # the power-on values of the registers
+    DEFAULT_CONFIG = 0x8583
+    DEFAULT_LO_THRESH = 0x8000
+    DEFAULT_HI_THRESH = 0x7FFF
+
+    # the inputs measured for each mux setting, as (positive, negative)
+    _MUX_INPUTS = [(0, 1), (0, 3), (1, 3), (2, 3),
+                   (0, None), (1, None), (2, None), (3, None)]
+    _FULL_SCALES = [6.144, 4.096, 2.048, 1.024, 0.512, 0.256, 0.256, 0.256]
+    _DATA_RATES = [128, 250, 490, 920, 1600, 2400, 3300, 3300]
+
+    def __init__(self, waveforms=None, clock=monotonic):
+        """
+        Create a chip in its power-on state.
+
+        :param waveforms: a dict with a waveform by input index
+        :param clock: the time source in seconds
+        """
+        super(SimulatedADS1015, self).__init__()
+        self.waveforms = dict(waveforms) if waveforms is not None else {}
+        self._clock = clock
+        self._start = clock()
+        self._registers = [0, self.DEFAULT_CONFIG,
+                           self.DEFAULT_LO_THRESH, self.DEFAULT_HI_THRESH]
+        # time at which the running conversion completes, None if idle
+        self._completion = None
+        self._asserted = False
+        # number of successive conversions beyond the thresholds
+        self._exceeded = 0
+        self._listeners = []
+        self.conversions = 0
+
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name='SimulatedADS1015', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def connect(self, listener):
+        """
+        Call `listener` with the level of the ALERT/RDY pin when it changes.
+
+        Listeners are called on the chip's background thread, and once
+        immediately with the current level.
+        """
+        with self._condition:
+            self._listeners.append(listener)
+            level = self._level()
+        listener(level)
+
+    def read_register(self, register):
+        """Read a 16-bit register."""
+        register &= 0b11
+        with self._condition:
+            if register == self.CONFIG_REGISTER:
+                value = self._registers[register] & 0x7FFF
+                if self._completion is None:
+                    value |= 0x8000
+                return value
+            value = self._registers[register]
+            if register == self.CONVERSION_REGISTER and self._asserted \
+                    and self._latching() and not self._conversion_ready():
+                # reading the conversion register releases a latched alert
+                self._asserted = False
+                changes = [self._level()]
+            else:
+                changes = []
+        self._notify(changes)
+        return value
+
+    def write_register(self, register, value):
+        """Write a 16-bit register."""
+        register &= 0b11
+        value &= 0xFFFF
+        if register == self.CONVERSION_REGISTER:
+            # the conversion register is read-only
+            return
+        with self._condition:
+            before = self._level()
+            if register != self.CONFIG_REGISTER:
+                self._registers[register] = value
+            else:
+                was_continuous = self._continuous()
+                self._registers[register] = value & 0x7FFF
+                if self._continuous():
+                    self._completion = self._clock() + self._period()
+                elif was_continuous:
+                    # leaving continuous mode powers the chip down
+                    self._completion = None
+                if not self._continuous() and value & 0x8000 \
+                        and self._completion is None:
+                    self._completion = self._clock() + self._period()
+                    if self._conversion_ready():
+                        # the pin signals the end of the new conversion
+                        self._asserted = False
+            level = self._level()
+            self._condition.notify()
+        self._notify([level] if level != before else [])
+
+    def time(self):
+        """Get the time since the creation of the chip, in seconds."""
+        return self._clock() - self._start
+
+    def _continuous(self):
+        return not self._registers[self.CONFIG_REGISTER] & (1 << 8)
+
+    def _period(self):
+        config = self._registers[self.CONFIG_REGISTER]
+        return 1.0 / self._DATA_RATES[(config >> 5) & 0b111]
+
+    def _latching(self):
+        return bool(self._registers[self.CONFIG_REGISTER] & (1 << 2))
+
+    def _queue(self):
+        return self._registers[self.CONFIG_REGISTER] & 0b11
+
+    def _conversion_ready(self):
+        return self._registers[self.HI_THRESH_REGISTER] & 0x8000 \
+            and not self._registers[self.LO_THRESH_REGISTER] & 0x8000
+
+    def _level(self):
+        if self._queue() == 0b11:
+            # the comparator is disabled and the pin pulled up
+            return 1
+        active_high = bool(self._registers[self.CONFIG_REGISTER] & (1 << 3))
+        return int(self._asserted == active_high)
+
+    def _sample(self):
+        """Convert the current input voltage to a conversion value."""
+        config = self._registers[self.CONFIG_REGISTER]
+        positive, negative = self._MUX_INPUTS[(config >> 12) & 0b111]
+        time = self.time()
+        volts = self._voltage(positive, time)
+        if negative is not None:
+            volts -= self._voltage(negative, time)
+        full_scale = self._FULL_SCALES[(config >> 9) & 0b111]
+        value = int(round(volts / full_scale * 2 ** 11))
+        value = max(-2 ** 11, min(2 ** 11 - 1, value))
+        return (value << 4) & 0xFFFF
+
+    def _voltage(self, channel, time):
+        waveform = self.waveforms.get(channel)
+        return 0.0 if waveform is None else waveform(time)
+
+    def _complete(self):
+        """Finish the running conversion and get the levels of the pin."""
+        value = self._sample()
+        self._registers[self.CONVERSION_REGISTER] = value
+        self.conversions += 1
+        if self._continuous():
+            self._completion += self._period()
+        else:
+            self._completion = None
+
+        before = self._level()
+        if self._queue() == 0b11:
+            return []
+        if self._conversion_ready():
+            self._asserted = True
+            if self._continuous():
+                # the pin only pulses briefly in continuous mode
+                self._asserted = False
+                return [self._level() ^ 1, self._level()]
+            return [self._level()] if self._level() != before else []
+
+        value = _signed_16bit(value)
+        low = _signed_16bit(self._registers[self.LO_THRESH_REGISTER])
+        high = _signed_16bit(self._registers[self.HI_THRESH_REGISTER])
+        window = self._registers[self.CONFIG_REGISTER] & (1 << 4)
+        if window:
+            exceeded = value > high or value < low
+        else:
+            exceeded = value > high
+        self._exceeded = self._exceeded + 1 if exceeded else 0
+
+        if self._exceeded >= (1 << self._queue()):
+            self._asserted = True
+        elif not self._latching():
+            if window and not exceeded:
+                self._asserted = False
+            elif not window and value < low:
+                self._asserted = False
+        level = self._level()
+        return [level] if level != before else []
+
+    def _notify(self, levels):
+        for level in levels:
+            for listener in list(self._listeners):
+                listener(level)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+                if self._completion is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._completion - self._clock()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                levels = self._complete()
+            self._notify(levels)
+
+
+class SimulatedSMBus(object):
+    """
+    Connects simulated chips to the SMBus interface of the ADC driver.
+
+    Offers `read_word_data` and `write_word_data` like `smbus.SMBus`,
+    including the little-endian byte order of SMBus words, and `i2c_rdwr`
+    like `smbus2.SMBus` for combined transactions of `i2c_msg` messages.
+    `transactions` counts the kernel round trips a real bus would need.
+    """
+
+    def __init__(self, devices=None):
+        """
+        Create a bus.
+
+        :param devices: a dict with the simulated chips by bus address
+        """
+        super(SimulatedSMBus, self).__init__()
+        self.devices = dict(devices) if devices is not None else {}
+        # the register pointer of each chip
+        self._pointers = {}
+        self.transactions = 0
+
+    def _device(self, address):
+        device = self.devices.get(address)
+        if device is None:
+            # the chip does not acknowledge its address
+            raise OSError(errno.EREMOTEIO, 'Remote I/O error')
+        return device
+
+    def read_word_data(self, address, register):
+        self.transactions += 1
+        device = self._device(address)
+        self._pointers[address] = register
+        return _swap_bytes_16bit(device.read_register(register))
+
+    def write_word_data(self, address, register, value):
+        self.transactions += 1
+        device = self._device(address)
+        self._pointers[address] = register
+        device.write_register(register, _swap_bytes_16bit(value))
+
+    def i2c_rdwr(self, *messages):
+        self.transactions += 1
+        for message in messages:
+            device = self._device(message.addr)
+            if message.flags & _I2C_M_RD:
+                value = device.read_register(self._pointers.get(message.addr, 0))
+                data = value.to_bytes(2, 'big')
+                for index in range(message.len):
+                    message.buf[index] = data[index] if index < 2 else 0xFF
+            else:
+                data = bytes(message)
+                if not data:
+                    continue
+                self._pointers[message.addr] = data[0]
+                if len(data) >= 3:
+                    device.write_register(
+                        data[0], int.from_bytes(data[1:3], 'big'))
+
+
+class SimulatedGPIO(object):
+    """
+    Emulates the parts of `RPi.GPIO` used by the drivers.
+
+    Pass an instance instead of the module, e.g. as the `gpio` argument of
+    `ADS1015`. Output levels are kept in `levels`, and every change is
+    reported to the functions registered with `add_output_listener`. Input
+    levels are driven from outside with `set_input` or by a connected chip,
+    and edge detection callbacks are called on the thread that changes the
+    level. `writes` counts the calls of `output`.
+    """
+
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        """Create a GPIO interface with all pins unconfigured."""
+        super(SimulatedGPIO, self).__init__()
+        self.mode = None
+        self.levels = {}
+        self.directions = {}
+        self._driven = {}
+        self._detections = {}
+        self._output_listeners = []
+        self._lock = threading.RLock()
+        self.writes = 0
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        for pin in _pins(channel):
+            self.directions[pin] = direction
+            if direction == self.OUT:
+                self.levels[pin] = int(bool(initial))
+            elif pin in self._driven:
+                self.levels[pin] = self._driven[pin]
+            else:
+                self.levels[pin] = int(pull_up_down == self.PUD_UP)
+
+    def output(self, channel, value):
+        pins = _pins(channel)
+        values = value if isinstance(value, (list, tuple)) \
+            else [value] * len(pins)
+        if len(values) != len(pins):
+            raise RuntimeError('Number of channels != number of values')
+        self.writes += 1
+        for pin, level in zip(pins, values):
+            if self.directions.get(pin) != self.OUT:
+                raise RuntimeError(
+                    'The GPIO channel has not been set up as an OUTPUT')
+            level = int(bool(level))
+            if self.levels.get(pin) != level:
+                self.levels[pin] = level
+                for listener in self._output_listeners:
+                    listener(pin, level)
+
+    def input(self, channel):
+        return self.levels.get(channel, 0)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        with self._lock:
+            if channel in self._detections:
+                raise RuntimeError(
+                    'Conflicting edge detection already enabled for this '
+                    'GPIO channel')
+            self._detections[channel] = (edge, [] if callback is None
+                                         else [callback])
+
+    def add_event_callback(self, channel, callback):
+        with self._lock:
+            if channel not in self._detections:
+                raise RuntimeError(
+                    'Add event detection using add_event_detect first before '
+                    'adding a callback')
+            self._detections[channel][1].append(callback)
+
+    def remove_event_detect(self, channel):
+        with self._lock:
+            self._detections.pop(channel, None)
+
+    def cleanup(self, channel=None):
+        pins = list(self.directions) if channel is None else _pins(channel)
+        for pin in pins:
+            self.directions.pop(pin, None)
+            self._detections.pop(pin, None)
+
+    def set_input(self, channel, level):
+        """Drive an input pin from outside and fire its edge detection."""
+        level = int(bool(level))
+        with self._lock:
+            self._driven[channel] = level
+            previous = self.levels.get(channel)
+            self.levels[channel] = level
+            if previous is None or previous == level:
+                return
+            edge, callbacks = self._detections.get(channel, (None, ()))
+            rising = level == 1
+            if edge == self.BOTH or edge == (
+                    self.RISING if rising else self.FALLING):
+                callbacks = list(callbacks)
+            else:
+                callbacks = []
+        for callback in callbacks:
+            callback(channel)
+
+    def connect(self, channel, chip):
+        """Drive an input pin with the ALERT/RDY pin of a simulated chip."""
+        chip.connect(lambda level: self.set_input(channel, level))
+
+    def add_output_listener(self, listener):
+        """Call `listener` with the pin and level of every output change."""
+        self._output_listeners.append(listener)
+
+
+class SimulatedHD44780(object):
+    """
+    Emulates an HD44780 LCD controller connected over a 4-bit interface.
+
+    Listens to the output pins of a `SimulatedGPIO` and decodes a nibble on
+    every falling edge of the enable pin. Starts in 8-bit mode like after
+    power-on, so the driver's initialisation sequence switches it to 4-bit
+    mode. Implements the instructions that change the display data and
+    character generator RAM; `line` returns what a display with 16 columns
+    shows.
+
+    The busy flag is not emulated, `set_ready` lets the D7 pin read as high
+    when the driver polls it. Instead, `violations` counts the bytes that
+    started before the previous one could have been executed, with the
+    nominal execution times of the datasheet.
+    """
+
+    _INSTRUCTION_TIME = 37e-6
+    _CLEAR_TIME = 1.52e-3
+
+    # the DDRAM addresses of the lines
+    _LINE_ADDRESSES = (0x00, 0x40)
+
+    def __init__(self, gpio, register_select=17, rw=18, enable=27,
+                 data=(6, 5, 7, 8), clock=perf_counter):
+        """
+        Connect a controller to the pins of a simulated GPIO interface.
+
+        :param data: the pins of D7, D6, D5 and D4, in this order
+        :param clock: the time source in seconds
+        """
+        super(SimulatedHD44780, self).__init__()
+        self._clock = clock
+        self._busy_until = 0.0
+        self.violations = 0
+        self._gpio = gpio
+        self._register_select = register_select
+        self._rw = rw
+        self._enable = enable
+        self._data = list(data)
+        self.ddram = bytearray(b' ' * 0x80)
+        self.cgram = bytearray(64)
+        self.address = 0
+        self.cgram_selected = False
+        self.increment = 1
+        self.eight_bit = True
+        self._high_nibble = None
+        # the bytes written as data and as instructions
+        self.data_writes = 0
+        self.instructions = 0
+        gpio.add_output_listener(self._output)
+
+    def set_ready(self):
+        """Let the D7 pin read as high while it is an input."""
+        self._gpio.set_input(self._data[0], 1)
+
+    def line(self, y):
+        """Get the characters shown on a line as bytes."""
+        address = self._LINE_ADDRESSES[y]
+        return bytes(self.ddram[address:address + 16])
+
+    def glyph(self, number):
+        """Get the eight rows of a custom character."""
+        return bytes(self.cgram[8 * number:8 * number + 8])
+
+    def _output(self, pin, level):
+        if pin != self._enable or level != 0:
+            return
+        levels = self._gpio.levels
+        if levels.get(self._rw):
+            return
+        nibble = 0
+        for data_pin in self._data:
+            nibble = (nibble << 1) | levels.get(data_pin, 0)
+        data = bool(levels.get(self._register_select))
+
+        if self._high_nibble is None and self._clock() < self._busy_until:
+            self.violations += 1
+        if self.eight_bit:
+            # only D7 to D4 are connected, D3 to D0 read as low
+            self._execute(data, nibble << 4)
+        elif self._high_nibble is None:
+            self._high_nibble = nibble
+        else:
+            byte = (self._high_nibble << 4) | nibble
+            self._high_nibble = None
+            self._execute(data, byte)
+
+    def _execute(self, data, byte):
+        slow = not data and byte in (0x01, 0x02, 0x03)
+        self._busy_until = self._clock() + (
+            self._CLEAR_TIME if slow else self._INSTRUCTION_TIME)
+        if data:
+            self.data_writes += 1
+            if self.cgram_selected:
+                self.cgram[self.address % 64] = byte
+            else:
+                self.ddram[self.address % 0x80] = byte
+            self.address += self.increment
+            return
+
+        self.instructions += 1
+        if byte & 0x80:
+            self.address = byte & 0x7F
+            self.cgram_selected = False
+        elif byte & 0x40:
+            self.address = byte & 0x3F
+            self.cgram_selected = True
+        elif byte & 0x20:
+            self.eight_bit = bool(byte & 0x10)
+        elif byte & 0x04 and not byte & 0x18:
+            self.increment = 1 if byte & 0x02 else -1
+        elif byte & 0x02 and not byte & 0xFC:
+            self.address = 0
+            self.cgram_selected = False
+        elif byte == 0x01:
+            self.ddram[:] = b' ' * len(self.ddram)
+            self.address = 0
+            self.cgram_selected = False
+            self.increment = 1
+
+
+def _pins(channel):
+    return list(channel) if isinstance(channel, (list, tuple)) else [channel]
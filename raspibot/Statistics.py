@@ -0,0 +1,183 @@
+"""Collects latency statistics of serial protocol transactions."""
+
+from .Serial import NAK
+
+
+class LatencyHistogram(object):
+    """
+    Counts durations in a fixed set of logarithmic buckets.
+
+    Works like an HDR histogram: every power of two is split into
+    `2 ** (significant_bits - 1)` equally wide buckets, so the relative error
+    of a reported value is below `2 ** -(significant_bits - 1)` over the
+    whole range from zero to `highest`. Values above `highest` are counted in
+    the last bucket. All buckets are allocated up front, so recording a value
+    only increments a counter.
+    """
+
+    def __init__(self, significant_bits=5, highest=2 ** 36):
+        """
+        Create an empty histogram.
+
+        With the default arguments, values are nanoseconds, resolved to about
+        6 % and up to about 68 seconds.
+        """
+        super(LatencyHistogram, self).__init__()
+        self._bits = significant_bits
+        self._linear = 2 ** significant_bits
+        self._half = self._linear // 2
+        self.highest = highest
+        self._counts = [0] * (self._index(highest) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self._linear:
+            return value
+        exponent = value.bit_length() - self._bits
+        return self._linear + (exponent - 1) * self._half \
+            + (value >> exponent) - self._half
+
+    def _upper_bound(self, index):
+        """Get the highest value counted in a bucket."""
+        if index < self._linear:
+            return index
+        exponent, offset = divmod(index - self._linear, self._half)
+        exponent += 1
+        return ((self._half + offset + 1) << exponent) - 1
+
+    def record(self, value):
+        """Count a non-negative integer value."""
+        if value > self.highest:
+            self._counts[-1] += 1
+        else:
+            self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def mean(self):
+        """Get the mean of all values, or None if empty."""
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def percentile(self, percentile):
+        """
+        Get the value below or at which the given percentage of values lie.
+
+        The result is the upper bound of the bucket containing the value, but
+        never more than the largest value recorded. Values in the overflow
+        bucket are reported as the largest value. Returns None if empty.
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, -(-self.count * percentile // 100))
+        last = len(self._counts) - 1
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                if index == last:
+                    break
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+    def reset(self):
+        """Forget all recorded values."""
+        self._counts = [0] * len(self._counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+
+class CommandStatistics(object):
+    """Latencies and failures of one protocol command."""
+
+    def __init__(self):
+        """Create empty statistics."""
+        super(CommandStatistics, self).__init__()
+        self.latency = LatencyHistogram()
+        self.timeouts = 0
+        self.naks = 0
+        self.invalid = 0
+
+    def snapshot(self):
+        """Get the statistics as a dict, latencies in microseconds."""
+        latency = self.latency
+
+        def microseconds(value):
+            return None if value is None else value / 1000
+
+        return {
+            'count': latency.count,
+            'mean': microseconds(latency.mean()),
+            'p50': microseconds(latency.percentile(50)),
+            'p99': microseconds(latency.percentile(99)),
+            'max': microseconds(latency.max),
+            'timeouts': self.timeouts,
+            'naks': self.naks,
+            'invalid': self.invalid,
+        }
+
+
+class ProtocolStatistics(object):
+    """
+    Collects round-trip times and failures per protocol command.
+
+    Pass an instance to `AttinyProtocol` to enable instrumentation. A
+    response that is shorter than expected (typically empty) is counted as a
+    timeout, and responses that raise an `InvalidResponseException` are
+    counted as invalid, including those that were recovered from by a retry.
+    """
+
+    def __init__(self):
+        """Create empty statistics."""
+        super(ProtocolStatistics, self).__init__()
+        self.commands = {}
+
+    def _statistics(self, command):
+        statistics = self.commands.get(command.name)
+        if statistics is None:
+            statistics = self.commands[command.name] = CommandStatistics()
+        return statistics
+
+    def record(self, command, duration, response):
+        """Count a transaction with its duration in nanoseconds."""
+        statistics = self._statistics(command)
+        statistics.latency.record(duration)
+        if len(response) < command.response_length:
+            statistics.timeouts += 1
+        elif response == NAK and command.response_length == 1:
+            statistics.naks += 1
+
+    def record_invalid(self, command):
+        """Count an invalid response."""
+        self._statistics(command).invalid += 1
+
+    def reset(self):
+        """Forget all recorded transactions."""
+        self.commands = {}
+
+    def snapshot(self):
+        """Get the statistics of all commands as a dict by command name."""
+        return {name: statistics.snapshot()
+                for name, statistics in sorted(self.commands.items())}
+
+    def text(self):
+        """Format the statistics of all commands as a table."""
+        lines = ['{0:<20} {1:>8} {2:>10} {3:>10} {4:>10} {5:>8} {6:>6} '
+                 '{7:>7}'.format('command', 'count', 'p50/us', 'p99/us',
+                                 'max/us', 'timeouts', 'naks', 'invalid')]
+        for name, snapshot in self.snapshot().items():
+            lines.append(
+                '{0:<20} {count:>8d} {p50:>10.1f} {p99:>10.1f} {max:>10.1f} '
+                '{timeouts:>8d} {naks:>6d} {invalid:>7d}'.format(
+                    name, **snapshot))
+        return '\n'.join(lines)
@@ -17,6 +17,8 @@ setup(
 
         packages=['raspibot'],
 
-        # there's no functionality yet, so no dependencies either
-        install_requires=[]
+        install_requires=['numpy'],
+
+        # combined I2C transactions for the ADC
+        extras_require={'i2c': ['smbus2']}
 )
@@ -0,0 +1,15 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def wait_for():
+    """Poll a condition until it holds or a timeout expires."""
+    def wait_for(condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.001)
+    return wait_for
+
+# flake8: noqa
@@ -0,0 +1,460 @@
+from raspibot.ADC import (
+    ADCGroup, ADS1015, I2CBackend, SMBusBackend, ThresholdEvent, bus_backend,
+    bus_lock)
+from raspibot.Simulation import (
+    SimulatedADS1015, SimulatedGPIO, SimulatedSMBus, constant)
+
+import threading
+import time
+
+import pytest
+
+
+class Setup:
+
+    def __init__(self, **arguments):
+        self.chip = SimulatedADS1015({
+            0: constant(1.0),
+            1: constant(2.0),
+            2: constant(-0.1),
+            3: constant(0.5)})
+        self.bus = SimulatedSMBus({0x49: self.chip})
+        self.gpio = SimulatedGPIO()
+        self.gpio.connect(ADS1015.alrt, self.chip)
+        arguments.setdefault('backend', SMBusBackend(self.bus))
+        self.adc = ADS1015(self.bus, gpio=self.gpio, **arguments)
+
+    def close(self):
+        self.adc.close()
+        self.chip.close()
+
+
+@pytest.fixture
+def setup():
+    setup = Setup()
+    yield setup
+    setup.close()
+
+
+def test_configuration(setup):
+    adc = setup.adc
+
+    assert adc.interrupts_enabled()
+    assert adc.gain() == 4.096
+    assert adc.data_rate() == 1600
+    assert adc.config_register() == setup.chip.read_register(1) & 0x7FFF
+
+def test_shadow_config(setup):
+    adc = setup.adc
+    setup.bus.transactions = 0
+
+    assert adc.read_channel(0) == 500
+    # the start of the conversion and the read of its result, but no read of
+    # the config register
+    assert setup.bus.transactions == 2
+    assert adc.config_register() == setup.chip.read_register(1) & 0x7FFF
+    assert setup.bus.transactions == 2
+
+def test_invalidate_config(setup):
+    adc = setup.adc
+    # change the data rate to 128 SPS behind the driver's back
+    setup.chip.write_register(1, adc.config_register() & ~0x00E0)
+
+    assert adc.data_rate() == 1600
+    adc.invalidate_config()
+    assert adc.data_rate() == 128
+    assert adc.read_config_register() & 0x7FFF == adc.config_register()
+
+def test_invalid_configuration(setup):
+    with pytest.raises(ValueError):
+        ADS1015(setup.bus, gpio=setup.gpio, gain=3.0)
+    with pytest.raises(ValueError):
+        setup.adc.set_data_rate(1000)
+
+def test_read_channel(setup):
+    adc = setup.adc
+
+    assert adc.read_channel(0) == 500
+    assert adc.read_channel(1) == 1000
+    assert adc.read_channel(4) is None
+    assert adc.read_voltage(2) == pytest.approx(-0.1)
+
+def test_read_channel_waits_for_the_conversion(setup):
+    adc = setup.adc
+    adc.set_data_rate(128)
+
+    before = time.monotonic()
+    adc.read_channel(3)
+    assert time.monotonic() - before >= 1 / 128
+
+def test_conversion_ready_configuration(setup):
+    chip = setup.chip
+
+    assert chip.read_register(chip.LO_THRESH_REGISTER) == 0x0000
+    assert chip.read_register(chip.HI_THRESH_REGISTER) == 0x8000
+    # active high, asserted after every conversion
+    assert chip.read_register(chip.CONFIG_REGISTER) & 0x000B == 0x0008
+    assert setup.adc.conversion_time(128) == pytest.approx(1.1 / 128 + 25e-6)
+
+def test_interrupt_ends_the_wait(setup):
+    adc = setup.adc
+    adc.set_data_rate(128)
+
+    before = time.monotonic()
+    adc.read_channel(0)
+    # woken up by the ALERT/RDY pin, not by the timeout of twice the
+    # conversion time
+    assert time.monotonic() - before < 1.5 * adc.conversion_time()
+
+def test_close_releases_the_alert_pin(setup):
+    setup.adc.close()
+
+    assert not setup.adc.interrupts_enabled()
+    setup.gpio.add_event_detect(ADS1015.alrt, setup.gpio.RISING)
+    # reads fall back to waiting for the conversion time
+    assert setup.adc.read_channel(0) == 500
+
+def test_read_channel_without_interrupts():
+    setup = Setup()
+    # let edge detection fail, like with another user of the pin
+    gpio = SimulatedGPIO()
+    gpio.add_event_detect(ADS1015.alrt, gpio.RISING)
+    gpio.connect(ADS1015.alrt, setup.chip)
+    adc = ADS1015(setup.bus, gpio=gpio, backend=SMBusBackend(setup.bus))
+    try:
+        assert not adc.interrupts_enabled()
+        assert adc.read_channel(0) == 500
+    finally:
+        setup.close()
+
+def test_gain(setup):
+    adc = setup.adc
+    adc.set_gain(1.024)
+
+    assert adc.read_channel(0) == 2000
+    assert adc.read_channel(1) == 2047
+    assert adc.read_voltage(0) == pytest.approx(1.0)
+
+@pytest.mark.parametrize('gain', ADS1015.GAINS)
+def test_every_gain(setup, gain):
+    adc = setup.adc
+    adc.set_gain(gain)
+
+    assert adc.gain() == gain
+    assert adc.read_channel(3) == min(2047, round(0.5 / gain * 2048))
+
+@pytest.mark.parametrize('data_rate', ADS1015.DATA_RATES)
+def test_every_data_rate(setup, data_rate):
+    adc = setup.adc
+    adc.set_data_rate(data_rate)
+
+    assert adc.data_rate() == data_rate
+    assert setup.chip.read_register(1) & 0x00E0 == \
+        ADS1015.DATA_RATES.index(data_rate) << 5
+    assert adc.read_channel(1) == 1000
+
+def test_to_voltage(setup):
+    adc = setup.adc
+
+    assert adc.to_voltage(1000) == pytest.approx(2.0)
+    # negative values in 12-bit two's complement
+    assert adc.to_voltage(0xFFF) == pytest.approx(-4.096 / 2048)
+    assert adc.to_voltage(0x800) == pytest.approx(-4.096)
+
+class WordBus(object):
+    """An SMBus without combined transactions, like `smbus.SMBus`."""
+
+    def __init__(self, bus):
+        self.read_word_data = bus.read_word_data
+        self.write_word_data = bus.write_word_data
+
+def test_bus_backend(setup):
+    assert isinstance(bus_backend(WordBus(setup.bus)), SMBusBackend)
+
+def test_smbus_backend(setup):
+    backend = SMBusBackend(setup.bus)
+    assert backend.lock is bus_lock(setup.bus)
+
+    # the chip's registers are big-endian, SMBus words little-endian
+    backend.write_register(0x49, 2, 0x1234)
+    assert setup.chip.read_register(2) == 0x1234
+    assert setup.bus.read_word_data(0x49, 2) == 0x3412
+    assert backend.read_register(0x49, 2) == 0x1234
+
+    assert backend.read_and_write_register(0x49, 2, 3, 0x5678) == 0x1234
+    assert backend.read_register(0x49, 3) == 0x5678
+
+def test_i2c_backend(setup):
+    pytest.importorskip('smbus2')
+    backend = I2CBackend(setup.bus)
+    assert isinstance(bus_backend(setup.bus), I2CBackend)
+
+    setup.bus.transactions = 0
+    backend.write_register(0x49, 2, 0x1234)
+    assert backend.read_register(0x49, 2) == 0x1234
+    assert backend.read_and_write_register(0x49, 2, 3, 0x5678) == 0x1234
+    assert setup.chip.read_register(3) == 0x5678
+    assert setup.bus.transactions == 3
+
+def test_read_channels(setup):
+    setup.bus.transactions = 0
+
+    assert setup.adc.read_channels([3, 0, 1]) == [250, 500, 1000]
+    # one write to start, a read and a write to start the next conversion
+    # for all but the last channel, one read for that
+    assert setup.bus.transactions == 6
+    assert setup.adc.read_channels([]) == []
+    assert setup.adc.read_channels([0, 5]) is None
+
+def test_read_channels_with_combined_transactions():
+    pytest.importorskip('smbus2')
+    setup = Setup(backend=None)
+    try:
+        assert isinstance(setup.adc.backend(), I2CBackend)
+        setup.bus.transactions = 0
+        assert setup.adc.read_channels([3, 0, 1]) == [250, 500, 1000]
+        # one write to start, one combined read and start per channel
+        assert setup.bus.transactions == 4
+    finally:
+        setup.close()
+
+def test_stream(setup):
+    adc = setup.adc
+    config = adc.config_register()
+
+    samples = list(adc.stream(1, data_rate=3300, count=10))
+    assert [value for _, value in samples] == [1000] * 10
+    assert all(b[0] > a[0] for a, b in zip(samples, samples[1:]))
+    # single-shot mode is restored
+    assert adc.config_register() == config
+
+def test_stream_at_the_data_rate(setup):
+    adc = setup.adc
+
+    samples = list(adc.stream(3, data_rate=490, count=20))
+    assert [value for _, value in samples] == [250] * 20
+    # the chip sets the pace, within the tolerance of its oscillator
+    elapsed = samples[-1][0] - samples[0][0]
+    assert elapsed == pytest.approx(19 / 490, rel=0.3)
+    assert setup.chip.conversions >= 20
+
+def test_stream_without_interrupts():
+    setup = Setup()
+    gpio = SimulatedGPIO()
+    gpio.add_event_detect(ADS1015.alrt, gpio.RISING)
+    gpio.connect(ADS1015.alrt, setup.chip)
+    adc = ADS1015(setup.bus, gpio=gpio, backend=SMBusBackend(setup.bus))
+    try:
+        assert not adc.interrupts_enabled()
+        samples = list(adc.stream(0, data_rate=3300, count=10))
+        assert [value for _, value in samples] == [500] * 10
+    finally:
+        setup.close()
+
+def test_closing_a_stream_restores_single_shot_mode(setup):
+    adc = setup.adc
+    config = adc.config_register()
+
+    samples = adc.stream(0, data_rate=3300)
+    next(samples)
+    # continuous mode
+    assert not setup.chip.read_register(1) & 0x0100
+    samples.close()
+
+    assert setup.chip.read_register(1) & 0x7FFF == config
+    with pytest.raises(ValueError):
+        next(adc.stream(0, data_rate=1000))
+
+def test_stream_excludes_single_shot_reads(setup):
+    adc = setup.adc
+    samples = adc.stream(0, data_rate=3300)
+    next(samples)
+    errors = []
+
+    def read():
+        try:
+            adc.read_channel(1)
+        except RuntimeError as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+    with pytest.raises(RuntimeError):
+        adc.enable_comparator(0, 100, 400)
+    with pytest.raises(RuntimeError):
+        next(adc.stream(1))
+
+    samples.close()
+    assert adc.read_channel(1) == 1000
+
+def test_comparator_events(setup):
+    adc = setup.adc
+    adc.enable_comparator(0, 100, 400, data_rate=3300)
+
+    event = adc.alerts.get(timeout=1)
+    assert isinstance(event, ThresholdEvent)
+    assert event.channel == 0 and event.active and event.value == 500
+
+    setup.chip.waveforms[0] = constant(0.1)
+    event = adc.alerts.get(timeout=1)
+    assert not event.active and event.value == 50
+
+    with pytest.raises(RuntimeError):
+        adc.read_channel(1)
+    adc.disable_comparator()
+    assert adc.read_channel(1) == 1000
+
+def test_comparator_callback_and_latch(setup, wait_for):
+    adc = setup.adc
+    events = []
+    adc.enable_comparator(3, 300, 1000, window=True, latching=True,
+                          data_rate=3300, callback=events.append)
+
+    wait_for(lambda: events)
+    assert events[0].active and events[0].value is None
+    assert setup.gpio.input(ADS1015.alrt) == 1
+    assert adc.clear_alert() == 250
+    wait_for(lambda: len(events) > 1)
+    assert not events[1].active
+    assert adc.alerts.empty()
+
+def test_comparator_validation(setup):
+    with pytest.raises(ValueError):
+        setup.adc.enable_comparator(0, 400, 100)
+    with pytest.raises(ValueError):
+        setup.adc.enable_comparator(0, 0, 4000)
+    with pytest.raises(ValueError):
+        setup.adc.enable_comparator(0, 0, 100, queue=3)
+
+@pytest.mark.parametrize('queue, bits', [(1, 0b00), (2, 0b01), (4, 0b10)])
+def test_comparator_configuration(setup, queue, bits):
+    adc = setup.adc
+    chip = setup.chip
+    adc.enable_comparator(2, -100, 400, window=True, latching=True,
+                          queue=queue)
+
+    assert adc.comparator_enabled()
+    # the thresholds are left-aligned 12-bit two's complement
+    assert chip.read_register(chip.LO_THRESH_REGISTER) == 0xF9C0
+    assert chip.read_register(chip.HI_THRESH_REGISTER) == 0x1900
+    config = chip.read_register(chip.CONFIG_REGISTER)
+    assert config & 0x0100 == 0  # continuous conversions
+    assert config & 0x0010 and config & 0x0004
+    assert config & 0b11 == bits
+
+def test_disable_comparator(setup):
+    adc = setup.adc
+    chip = setup.chip
+    config = adc.config_register()
+    adc.enable_comparator(0, 100, 400)
+    adc.disable_comparator()
+
+    assert not adc.comparator_enabled()
+    assert adc.config_register() == config
+    # the thresholds signal finished conversions again
+    assert chip.read_register(chip.LO_THRESH_REGISTER) == 0x0000
+    assert chip.read_register(chip.HI_THRESH_REGISTER) == 0x8000
+    assert adc.read_channel(3) == 250
+    # disabling twice does nothing
+    adc.disable_comparator()
+
+def test_close_disables_the_comparator(setup):
+    setup.adc.enable_comparator(0, 100, 400)
+    setup.adc.close()
+
+    assert not setup.adc.comparator_enabled()
+    assert setup.chip.read_register(setup.chip.HI_THRESH_REGISTER) == 0x8000
+
+def test_comparator_without_interrupts():
+    setup = Setup()
+    gpio = SimulatedGPIO()
+    gpio.add_event_detect(ADS1015.alrt, gpio.RISING)
+    adc = ADS1015(setup.bus, gpio=gpio, backend=SMBusBackend(setup.bus))
+    try:
+        with pytest.raises(RuntimeError):
+            adc.enable_comparator(0, 100, 400)
+        assert not adc.comparator_enabled()
+    finally:
+        setup.close()
+
+class MultiSetup:
+
+    def __init__(self, addresses=(0x48, 0x49, 0x4A, 0x4B), data_rate=1600):
+        self.chips = [SimulatedADS1015({channel: constant(0.1 * (index + 1))
+                                        for channel in range(4)})
+                      for index, _ in enumerate(addresses)]
+        self.bus = SimulatedSMBus(dict(zip(addresses, self.chips)))
+        self.gpio = SimulatedGPIO()
+        self.adcs = []
+        for index, (address, chip) in enumerate(zip(addresses, self.chips)):
+            self.gpio.connect(22 + index, chip)
+            self.adcs.append(ADS1015(
+                self.bus, address, data_rate=data_rate, alert_pin=22 + index,
+                gpio=self.gpio, backend=SMBusBackend(self.bus)))
+
+    def close(self):
+        for adc, chip in zip(self.adcs, self.chips):
+            adc.close()
+            chip.close()
+
+
+@pytest.fixture
+def multi():
+    setup = MultiSetup()
+    yield setup
+    setup.close()
+
+
+def test_alert_pins(multi):
+    assert [adc.alrt for adc in multi.adcs] == [22, 23, 24, 25]
+    assert ADS1015.alrt == 22
+    assert all(adc.interrupts_enabled() for adc in multi.adcs)
+
+def test_bus_lock_is_shared(multi):
+    lock = bus_lock(multi.bus)
+
+    assert all(adc.backend().lock is lock for adc in multi.adcs)
+    assert bus_lock(SimulatedSMBus()) is not lock
+
+def test_concurrent_reads(multi):
+    results = {}
+
+    def read(adc, index):
+        results[index] = [adc.read_channel(index % 4) for _ in range(20)]
+
+    threads = [threading.Thread(target=read, args=(adc, index))
+               for index, adc in enumerate(multi.adcs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {index: [50 * (index + 1)] * 20 for index in range(4)}
+
+def test_group(multi):
+    group = ADCGroup(multi.adcs)
+
+    assert len(group) == 4
+    assert group.read_channel(2) == [50, 100, 150, 200]
+    assert group.read_channels([0, 3]) == [[50, 50], [100, 100],
+                                           [150, 150], [200, 200]]
+    assert group.read_channel(4) is None
+
+def test_group_overlaps_conversions():
+    setup = MultiSetup(data_rate=128)
+    try:
+        group = ADCGroup(setup.adcs)
+        before = time.monotonic()
+        group.read_channel(0)
+        # the four conversions of about 8 ms each run in parallel
+        assert time.monotonic() - before < 3 / 128
+    finally:
+        setup.close()
+
+def test_group_rejects_duplicate_chips(multi):
+    with pytest.raises(ValueError):
+        ADCGroup([multi.adcs[0], multi.adcs[0]])
+
+# flake8: noqa
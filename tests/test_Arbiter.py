@@ -0,0 +1,170 @@
+from raspibot.Arbiter import SerialArbiter, PRIORITY_LOW
+from raspibot.Serial import InvalidResponseException
+
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+
+class MockProtocol:
+    """Records the commands executed, optionally blocking on the first one."""
+
+    def __init__(self, block=False):
+        self.executed = []
+        self.threads = set()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def _record(self, name, *arguments):
+        self.threads.add(threading.current_thread())
+        self.executed.append((name,) + arguments)
+        self.started.set()
+        self.release.wait()
+        return True
+
+    def alive(self):
+        return self._record('alive')
+
+    def set_buzzer(self, frequency, duration, volume):
+        return self._record('set_buzzer', frequency, duration, volume)
+
+    def set_motors(self, left, right):
+        return self._record('set_motors', left, right)
+
+    def stop_motors(self):
+        return self._record('stop_motors')
+
+    def get_encoders(self):
+        raise InvalidResponseException()
+
+
+def test_call():
+    protocol = MockProtocol()
+
+    with SerialArbiter(protocol) as arbiter:
+        assert arbiter.set_motors(10, -10) == True
+        assert arbiter.call('alive') == True
+
+    assert protocol.executed == [('set_motors', 10, -10), ('alive',)]
+    assert threading.current_thread() not in protocol.threads
+
+def test_exception_is_passed_on():
+    with SerialArbiter(MockProtocol()) as arbiter:
+        with pytest.raises(InvalidResponseException):
+            arbiter.get_encoders()
+
+def test_unknown_command():
+    with SerialArbiter(MockProtocol()) as arbiter:
+        with pytest.raises(AttributeError):
+            arbiter.self_destruct()
+
+def test_submit_unknown_command():
+    protocol = MockProtocol()
+    with SerialArbiter(protocol) as arbiter:
+        for priority in (None, 2):
+            with pytest.raises(ValueError):
+                arbiter.submit('batch', priority=priority)
+            with pytest.raises(ValueError):
+                arbiter.submit('_record', 'alive', priority=priority)
+
+    assert protocol.executed == []
+
+def test_priorities():
+    protocol = MockProtocol(block=True)
+
+    with SerialArbiter(protocol) as arbiter:
+        # occupy the worker, then queue commands in reverse priority order
+        first = arbiter.submit('alive')
+        protocol.started.wait()
+        futures = [
+            arbiter.submit('set_buzzer', 440, 100, 1),
+            arbiter.submit('alive'),
+            arbiter.submit('set_motors', 1, 1),
+            arbiter.submit('stop_motors'),
+            arbiter.submit('set_motors', 2, 2),
+            arbiter.submit('stop_motors', priority=PRIORITY_LOW + 1),
+        ]
+        protocol.release.set()
+        for future in [first] + futures:
+            future.result(5)
+
+    assert protocol.executed == [
+        ('alive',),
+        ('stop_motors',),
+        ('set_motors', 1, 1),
+        ('set_motors', 2, 2),
+        ('set_buzzer', 440, 100, 1),
+        ('alive',),
+        ('stop_motors',),
+    ]
+
+def test_many_threads():
+    protocol = MockProtocol()
+
+    with SerialArbiter(protocol) as arbiter:
+        def worker(index):
+            for _ in range(50):
+                arbiter.set_motors(index, index)
+
+        threads = [threading.Thread(target=worker, args=(index,))
+                   for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(protocol.executed) == 200
+    assert len(protocol.threads) == 1
+
+def test_stop_finishes_queued_commands():
+    protocol = MockProtocol()
+    arbiter = SerialArbiter(protocol)
+
+    futures = [arbiter.submit('alive') for _ in range(10)]
+    arbiter.stop()
+
+    assert all(future.done() for future in futures)
+    with pytest.raises(RuntimeError):
+        arbiter.submit('alive')
+
+def test_low_priorities_finish_before_stopping():
+    protocol = MockProtocol(block=True)
+    arbiter = SerialArbiter(protocol)
+    arbiter.submit('alive')
+    protocol.started.wait()
+
+    future = arbiter.submit('alive', priority=1000)
+    protocol.release.set()
+    arbiter.stop()
+
+    assert future.result(0) == True
+
+def test_invalid_priority():
+    with SerialArbiter(MockProtocol()) as arbiter:
+        for priority in (-1, float('inf'), float('nan')):
+            with pytest.raises(ValueError):
+                arbiter.submit('alive', priority=priority)
+
+def test_stop_cancels_commands_left_in_the_queue():
+    protocol = MockProtocol(block=True)
+    arbiter = SerialArbiter(protocol)
+    arbiter.submit('alive')
+    protocol.started.wait()
+    stopping = threading.Thread(target=arbiter.stop)
+    stopping.start()
+    while arbiter._queue.empty():
+        time.sleep(0.001)
+
+    # a command behind the shutdown marker, which submit does not allow
+    future = Future()
+    arbiter._queue.put((float('inf'), float('inf'), 'alive', (), future))
+    protocol.release.set()
+    stopping.join()
+
+    assert future.cancelled()
+
+# flake8: noqa
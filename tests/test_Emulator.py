@@ -0,0 +1,143 @@
+from raspibot.Emulator import AttinyEmulator, AttinyFirmware, LoopbackSerial, PIParameters
+from raspibot.Serial import AttinyProtocol, EncoderValues
+
+import os
+import select
+from time import monotonic
+
+import pytest
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class PtySerial:
+    """A minimal blocking serial interface on a pty device."""
+
+    def __init__(self, port, timeout=1.0):
+        self._fd = os.open(port, os.O_RDWR | os.O_NOCTTY)
+        self.timeout = timeout
+
+    def write(self, data):
+        os.write(self._fd, bytes(data))
+
+    def read(self, count):
+        deadline = monotonic() + self.timeout
+        data = b''
+        while len(data) < count:
+            remaining = deadline - monotonic()
+            if remaining <= 0 or not select.select([self._fd], [], [], remaining)[0]:
+                break
+            data += os.read(self._fd, count - len(data))
+        return data
+
+    def close(self):
+        os.close(self._fd)
+
+
+def test_firmware_encoders_follow_motors():
+    clock = FakeClock()
+    firmware = AttinyFirmware(ticks_per_second=10, clock=clock)
+    attiny = AttinyProtocol(LoopbackSerial(firmware))
+
+    assert attiny.set_motors(10, -20) == True
+    clock.time = 2.0
+
+    assert attiny.get_encoders() == EncoderValues(200, -400)
+    assert attiny.get_left_encoder() == 200
+    assert attiny.get_right_encoder() == -400
+
+    assert attiny.reset_left_encoder() == True
+    assert attiny.get_encoders() == EncoderValues(0, -400)
+
+    assert attiny.stop_motors() == True
+    clock.time = 10.0
+    assert attiny.get_encoders() == EncoderValues(0, -400)
+
+def test_firmware_encoders_wrap_around():
+    clock = FakeClock()
+    firmware = AttinyFirmware(ticks_per_second=1000, clock=clock)
+    firmware.handle(b'\x2D\x7f\x7f')
+    clock.time = 1.0
+
+    # 127000 ticks wrapped into 16 bits
+    assert firmware.encoders() == (127000 - 2 * 2 ** 16,) * 2
+
+def test_firmware_state():
+    clock = FakeClock()
+    firmware = AttinyFirmware(clock=clock)
+    attiny = AttinyProtocol(LoopbackSerial(firmware))
+
+    assert attiny.alive() == True
+    assert attiny.echo(b'\x42') == b'\x42'
+    assert attiny.set_pi_parameters(-5, 7, 3) == True
+    assert firmware.pi_parameters == PIParameters(-5, 7, 3)
+
+    assert attiny.set_buzzer(440, 500, 7) == True
+    assert firmware.buzzer.frequency == 440
+    assert firmware.buzzer_active()
+    clock.time = 0.6
+    assert not firmware.buzzer_active()
+
+    attiny.set_buzzer(440, 500, 7)
+    assert attiny.stop_buzzer() == True
+    assert not firmware.buzzer_active()
+
+def test_firmware_unknown_opcode():
+    assert AttinyFirmware().handle(b'\xff') == b'\x14'
+
+def test_loopback_partial_messages():
+    serial = LoopbackSerial()
+
+    # a message split over two writes is only answered once it is complete
+    serial.write(b'\x2D\x01')
+    assert serial.read(1) == b''
+    serial.write(b'\x01')
+    assert serial.read(1) == b'\x10'
+    assert serial.firmware.speeds == [1, 1]
+
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='requires a pty')
+def test_emulator_on_pty():
+    with AttinyEmulator(baudrate=None) as emulator:
+        serial = PtySerial(emulator.port)
+        try:
+            attiny = AttinyProtocol(serial)
+            assert attiny.alive() == True
+            assert attiny.set_motors(5, 5) == True
+            assert attiny.echo(b'\x99') == b'\x99'
+
+            # pipelined commands are answered in order
+            with attiny.batch() as batch:
+                results = [batch.alive(), batch.get_encoders(), batch.stop_motors()]
+            assert results[0].result() == True
+            assert results[2].result() == True
+        finally:
+            serial.close()
+
+    assert emulator.firmware.requests == 6
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='requires a pty')
+def test_emulator_timing():
+    emulator = AttinyEmulator(baudrate=9600, processing_latency=0.005)
+
+    # 1 request byte and 4 response bytes at 960 bytes per second
+    assert emulator.transmission_time(5) == pytest.approx(5 / 960)
+
+    with emulator:
+        serial = PtySerial(emulator.port)
+        try:
+            attiny = AttinyProtocol(serial)
+            start = monotonic()
+            attiny.get_encoders()
+            assert monotonic() - start >= 0.005 + 5 / 960
+        finally:
+            serial.close()
+
+# flake8: noqa
@@ -0,0 +1,77 @@
+from raspibot.Encoders import EncoderSampler, EncoderSample
+from raspibot.Serial import AttinyProtocol, EncoderValues
+
+import struct
+
+import numpy as np
+import pytest
+
+
+class MockProtocol:
+
+    def __init__(self):
+        self.requests = 0
+
+    def get_encoders(self, strict=False):
+        self.requests += 1
+        return EncoderValues(self.requests, -self.requests)
+
+
+class TimeoutSerial:
+    """Answers encoder requests, but times out on every second one."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def write(self, message):
+        self.requests += 1
+
+    def read(self, count):
+        if self.requests % 2 == 0:
+            return b''
+        return struct.pack('>hh', self.requests, -self.requests)
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        EncoderSampler(MockProtocol(), rate=0)
+
+def test_no_samples_before_start():
+    sampler = EncoderSampler(MockProtocol())
+
+    assert not sampler.running()
+    assert sampler.latest() is None
+    assert len(sampler.window()) == 0
+
+def test_sampling(wait_for):
+    protocol = MockProtocol()
+
+    with EncoderSampler(protocol, rate=1000, capacity=16) as sampler:
+        assert sampler.running()
+        wait_for(lambda: sampler.count() >= 20)
+
+    assert not sampler.running()
+
+    latest = sampler.latest()
+    assert isinstance(latest, EncoderSample)
+    assert latest.left == protocol.requests
+    assert latest.right == -protocol.requests
+
+    window = sampler.window(10)
+    assert window.shape == (10, 3)
+    # timestamps increase monotonically and the values are consecutive
+    assert np.all(np.diff(window[:, 0]) > 0)
+    assert np.all(np.diff(window[:, 1]) == 1)
+    assert window[-1, 0] == latest.timestamp
+
+def test_timeouts_are_skipped(wait_for):
+    protocol = AttinyProtocol(TimeoutSerial())
+
+    with EncoderSampler(protocol, rate=1000) as sampler:
+        wait_for(lambda: sampler.count() >= 5)
+
+    assert sampler.errors >= 4
+    # no (0, 0) samples from the timeouts
+    assert np.all(sampler.window()[:, 1] % 2 == 1)
+
+# flake8: noqa
@@ -0,0 +1,128 @@
+from raspibot.Filters import (
+    Calibration, Decimator, ExponentialMovingAverage, MedianFilter,
+    MovingAverage, Pipeline)
+
+import numpy as np
+import pytest
+
+
+def samples(n=1000, channels=None, seed=1):
+    shape = (n,) if channels is None else (n, channels)
+    return np.random.default_rng(seed).integers(0, 2048, shape)
+
+
+def process_in_batches(stage, data, sizes=(1, 7, 100, 0, 333)):
+    batches = []
+    start = 0
+    for size in sizes:
+        batches.append(stage.process(data[start:start + size]))
+        start += size
+    batches.append(stage.process(data[start:]))
+    return np.concatenate(batches)
+
+
+def test_exponential_moving_average():
+    data = samples()
+    alpha = 0.05
+
+    expected = np.empty(len(data))
+    state = data[0]
+    for index, value in enumerate(data):
+        state = alpha * value + (1 - alpha) * state
+        expected[index] = state
+
+    assert np.allclose(ExponentialMovingAverage(alpha).process(data), expected)
+    assert np.allclose(
+        process_in_batches(ExponentialMovingAverage(alpha), data), expected)
+
+def test_exponential_moving_average_with_small_alpha():
+    data = samples(50)
+    alpha = 1e-7
+
+    expected = np.empty(len(data))
+    state = data[0]
+    for index, value in enumerate(data):
+        state = alpha * value + (1 - alpha) * state
+        expected[index] = state
+
+    ema = ExponentialMovingAverage(alpha)
+    # the blocks are bounded, not sized for a growth of the decay by 1e8
+    assert ema._powers.nbytes <= 64 * 1024
+    assert np.allclose(process_in_batches(ema, data, (16, 16)), expected)
+
+def test_exponential_moving_average_without_smoothing():
+    data = samples(10)
+
+    assert np.array_equal(ExponentialMovingAverage(1).process(data), data)
+
+def test_invalid_alpha():
+    with pytest.raises(ValueError):
+        ExponentialMovingAverage(0)
+
+def test_moving_average():
+    data = samples()
+    padded = np.concatenate(([data[0]] * 4, data))
+    expected = np.array([padded[index:index + 5].mean()
+                         for index in range(len(data))])
+
+    assert np.allclose(MovingAverage(5).process(data), expected)
+    assert np.allclose(process_in_batches(MovingAverage(5), data), expected)
+
+def test_median_filter():
+    data = samples()
+    padded = np.concatenate(([data[0]] * 2, data))
+    expected = np.array([np.median(padded[index:index + 3])
+                         for index in range(len(data))])
+
+    assert np.array_equal(MedianFilter(3).process(data), expected)
+    assert np.array_equal(process_in_batches(MedianFilter(3), data), expected)
+
+def test_median_filter_removes_spikes():
+    data = np.array([10, 10, 10, 2000, 10, 10])
+
+    assert np.all(MedianFilter(3).process(data) == 10)
+
+def test_decimator():
+    data = samples(1003)
+
+    averaged = process_in_batches(Decimator(4), data)
+    assert averaged.shape == (250,)
+    assert np.allclose(averaged, data[:1000].reshape(250, 4).mean(axis=1))
+
+    picked = process_in_batches(Decimator(4, average=False), data)
+    assert np.array_equal(picked, data[3:1000:4])
+
+def test_calibration():
+    calibration = Calibration(gain=2.048)
+
+    assert np.allclose(calibration.process([0, 1024, 2047, 4095]),
+                       [0.0, 1.024, 2.047, -0.001])
+
+def test_calibration_with_points():
+    calibration = Calibration(points=[(1000, 2.0), (0, 0.1)])
+
+    assert np.allclose(calibration.process([0, 500, 1000, 2000]),
+                       [0.1, 1.05, 2.0, 3.9])
+
+def test_channels_are_filtered_independently():
+    data = samples(500, channels=3)
+    pipeline = Pipeline(Calibration(), MedianFilter(3),
+                        ExponentialMovingAverage(0.2), Decimator(5))
+
+    result = process_in_batches(pipeline, data)
+    assert result.shape == (100, 3)
+    for channel in range(3):
+        single = Pipeline(Calibration(), MedianFilter(3),
+                          ExponentialMovingAverage(0.2), Decimator(5))
+        assert np.allclose(single.process(data[:, channel]),
+                           result[:, channel])
+
+def test_reset():
+    data = samples(100)
+    pipeline = Pipeline(MovingAverage(8), Decimator(3))
+
+    first = pipeline.process(data)
+    pipeline.reset()
+    assert np.array_equal(pipeline.process(data), first)
+
+# flake8: noqa
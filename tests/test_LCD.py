@@ -0,0 +1,248 @@
+from raspibot.LCD import Display, _changed_runs
+from raspibot.Simulation import SimulatedGPIO, SimulatedHD44780
+
+import time
+
+import pytest
+
+
+@pytest.fixture
+def gpio():
+    return SimulatedGPIO()
+
+
+@pytest.fixture
+def controller(gpio):
+    controller = SimulatedHD44780(gpio)
+    controller.set_ready()
+    return controller
+
+
+@pytest.fixture
+def display(gpio, controller):
+    return Display(gpio=gpio)
+
+
+def test_init(display, controller):
+    assert not controller.eight_bit
+    assert controller.line(0) == b' ' * 16
+    assert controller.line(1) == b' ' * 16
+
+def test_print(display, controller):
+    display.print('Hello')
+    display.cursor_goto_xy(3, 1)
+    display.print('World')
+
+    assert controller.line(0) == b'Hello           '
+    assert controller.line(1) == b'   World        '
+
+def test_flush(display, controller):
+    display.set_text(0, 0, 'Speed: 12 km/h')
+    display.set_text(0, 1, 'Temp 21C')
+
+    # the cursor is at the top left after clearing
+    assert display.flush() == 14 + 1 + 8
+    assert controller.line(0) == b'Speed: 12 km/h  '
+    assert controller.line(1) == b'Temp 21C        '
+
+def test_flush_only_writes_changes(display, controller):
+    display.set_text(0, 0, 'Speed: 12 km/h')
+    display.set_text(0, 1, 'Temp 21C')
+    display.flush()
+    writes = controller.data_writes
+
+    assert display.flush() == 0
+    display.set_text(7, 0, '13')
+    display.set_text(5, 1, '22')
+    # one cursor move and one character per line
+    assert display.flush() == 4
+    assert controller.data_writes == writes + 2
+    assert controller.line(0) == b'Speed: 13 km/h  '
+    assert controller.line(1) == b'Temp 22C        '
+
+def test_flush_after_print(display, controller):
+    display.print('abc')
+    display.set_text(0, 0, 'abd')
+
+    # the display shows "abc" and the cursor is behind it
+    assert display.flush() == 2
+    assert controller.line(0) == b'abd             '
+
+def test_clear_resets_the_framebuffer(display, controller):
+    display.set_text(0, 0, 'abc')
+    display.flush()
+    display.clear()
+
+    assert display.flush() == 0
+    assert controller.line(0) == b' ' * 16
+
+def test_custom_character_moves_the_cursor(display, controller):
+    display.set_text(0, 0, 'a')
+    display.flush()
+    display.load_custom_character([[0, 0, 0, 1, 1, 1, 1, 1]] * 8, 2)
+    display.set_text(1, 0, b'\x02')
+
+    assert display.flush() == 2
+    assert controller.line(0) == b'a\x02              '
+    assert controller.glyph(2) == b'\x1f' * 8
+
+def test_print_codepoint(display, controller):
+    display.print_codepoint([0, 1, 0, 0, 0, 0, 0, 1])
+    display.print_codepoint([0, 1, 0, 0, 0, 0, 1, 0])
+
+    assert controller.line(0) == b'AB              '
+    assert display._shown[0] == b'AB              '
+
+def test_batched_pin_writes(gpio, controller):
+    display = Display(gpio=gpio, write_mode='timed')
+    gpio.writes = 0
+    display.print('0123456789abcdef')
+
+    # data and enable together, then enable low, for each nibble
+    assert gpio.writes == 16 * 4
+    assert controller.line(0) == b'0123456789abcdef'
+
+def glyph(n):
+    return [n] * 8
+
+def test_glyphs(display, controller):
+    display.define_glyph('battery', [[0, 0, 0, 0, 1, 1, 1, 0]] * 8)
+    display.set_glyph(0, 0, 'battery')
+    display.set_glyph(1, 0, glyph(1))
+    display.set_glyph(0, 1, glyph(1))
+    display.set_text(2, 0, 'ok')
+
+    # two glyphs, then a cursor move and the cells per line
+    assert display.flush() == 2 * 9 + 1 + 4 + 1 + 1
+    assert controller.line(0) == b'\x00\x01ok            '
+    assert controller.line(1) == b'\x01               '
+    assert controller.glyph(0) == b'\x0e' * 8
+    assert controller.glyph(1) == b'\x01' * 8
+
+def test_resident_glyphs_are_not_loaded_again(display, controller):
+    display.set_glyph(0, 0, glyph(1))
+    display.flush()
+    display.set_text(0, 0, 'a')
+    display.flush()
+    writes = controller.data_writes
+
+    display.set_glyph(0, 0, glyph(1))
+    assert display.flush() == 2
+    assert controller.data_writes == writes + 1
+
+def test_glyph_eviction(display, controller):
+    # fill the character generator RAM, with glyphs 0 and 1 least recently
+    # used, but only glyph 1 still on the display
+    for n in range(8):
+        display.set_glyph(n, 0, glyph(n))
+    display.flush()
+    display.set_text(0, 0, 'ab')
+    display.flush()
+    display.set_glyph(0, 0, glyph(1))
+    display.flush()
+    for n in range(2, 8):
+        display.set_glyph(n, 0, glyph(n))
+    display.set_text(0, 0, 'a')
+    display.set_glyph(8, 0, glyph(8))
+    display.flush()
+
+    # glyph 0 is not on the display, so its slot is reused first
+    assert controller.glyph(0) == b'\x08' * 8
+    assert controller.line(0) == b'ab\x02\x03\x04\x05\x06\x07\x00       '
+
+    # glyph 1 is the only one left to evict, although it is on the
+    # display; the cell showing it is rewritten
+    display.set_glyph(9, 0, glyph(1))
+    display.flush()
+    display.set_text(9, 0, 'x')
+    display.set_glyph(10, 0, glyph(9))
+    display.flush()
+    assert controller.glyph(1) == b'\x09' * 8
+    assert controller.line(0) == b'ab\x02\x03\x04\x05\x06\x07\x00x\x01     '
+
+def test_glyphs_leave_custom_characters_alone(display, controller):
+    display.load_custom_character(glyph(31), 0)
+    display.set_text(0, 0, b'\x00')
+    display.set_glyph(15, 0, glyph(1))
+    display.flush()
+
+    assert controller.glyph(0) == b'\x1f' * 8
+    assert controller.glyph(1) == b'\x01' * 8
+    assert controller.line(0) == b'\x00' + b' ' * 14 + b'\x01'
+
+    # only 7 slots are left for glyphs
+    for n in range(7):
+        display.set_glyph(n + 1, 1, glyph(n + 1))
+    display.flush()
+    display.set_glyph(8, 1, glyph(8))
+    with pytest.raises(ValueError):
+        display.flush()
+    assert controller.glyph(0) == b'\x1f' * 8
+
+def test_too_many_glyphs(display):
+    for n in range(9):
+        display.set_glyph(n, 0, glyph(n))
+
+    with pytest.raises(ValueError):
+        display.flush()
+
+def test_set_text_clipping(display):
+    display.set_text(14, 0, 'abcd')
+    display.set_text(-2, 1, 'xyz')
+
+    assert display._frame[0] == b' ' * 14 + b'ab'
+    assert display._frame[1] == b'z' + b' ' * 15
+    with pytest.raises(ValueError):
+        display.set_text(0, 2, 'a')
+
+def render(display):
+    display.print('Hello')
+    display.cursor_goto_xy(3, 1)
+    display.print('World')
+    display.set_text(0, 0, 'Speed: 12 km/h')
+    display.flush()
+    display.clear()
+    display.print('ok')
+
+def test_timed_write_mode(gpio, controller):
+    display = Display(gpio=gpio, write_mode='timed')
+    display.wait_for_controller = lambda: pytest.fail('busy flag polled')
+    render(display)
+
+    assert controller.line(0) == b'ok              '
+    assert controller.line(1) == b' ' * 16
+    assert controller.violations == 0
+
+def test_adaptive_write_mode(gpio, controller):
+    display = Display(gpio=gpio, write_mode='adaptive')
+    polls = []
+    poll = display.wait_for_controller
+    display.wait_for_controller = lambda: polls.append(poll())
+    render(display)
+
+    assert controller.line(0) == b'ok              '
+    # only clearing the display polls the busy flag
+    assert len(polls) == 1
+
+def test_initialization_waits(gpio, controller):
+    latched = []
+    gpio.add_output_listener(
+        lambda pin, level: pin == 27 and level == 0 and
+        latched.append(time.perf_counter()))
+    Display(gpio=gpio, write_mode='timed')
+
+    # the datasheet's minimum waits after the first two nibbles
+    assert latched[1] - latched[0] >= 4.1e-3
+    assert latched[2] - latched[1] >= 100e-6
+    assert controller.violations == 0
+
+def test_invalid_write_mode(gpio):
+    with pytest.raises(ValueError):
+        Display(gpio=gpio, write_mode='fast')
+
+def test_changed_runs():
+    assert _changed_runs(b'abcdefgh', b'abcdefgh') == []
+    assert _changed_runs(b'aXcXeXXh', b'abcdefgh') == [[1, 7]]
+    assert _changed_runs(b'aXcdXfgh', b'abcdefgh') == [[1, 2], [4, 5]]
+
+# flake8: noqa
@@ -0,0 +1,111 @@
+from raspibot.Odometry import Odometry, Pose, unwrap
+
+from math import pi
+
+import numpy as np
+import pytest
+
+WHEEL_BASE = 0.1
+DISTANCE_PER_TICK = 0.001
+
+
+def test_unwrap():
+    assert unwrap(0, 10) == 10
+    assert unwrap(10, 0) == -10
+    # forwards across the positive limit
+    assert unwrap(32760, -32766) == 10
+    # backwards across the negative limit
+    assert unwrap(-32766, 32760) == -10
+
+def test_unwrap_array():
+    previous = np.array([32760, -32766, 0])
+    current = np.array([-32766, 32760, 5])
+
+    assert list(unwrap(previous, current)) == [10, -10, 5]
+
+def test_first_update_is_reference():
+    odometry = Odometry(WHEEL_BASE, DISTANCE_PER_TICK)
+
+    pose = odometry.update(1234, -4321)
+
+    assert pose == Pose(0.0, 0.0, 0.0)
+    assert odometry.left_ticks == 0
+    assert odometry.right_ticks == 0
+
+def test_straight_line():
+    odometry = Odometry(WHEEL_BASE, DISTANCE_PER_TICK)
+    odometry.update(0, 0)
+
+    x, y, theta = odometry.update(100, 100)
+
+    assert x == pytest.approx(0.1)
+    assert y == pytest.approx(0.0)
+    assert theta == pytest.approx(0.0)
+
+def test_rotate_in_place():
+    odometry = Odometry(WHEEL_BASE, DISTANCE_PER_TICK)
+    odometry.update(0, 0)
+
+    # each wheel travels a quarter of the circle around the robot's centre
+    ticks = round(pi * WHEEL_BASE / 4 / DISTANCE_PER_TICK)
+    x, y, theta = odometry.update(-ticks, ticks)
+
+    assert x == pytest.approx(0.0)
+    assert y == pytest.approx(0.0)
+    assert theta == pytest.approx(pi / 2, rel=1e-2)
+
+def test_wraparound_accumulates():
+    odometry = Odometry(WHEEL_BASE, DISTANCE_PER_TICK)
+    counter = 0
+    odometry.update(counter, counter)
+
+    # drive forward for more than a whole counter range
+    for _ in range(100):
+        counter = (counter + 1000 + 2 ** 15) % 2 ** 16 - 2 ** 15
+        odometry.update(counter, counter)
+
+    assert odometry.left_ticks == 100000
+    assert odometry.right_ticks == 100000
+    assert odometry.pose.x == pytest.approx(100.0)
+
+def test_integrate_matches_update():
+    rng = np.random.default_rng(1)
+    steps = rng.integers(-50, 300, size=(500, 2))
+    counters = (np.cumsum(steps, axis=0) + 2 ** 15) % 2 ** 16 - 2 ** 15
+
+    incremental = Odometry(WHEEL_BASE, DISTANCE_PER_TICK, Pose(1.0, 2.0, 0.5))
+    expected = [incremental.update(left, right) for left, right in counters]
+
+    batch = Odometry(WHEEL_BASE, DISTANCE_PER_TICK, Pose(1.0, 2.0, 0.5))
+    poses = batch.integrate(counters)
+
+    assert poses.shape == (500, 3)
+    assert np.allclose(poses, expected)
+    assert batch.left_ticks == incremental.left_ticks
+    assert batch.right_ticks == incremental.right_ticks
+    assert np.allclose(batch.pose, incremental.pose)
+
+def test_integrate_continues_from_state():
+    counters = np.array([[0, 0], [100, 100], [200, 200], [300, 300]])
+    odometry = Odometry(WHEEL_BASE, DISTANCE_PER_TICK)
+
+    odometry.integrate(counters[:2])
+    poses = odometry.integrate(counters[2:])
+
+    assert poses[:, 0] == pytest.approx([0.2, 0.3])
+
+def test_integrate_with_timestamps():
+    samples = np.array([[10, 0, 0], [20, 50, 50]])
+    odometry = Odometry(WHEEL_BASE, DISTANCE_PER_TICK)
+
+    poses = odometry.integrate(samples)
+
+    assert poses[-1, 0] == pytest.approx(0.05)
+
+def test_integrate_invalid_shape():
+    odometry = Odometry(WHEEL_BASE, DISTANCE_PER_TICK)
+
+    with pytest.raises(ValueError):
+        odometry.integrate(np.zeros((3, 4)))
+
+# flake8: noqa
@@ -0,0 +1,81 @@
+from raspibot.LCD import Display
+from raspibot.Renderer import DisplayRenderer
+from raspibot.Simulation import SimulatedGPIO, SimulatedHD44780
+
+import time
+
+import pytest
+
+
+@pytest.fixture
+def controller():
+    gpio = SimulatedGPIO()
+    controller = SimulatedHD44780(gpio)
+    controller.display = Display(gpio=gpio, write_mode='timed')
+    return controller
+
+
+def test_invalid_arguments(controller):
+    with pytest.raises(ValueError):
+        DisplayRenderer(controller.display, max_rate=0)
+
+    renderer = DisplayRenderer(controller.display)
+    with pytest.raises(ValueError):
+        renderer.show('a', 'b', 'c')
+    with pytest.raises(ValueError):
+        renderer.set_text(0, 2, 'a')
+
+def test_show(controller):
+    with DisplayRenderer(controller.display) as renderer:
+        assert renderer.running()
+        renderer.show('Hello', 'World')
+        assert renderer.wait(timeout=1)
+        assert controller.line(0) == b'Hello           '
+        assert controller.line(1) == b'World           '
+
+        renderer.set_text(12, 1, 'abcdef')
+        assert renderer.wait(timeout=1)
+        assert controller.line(1) == b'World       abcd'
+
+        renderer.clear()
+        assert renderer.wait(timeout=1)
+        assert controller.line(0) == b' ' * 16
+
+    assert not renderer.running()
+
+def test_frames_are_coalesced(controller):
+    with DisplayRenderer(controller.display, max_rate=5) as renderer:
+        for i in range(100):
+            renderer.show('Count: {0}'.format(i))
+        assert renderer.wait(timeout=2)
+
+    # the first frame and the last one held back by the rate limit
+    assert renderer.frames <= 2
+    assert controller.line(0) == b'Count: 99       '
+
+def test_producers_do_not_wait(controller):
+    with DisplayRenderer(controller.display, max_rate=1000) as renderer:
+        durations = []
+        for i in range(100):
+            before = time.perf_counter()
+            renderer.show('{0:016d}'.format(i), '{0:016d}'.format(i))
+            durations.append(time.perf_counter() - before)
+        assert renderer.wait(timeout=2)
+
+    # drawing just one of these frames takes over 2 ms; single calls may
+    # still wait for the renderer thread to release the GIL
+    assert sorted(durations)[50] < 0.001
+    assert controller.line(1) == b'0000000000000099'
+
+def test_stop_draws_the_pending_frame(controller):
+    renderer = DisplayRenderer(controller.display, max_rate=1)
+    renderer.start()
+    renderer.show('first')
+    renderer.wait(timeout=1)
+    renderer.show('second')
+    renderer.stop()
+
+    assert controller.line(0) == b'second          '
+    assert renderer.frames == 2
+
+# flake8: noqa
@@ -0,0 +1,64 @@
+from raspibot.RingBuffer import RingBuffer
+
+import numpy as np
+import pytest
+
+
+def test_empty():
+    buffer = RingBuffer(4)
+
+    assert len(buffer) == 0
+    assert buffer.latest() is None
+    assert len(buffer.window()) == 0
+
+def test_invalid_capacity():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+def test_append_and_latest():
+    buffer = RingBuffer(4, 3)
+
+    buffer.append((1, 2, 3))
+    buffer.append((4, 5, 6))
+
+    assert len(buffer) == 2
+    assert buffer.count() == 2
+    assert list(buffer.latest()) == [4, 5, 6]
+
+def test_window_wraps_around():
+    buffer = RingBuffer(4)
+
+    for value in range(11):
+        buffer.append(value)
+
+    assert len(buffer) == 4
+    assert buffer.count() == 11
+    assert list(buffer.window()) == [7, 8, 9, 10]
+    assert list(buffer.window(2)) == [9, 10]
+    assert list(buffer.window(100)) == [7, 8, 9, 10]
+    assert len(buffer.window(0)) == 0
+
+def test_window_is_readonly_view():
+    buffer = RingBuffer(8, 2)
+
+    for value in range(13):
+        buffer.append((value, -value))
+
+    window = buffer.window(5)
+
+    assert window.shape == (5, 2)
+    assert list(window[:, 0]) == [8, 9, 10, 11, 12]
+    assert np.shares_memory(window, buffer._data)
+    with pytest.raises(ValueError):
+        window[0, 0] = 1
+
+def test_latest_is_copy():
+    buffer = RingBuffer(2, 2)
+    buffer.append((1, 1))
+
+    latest = buffer.latest()
+    buffer.append((2, 2))
+
+    assert list(latest) == [1, 1]
+
+# flake8: noqa
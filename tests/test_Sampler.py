@@ -0,0 +1,43 @@
+from raspibot.Sampler import PeriodicSampler
+
+
+class CountingSampler(PeriodicSampler):
+
+    def __init__(self):
+        super().__init__()
+        self.runs = 0
+
+    def _run(self):
+        self.runs += 1
+        self._stopping.wait()
+
+
+def test_start_and_stop():
+    sampler = CountingSampler()
+    assert not sampler.running()
+
+    with sampler:
+        assert sampler.running()
+        sampler.start()
+        assert sampler._thread.name == 'CountingSampler'
+
+    assert not sampler.running()
+    assert sampler.runs == 1
+
+def test_next_deadline():
+    sampler = CountingSampler()
+
+    assert sampler._next_deadline(100, 10, 105) == 110
+    assert sampler.overruns == 0
+    # three periods missed, the next deadline is in the future again
+    assert sampler._next_deadline(100, 10, 135) == 140
+    assert sampler.overruns == 3
+
+def test_wait_until_reports_stopping():
+    sampler = CountingSampler()
+
+    assert sampler._wait_until(0) == False
+    sampler._stopping.set()
+    assert sampler._wait_until(2 ** 62) == True
+
+# flake8: noqa
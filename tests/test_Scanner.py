@@ -0,0 +1,68 @@
+from raspibot.Scanner import ADCScanner, ScanSnapshot
+
+import numpy as np
+import pytest
+
+
+class MockADC:
+
+    _CHANNELS = [0, 1, 2, 3]
+
+    def __init__(self):
+        self.reads = {channel: 0 for channel in self._CHANNELS}
+
+    def read_channel(self, channel):
+        self.reads[channel] += 1
+        return 100 * channel + self.reads[channel]
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        ADCScanner(MockADC(), {})
+    with pytest.raises(ValueError):
+        ADCScanner(MockADC(), {4: 100})
+    with pytest.raises(ValueError):
+        ADCScanner(MockADC(), {0: 0})
+
+def test_no_snapshot_before_every_channel_is_sampled():
+    scanner = ADCScanner(MockADC(), {0: 100, 1: 100})
+
+    assert not scanner.running()
+    assert scanner.latest(0) is None
+    assert len(scanner.window(1)) == 0
+    assert scanner.snapshot() is None
+
+def test_scanning(wait_for):
+    adc = MockADC()
+
+    with ADCScanner(adc, {0: 500, 2: 500}, capacity=16) as scanner:
+        assert scanner.running()
+        wait_for(lambda: scanner.count(0) >= 20)
+        wait_for(lambda: scanner.count(2) >= 20)
+
+    assert not scanner.running()
+    assert adc.reads[1] == 0 and adc.reads[3] == 0
+
+    snapshot = scanner.snapshot()
+    assert isinstance(snapshot, ScanSnapshot)
+    assert snapshot.channels == (0, 2)
+    assert list(snapshot.values) == [adc.reads[0], 200 + adc.reads[2]]
+
+    window = scanner.window(2, 10)
+    assert window.shape == (10, 2)
+    assert np.all(np.diff(window[:, 0]) > 0)
+    assert np.all(np.diff(window[:, 1]) == 1)
+    assert tuple(window[-1]) == scanner.latest(2)
+
+def test_channels_are_sampled_at_their_rates(wait_for):
+    adc = MockADC()
+
+    with ADCScanner(adc, {0: 400, 1: 100}) as scanner:
+        wait_for(lambda: scanner.count(1) >= 10)
+
+    ratio = scanner.count(0) / scanner.count(1)
+    assert 3 <= ratio <= 5
+    intervals = np.diff(scanner.window(1)[:, 0])
+    assert np.median(intervals) == pytest.approx(1e7, rel=0.2)
+
+# flake8: noqa
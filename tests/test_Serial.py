@@ -1,4 +1,11 @@
-from raspibot.Serial import AttinyProtocol, InvalidResponseException, InvalidLengthException
+from raspibot.Serial import AttinyProtocol, InvalidResponseException, InvalidLengthException, EncoderValues
+from raspibot.Serial import AsyncAttinyProtocol, open_serial_connection
+from raspibot.Serial import COMMANDS, ENCODERS_BOTH_STRICT_COMMAND
+
+import asyncio
+import os
+import threading
+import time
 
 import pytest
 
@@ -78,6 +85,16 @@ def test_get_encoders():
     assert result.left == left
     assert result.right == right
     
+def test_get_encoders_strict():
+    serial = MockSerial(b'\x00\x01\x00')
+    attiny = AttinyProtocol(serial)
+
+    # leniently decoded by default, an error in strict mode
+    assert attiny.get_encoders() == (1, 0)
+    with pytest.raises(InvalidResponseException):
+        attiny.get_encoders(strict=True)
+    assert serial.received == ENCODERS_BOTH * 2
+
 def test_get_left_encoder():
     value = 43690
     encoder_bytes = value.to_bytes(2, 'big')
@@ -218,6 +235,18 @@ def test_alive_ack():
     assert serial.received == ALIVE
     assert result == True
     
+def test_precomputed_messages():
+    for command in COMMANDS.values():
+        if command.request.size == 0:
+            assert command.message == bytes((command.opcode,))
+        else:
+            assert command.message is None
+        if command.request.size == 1:
+            assert len(command.messages) == 256
+        else:
+            assert command.messages is None
+    assert ENCODERS_BOTH_STRICT_COMMAND.message == ENCODERS_BOTH
+
 def test_alive_nak():
     # send out an NAK byte
     serial = MockSerial(NAK)
@@ -869,5 +898,446 @@ def test_stop_buzzer_invalid():
     
     with pytest.raises(InvalidResponseException):
         attiny.stop_buzzer()
-    
+
+class CountingSerial(MockSerial):
+
+    def __init__(self, bytes):
+        super().__init__(bytes)
+        self.writes = 0
+        self.reads = 0
+
+    def write(self, bytes):
+        self.writes += 1
+        super().write(bytes)
+
+    def read(self, count):
+        self.reads += 1
+        return super().read(count)
+
+def test_batch_single_transaction():
+    left, right = -2, 300
+    encoder_bytes = left.to_bytes(2, 'big', signed=True) + right.to_bytes(2, 'big', signed=True)
+    serial = CountingSerial(encoder_bytes + ACK + NAK)
+    attiny = AttinyProtocol(serial)
+
+    with attiny.batch() as batch:
+        encoders = batch.get_encoders()
+        motors = batch.set_motors(MOTOR_MAX, MOTOR_MIN)
+        buzzer = batch.set_buzzer(440, 100, 7)
+
+    assert serial.writes == 1
+    assert serial.reads == 1
+    assert serial.received[:1] == ENCODERS_BOTH
+    assert serial.received[1:4] == SET_BOTH_MOTORS + BYTES_MOTOR_MAX + BYTES_MOTOR_MIN
+    assert serial.received[4:5] == SET_BUZZER
+    assert len(serial.received) == 10
+
+    assert encoders.result() == EncoderValues(left, right)
+    assert motors.result() == True
+    assert buzzer.result() == False
+
+def test_batch_invalid_response_is_per_command():
+    serial = MockSerial(ACK + INVALID_RESPONSE + ACK)
+    attiny = AttinyProtocol(serial)
+
+    with attiny.batch() as batch:
+        first = batch.alive()
+        second = batch.stop_motors()
+        third = batch.stop_buzzer()
+
+    assert first.result() == True
+    assert isinstance(second.exception(), InvalidResponseException)
+    with pytest.raises(InvalidResponseException):
+        second.result()
+    assert third.result() == True
+
+def test_batch_timeout():
+    serial = MockSerial(ACK)
+    attiny = AttinyProtocol(serial)
+
+    with attiny.batch() as batch:
+        first = batch.alive()
+        second = batch.alive()
+
+    assert first.result() == True
+    assert second.result() == False
+
+def test_batch_result_before_transmit():
+    serial = MockSerial(ACK)
+    attiny = AttinyProtocol(serial)
+
+    batch = attiny.batch()
+    pending = batch.alive()
+
+    assert not pending.done()
+    with pytest.raises(RuntimeError):
+        pending.result()
+
+    results = batch.transmit()
+
+    assert results == [pending]
+    assert pending.result() == True
+
+def test_batch_empty():
+    serial = CountingSerial(b'')
+    attiny = AttinyProtocol(serial)
+
+    with attiny.batch():
+        pass
+
+    assert serial.writes == 0
+    assert serial.reads == 0
+
+def test_batch_not_transmitted_on_error():
+    serial = MockSerial(ACK)
+    attiny = AttinyProtocol(serial)
+
+    with pytest.raises(ValueError):
+        with attiny.batch() as batch:
+            batch.alive()
+            raise ValueError()
+
+    assert serial.received == b''
+
+class MockStreamWriter:
+
+    def __init__(self, reader=None, responses=None):
+        self._reader = reader
+        self._responses = responses or {}
+        self.received = b''
+        self.closed = False
+
+    def write(self, bytes):
+        self.received += bytes
+        # answer like the firmware would, if a response is configured
+        if self._reader is not None and bytes in self._responses:
+            self._reader.feed_data(self._responses[bytes])
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+def test_async_alive():
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(ACK)
+        writer = MockStreamWriter()
+        async with AsyncAttinyProtocol(reader, writer) as attiny:
+            result = await attiny.alive()
+        assert writer.received == ALIVE
+        assert writer.closed
+        return result
+
+    assert asyncio.run(run()) == True
+
+def test_async_concurrent_commands():
+    left, right = 5, -6
+    encoder_bytes = left.to_bytes(2, 'big', signed=True) + right.to_bytes(2, 'big', signed=True)
+
+    async def run():
+        reader = asyncio.StreamReader()
+        writer = MockStreamWriter()
+        attiny = AsyncAttinyProtocol(reader, writer)
+
+        tasks = asyncio.gather(
+            attiny.get_encoders(),
+            attiny.set_motors(MOTOR_MAX, MOTOR_MIN),
+            attiny.echo(ECHO_TEST))
+        # let all commands get written before any response arrives
+        await asyncio.sleep(0)
+        reader.feed_data(encoder_bytes + NAK + ECHO_TEST)
+        results = await tasks
+
+        await attiny.close()
+        return writer.received, results
+
+    received, results = asyncio.run(run())
+
+    assert received == (ENCODERS_BOTH + SET_BOTH_MOTORS + BYTES_MOTOR_MAX
+                        + BYTES_MOTOR_MIN + ECHO + ECHO_TEST)
+    assert results == [EncoderValues(left, right), False, ECHO_TEST]
+
+def test_async_invalid_response():
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(INVALID_RESPONSE + ACK)
+        attiny = AsyncAttinyProtocol(reader, MockStreamWriter())
+        with pytest.raises(InvalidResponseException):
+            await attiny.stop_motors()
+        # the following response is still decoded correctly
+        result = await attiny.stop_buzzer()
+        await attiny.close()
+        return result
+
+    assert asyncio.run(run()) == True
+
+def test_async_timeout():
+    async def run():
+        reader = asyncio.StreamReader()
+        attiny = AsyncAttinyProtocol(reader, MockStreamWriter(), timeout=0.01)
+        result = await attiny.alive()
+        await attiny.close()
+        return result
+
+    assert asyncio.run(run()) == False
+
+def test_async_timeout_starts_at_the_head_of_the_queue():
+    encoder_bytes = (5).to_bytes(2, 'big') + (6).to_bytes(2, 'big')
+
+    async def run():
+        reader = asyncio.StreamReader()
+        writer = MockStreamWriter(reader, {ALIVE: ACK, ENCODERS_BOTH: encoder_bytes})
+        attiny = AsyncAttinyProtocol(reader, writer, timeout=0.05)
+        alive = asyncio.ensure_future(attiny.alive())
+        await asyncio.sleep(0)
+        # the response has arrived, but the event loop is stalled for longer
+        # than the timeout
+        time.sleep(0.1)
+        results = [await alive, await attiny.get_encoders(), await attiny.alive()]
+        await attiny.close()
+        return results
+
+    assert asyncio.run(run()) == [True, EncoderValues(5, 6), True]
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='requires a pty')
+def test_async_stalled_event_loop():
+    controller, device = os.openpty()
+
+    def firmware():
+        for _ in range(2):
+            assert os.read(controller, 1) == ALIVE
+            os.write(controller, ACK)
+
+    thread = threading.Thread(target=firmware)
+    thread.start()
+
+    async def run():
+        reader, writer = await open_serial_connection(os.ttyname(device))
+        async with AsyncAttinyProtocol(reader, writer, timeout=0.05) as attiny:
+            alive = asyncio.ensure_future(attiny.alive())
+            # let the receiver start waiting for the response, then stall the
+            # event loop while the response arrives
+            for _ in range(3):
+                await asyncio.sleep(0)
+            time.sleep(0.1)
+            return [await alive, await attiny.alive()]
+
+    try:
+        assert asyncio.run(run()) == [True, True]
+    finally:
+        thread.join()
+        os.close(device)
+        os.close(controller)
+
+def test_async_late_response_is_discarded():
+    encoder_bytes = (5).to_bytes(2, 'big') + (6).to_bytes(2, 'big')
+
+    async def run():
+        reader = asyncio.StreamReader()
+        # the ACK for ALIVE only arrives right before the echoed nonce
+        writer = MockStreamWriter(reader, {
+            ECHO + b'\x01': ACK + b'\x01',
+            ENCODERS_BOTH: encoder_bytes})
+        attiny = AsyncAttinyProtocol(reader, writer, timeout=0.05)
+        results = [await attiny.alive(), await attiny.get_encoders()]
+        await attiny.close()
+        return writer.received, results
+
+    received, results = asyncio.run(run())
+    assert received == ALIVE + ECHO + b'\x01' + ENCODERS_BOTH
+    assert results == [False, EncoderValues(5, 6)]
+
+def test_async_timeout_fails_the_commands_written_before():
+    async def run():
+        reader = asyncio.StreamReader()
+        attiny = AsyncAttinyProtocol(reader, MockStreamWriter(), timeout=0.05)
+        return await asyncio.gather(attiny.alive(), attiny.stop_motors())
+
+    assert asyncio.run(run()) == [False, False]
+
+def test_async_protocol_only_offers_supported_methods():
+    async def run():
+        return AsyncAttinyProtocol(asyncio.StreamReader(), MockStreamWriter())
+
+    attiny = asyncio.run(run())
+    assert hasattr(attiny, 'get_encoders')
+    # batching, retries and statistics only exist for blocking transactions
+    for name in ('batch', 'resynchronize', 'retry_budget', 'statistics'):
+        assert not hasattr(attiny, name)
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='requires a pty')
+def test_async_serial_connection():
+    controller, device = os.openpty()
+
+    def firmware():
+        # answer a single ALIVE request
+        assert os.read(controller, 1) == ALIVE
+        os.write(controller, ACK)
+
+    thread = threading.Thread(target=firmware)
+    thread.start()
+
+    async def run():
+        reader, writer = await open_serial_connection(os.ttyname(device))
+        async with AsyncAttinyProtocol(reader, writer) as attiny:
+            return await attiny.alive()
+
+    try:
+        assert asyncio.run(run()) == True
+    finally:
+        thread.join()
+        os.close(device)
+        os.close(controller)
+
+class FirmwareSerial:
+    """Answers like the firmware, with scripted failures."""
+
+    def __init__(self, failures=()):
+        # each failure replaces the response to one non-echo command: bytes
+        # are sent instead of the response, None drops the response
+        self._failures = list(failures)
+        self._input = b''
+        self.received = b''
+        self.timeout = 1.0
+
+    def write(self, data):
+        data = bytes(data)
+        self.received += data
+        if data[:1] == ECHO:
+            self._input += data[1:2]
+        elif self._failures:
+            failure = self._failures.pop(0)
+            if failure is not None:
+                self._input += failure
+        elif data[:1] == ENCODERS_BOTH:
+            self._input += b'\x00\x01\x00\x02'
+        else:
+            self._input += ACK
+
+    def read(self, count):
+        response, self._input = self._input[:count], self._input[count:]
+        return response
+
+class ResettableFirmwareSerial(FirmwareSerial):
+
+    def __init__(self, failures=()):
+        super().__init__(failures)
+        self.resets = 0
+
+    def reset_input_buffer(self):
+        self.resets += 1
+        self._input = b''
+
+def test_retry_disabled_by_default():
+    serial = FirmwareSerial([INVALID_RESPONSE])
+    attiny = AttinyProtocol(serial)
+
+    with pytest.raises(InvalidResponseException):
+        attiny.alive()
+
+    assert attiny.retries == 0
+    assert serial.received == ALIVE
+
+def test_retry_after_invalid_response():
+    serial = ResettableFirmwareSerial([INVALID_RESPONSE])
+    attiny = AttinyProtocol(serial, retry_budget=1.0)
+
+    assert attiny.set_motors(10, 10) == True
+
+    assert attiny.retries == 1
+    assert attiny.last_retries == 1
+    assert serial.resets == 1
+    # the command is repeated after an echo request
+    assert serial.received[:3] == serial.received[-3:]
+    assert serial.received[3:4] == ECHO
+
+def test_retry_after_timeout():
+    serial = FirmwareSerial([None, None])
+    attiny = AttinyProtocol(serial, retry_budget=1.0)
+
+    assert attiny.get_encoders() == (1, 2)
+
+    assert attiny.retries == 2
+    assert attiny.last_retries == 2
+
+    assert attiny.alive() == True
+    assert attiny.retries == 2
+    assert attiny.last_retries == 0
+    # the serial timeout is restored after recovering
+    assert serial.timeout == 1.0
+
+def test_retry_realigns_shifted_stream():
+    # a stray byte before the encoder values, on an interface that cannot
+    # discard its input
+    serial = FirmwareSerial([b'\x55\x00\x01\x00\x02'])
+    attiny = AttinyProtocol(serial, retry_budget=1.0)
+
+    # the shifted response is not detected as invalid, but the next
+    # command notices the leftover byte
+    attiny.get_encoders()
+    assert attiny.alive() == True
+    assert attiny.last_retries == 1
+    assert attiny.get_encoders() == (1, 2)
+
+def test_retry_budget_exhausted():
+    serial = FirmwareSerial([INVALID_RESPONSE] * 1000)
+    attiny = AttinyProtocol(serial, retry_budget=0.0)
+
+    with pytest.raises(InvalidResponseException):
+        attiny.stop_motors()
+
+    serial = FirmwareSerial([None] * 1000)
+    attiny = AttinyProtocol(serial, retry_budget=0.0)
+
+    assert attiny.stop_motors() == False
+
+class SlowSerial:
+    """Never answers, but waits for its timeout on every read."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.received = b''
+
+    def write(self, data):
+        self.received += bytes(data)
+
+    def read(self, count):
+        time.sleep(self.timeout)
+        return b''
+
+def test_retry_budget_bounds_the_first_read():
+    serial = SlowSerial(timeout=0.5)
+    attiny = AttinyProtocol(serial, retry_budget=0.05)
+
+    before = time.monotonic()
+    assert attiny.alive() == False
+    assert time.monotonic() - before < 0.2
+    assert serial.timeout == 0.5
+
+def test_nak_is_not_retried():
+    serial = FirmwareSerial([NAK])
+    attiny = AttinyProtocol(serial, retry_budget=1.0)
+
+    assert attiny.stop_motors() == False
+    assert attiny.retries == 0
+
+def test_resynchronize():
+    serial = FirmwareSerial()
+    attiny = AttinyProtocol(serial)
+
+    assert attiny.resynchronize() == True
+    assert serial.received[:1] == ECHO
+    assert serial.received[1:2] not in (ACK, NAK)
+
+def test_resynchronize_timeout():
+    serial = MockSerial(b'')
+    attiny = AttinyProtocol(serial)
+
+    assert attiny.resynchronize() == False
+
 # flake8: noqa
@@ -0,0 +1,136 @@
+from raspibot.Simulation import (
+    SimulatedADS1015, SimulatedGPIO, SimulatedSMBus, constant, recorded, sine)
+
+import errno
+import time
+
+import pytest
+
+
+@pytest.fixture
+def chip():
+    chip = SimulatedADS1015({0: constant(1.0), 1: constant(0.25)})
+    yield chip
+    chip.close()
+
+
+def wait_for_conversion(chip):
+    deadline = time.monotonic() + 1
+    while not chip.read_register(chip.CONFIG_REGISTER) & 0x8000 \
+            and time.monotonic() < deadline:
+        time.sleep(0.0005)
+
+
+def test_power_on_registers(chip):
+    assert chip.read_register(chip.CONFIG_REGISTER) == 0x8583
+    assert chip.read_register(chip.LO_THRESH_REGISTER) == 0x8000
+    assert chip.read_register(chip.HI_THRESH_REGISTER) == 0x7FFF
+
+def test_single_shot_conversion(chip):
+    # AIN0 against ground, 4.096 V, single-shot, 1600 SPS, start
+    chip.write_register(chip.CONFIG_REGISTER, 0xC383)
+    assert not chip.read_register(chip.CONFIG_REGISTER) & 0x8000
+
+    wait_for_conversion(chip)
+    assert chip.read_register(chip.CONVERSION_REGISTER) == 500 << 4
+    assert chip.conversions == 1
+
+def test_differential_conversion(chip):
+    # AIN0 against AIN1
+    chip.write_register(chip.CONFIG_REGISTER, 0x8383)
+    wait_for_conversion(chip)
+
+    assert chip.read_register(chip.CONVERSION_REGISTER) == 375 << 4
+
+def test_conversion_values_are_clipped(chip):
+    # AIN0 against ground, 0.256 V
+    chip.write_register(chip.CONFIG_REGISTER, 0xCB83)
+    wait_for_conversion(chip)
+
+    assert chip.read_register(chip.CONVERSION_REGISTER) == 2047 << 4
+
+def test_conversion_ready_pin(chip):
+    gpio = SimulatedGPIO()
+    gpio.setup(22, gpio.IN, pull_up_down=gpio.PUD_UP)
+    edges = []
+    gpio.add_event_detect(22, gpio.RISING, callback=edges.append)
+    gpio.connect(22, chip)
+    # the comparator is disabled at power-on, so the pin is pulled up
+    assert gpio.input(22) == 1
+
+    chip.write_register(chip.LO_THRESH_REGISTER, 0x0000)
+    chip.write_register(chip.HI_THRESH_REGISTER, 0x8000)
+    # active high, assert after one conversion
+    chip.write_register(chip.CONFIG_REGISTER, 0x4388)
+    assert gpio.input(22) == 0
+
+    chip.write_register(chip.CONFIG_REGISTER, 0xC388)
+    wait_for_conversion(chip)
+    assert gpio.input(22) == 1
+    assert edges == [22]
+
+def test_traditional_comparator(chip):
+    levels = []
+    chip.connect(levels.append)
+    chip.write_register(chip.LO_THRESH_REGISTER, 100 << 4)
+    chip.write_register(chip.HI_THRESH_REGISTER, 400 << 4)
+    # AIN0 continuously at 3300 SPS, active high, assert after two
+    chip.write_register(chip.CONFIG_REGISTER, 0x42C9)
+    time.sleep(0.02)
+    assert levels[-1] == 1
+
+    chip.waveforms[0] = constant(0.1)
+    time.sleep(0.02)
+    assert levels[-1] == 0
+
+def test_smbus_byte_order(chip):
+    bus = SimulatedSMBus({0x49: chip})
+
+    assert bus.read_word_data(0x49, chip.CONFIG_REGISTER) == 0x8385
+    bus.write_word_data(0x49, chip.HI_THRESH_REGISTER, 0x3412)
+    assert chip.read_register(chip.HI_THRESH_REGISTER) == 0x1234
+    assert bus.transactions == 2
+
+def test_smbus_missing_device():
+    bus = SimulatedSMBus()
+
+    with pytest.raises(OSError) as error:
+        bus.read_word_data(0x48, 0)
+    assert error.value.errno == errno.EREMOTEIO
+
+def test_i2c_rdwr(chip):
+    smbus2 = pytest.importorskip('smbus2')
+    bus = SimulatedSMBus({0x49: chip})
+
+    read = smbus2.i2c_msg.read(0x49, 2)
+    bus.i2c_rdwr(smbus2.i2c_msg.write(0x49, [chip.CONFIG_REGISTER]), read)
+    assert bytes(read) == b'\x85\x83'
+    bus.i2c_rdwr(smbus2.i2c_msg.write(0x49, [chip.HI_THRESH_REGISTER, 0x12, 0x34]))
+    assert chip.read_register(chip.HI_THRESH_REGISTER) == 0x1234
+    assert bus.transactions == 2
+
+def test_gpio_outputs():
+    gpio = SimulatedGPIO()
+    gpio.setup([5, 6], gpio.OUT, initial=gpio.LOW)
+    gpio.output([5, 6], [1, 0])
+
+    assert gpio.levels == {5: 1, 6: 0}
+    with pytest.raises(RuntimeError):
+        gpio.output(7, 1)
+
+def test_gpio_conflicting_edge_detection():
+    gpio = SimulatedGPIO()
+    gpio.add_event_detect(22, gpio.RISING)
+
+    with pytest.raises(RuntimeError):
+        gpio.add_event_detect(22, gpio.BOTH)
+
+def test_waveforms():
+    assert constant(1.5)(10) == 1.5
+    assert sine(1.0, 1.0, offset=2.0)(0.25) == pytest.approx(3.0)
+    replay = recorded([0, 1, 2], [0.0, 1.0, 0.0])
+    assert replay(0.5) == pytest.approx(0.5)
+    assert replay(2.5) == pytest.approx(0.5)
+    assert recorded([0, 1], [0.0, 1.0], loop=False)(5) == 1.0
+
+# flake8: noqa
@@ -0,0 +1,137 @@
+from raspibot.Serial import AttinyProtocol, InvalidResponseException
+from raspibot.Statistics import LatencyHistogram, ProtocolStatistics
+
+import pytest
+
+ACK = b'\x10'
+NAK = b'\x14'
+INVALID_RESPONSE = b'\x23'
+
+
+class ScriptedSerial:
+
+    def __init__(self, responses):
+        self._responses = list(responses)
+
+    def write(self, data):
+        pass
+
+    def read(self, count):
+        return self._responses.pop(0)
+
+
+def test_histogram_empty():
+    histogram = LatencyHistogram()
+
+    assert histogram.count == 0
+    assert histogram.percentile(50) is None
+    assert histogram.mean() is None
+    assert histogram.max is None
+
+def test_histogram_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for value in range(1, 11):
+        histogram.record(value)
+
+    assert histogram.count == 10
+    assert histogram.min == 1
+    assert histogram.max == 10
+    assert histogram.mean() == 5.5
+    assert histogram.percentile(50) == 5
+    assert histogram.percentile(100) == 10
+
+def test_histogram_relative_error():
+    histogram = LatencyHistogram()
+    for value in range(1000, 2000001, 1000):
+        histogram.record(value)
+
+    assert histogram.percentile(50) == pytest.approx(1000000, rel=1 / 16)
+    assert histogram.percentile(99) == pytest.approx(1980000, rel=1 / 16)
+    assert histogram.percentile(100) == 2000000
+
+def test_histogram_overflow():
+    histogram = LatencyHistogram(highest=1000)
+    histogram.record(10 ** 6)
+
+    assert histogram.count == 1
+    assert histogram.max == 10 ** 6
+    assert histogram.percentile(50) == 10 ** 6
+
+def test_histogram_reset():
+    histogram = LatencyHistogram()
+    histogram.record(5)
+    histogram.reset()
+
+    assert histogram.count == 0
+    assert histogram.percentile(99) is None
+
+def test_protocol_statistics():
+    statistics = ProtocolStatistics()
+    serial = ScriptedSerial([ACK, NAK, b'', INVALID_RESPONSE, b'\x00\x01\x00\x02'])
+    attiny = AttinyProtocol(serial, statistics=statistics)
+
+    attiny.alive()
+    attiny.alive()
+    attiny.alive()
+    with pytest.raises(InvalidResponseException):
+        attiny.alive()
+    attiny.get_encoders()
+
+    snapshot = statistics.snapshot()
+
+    assert set(snapshot) == {'alive', 'get_encoders'}
+    assert snapshot['alive']['count'] == 4
+    assert snapshot['alive']['timeouts'] == 1
+    assert snapshot['alive']['naks'] == 1
+    assert snapshot['alive']['invalid'] == 1
+    assert snapshot['get_encoders']['count'] == 1
+    assert snapshot['get_encoders']['p50'] <= snapshot['get_encoders']['max']
+
+    text = statistics.text()
+    assert text.splitlines()[0].split()[0] == 'command'
+    assert text.splitlines()[1].split()[:2] == ['alive', '4']
+
+def test_protocol_statistics_with_retries():
+    statistics = ProtocolStatistics()
+    # invalid response, then the echoed nonce and the repeated response
+    serial = ScriptedSerial([INVALID_RESPONSE, b'\x01', ACK])
+    attiny = AttinyProtocol(serial, retry_budget=1.0, statistics=statistics)
+
+    assert attiny.stop_motors() == True
+
+    snapshot = statistics.snapshot()['stop_motors']
+    assert snapshot['count'] == 1
+    assert snapshot['invalid'] == 1
+
+def test_protocol_statistics_of_batches():
+    statistics = ProtocolStatistics()
+    serial = ScriptedSerial([ACK + INVALID_RESPONSE + b'\x00\x01'])
+    attiny = AttinyProtocol(serial, statistics=statistics)
+
+    with attiny.batch() as batch:
+        batch.alive()
+        batch.stop_motors()
+        batch.get_encoders()
+
+    snapshot = statistics.snapshot()
+    assert set(snapshot) == {'alive', 'stop_motors', 'get_encoders'}
+    assert all(command['count'] == 1 for command in snapshot.values())
+    assert snapshot['stop_motors']['invalid'] == 1
+    assert snapshot['get_encoders']['timeouts'] == 1
+
+def test_statistics_disabled():
+    attiny = AttinyProtocol(ScriptedSerial([ACK]))
+
+    assert attiny.statistics is None
+    assert attiny.alive() == True
+
+def test_statistics_reset():
+    statistics = ProtocolStatistics()
+    attiny = AttinyProtocol(ScriptedSerial([ACK]), statistics=statistics)
+    attiny.alive()
+
+    statistics.reset()
+
+    assert statistics.snapshot() == {}
+
+# flake8: noqa